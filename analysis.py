@@ -0,0 +1,285 @@
+import os
+import re
+import math
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from llm_client import (API_CONFIGURED, GEMINI_INPUT_USD_PER_MTOK, GEMINI_OUTPUT_USD_PER_MTOK, RESPONSE_SCHEMA,
+                        build_payload, call_model, call_model_async, failed_analysis, stream_model)
+from prescreen import PRESCREEN_HINTS, fast_analysis, prescreen, prompt_hints
+
+# -----------------------
+# Config
+# -----------------------
+# Chunked (map-reduce) analysis
+ANALYSIS_MODE = os.environ.get("ANALYSIS_MODE", "auto")                       # auto | single | chunked | fast (rules only)
+ANALYSIS_CHUNK_TOKENS = int(os.environ.get("ANALYSIS_CHUNK_TOKENS", 12000))   # token budget per chunk
+ANALYSIS_CHUNK_OVERLAP_TOKENS = int(os.environ.get("ANALYSIS_CHUNK_OVERLAP_TOKENS", 200))
+ANALYSIS_MAX_IN_FLIGHT = int(os.environ.get("ANALYSIS_MAX_IN_FLIGHT", 4))     # concurrent model calls per document
+CHARS_PER_TOKEN = 4   # rough estimate for English legal text
+PROMPT_OVERHEAD_TOKENS = 150   # instructions, hints and schema, per call
+ANALYSIS_OUTPUT_TOKENS_ESTIMATE = int(os.environ.get("ANALYSIS_OUTPUT_TOKENS_ESTIMATE", 700))   # per call, for cost estimates
+
+# chunk answers also list the clauses they did find, so the reduce step can drop
+# "missing" items that another chunk actually contains
+CHUNK_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": dict(RESPONSE_SCHEMA["properties"], present_items={"type": "ARRAY", "items": {"type": "STRING"}})
+}
+
+# -----------------------
+# Single model call
+# -----------------------
+def _with_hints(prompt, hints):
+    return f"{prompt}\n\n{hints}" if hints else prompt
+
+def single_payload(text_content, hints=None):
+    user_prompt = _with_hints("Analyze this document for document type, missing clauses and risks. Return JSON with keys: document_type, analysis_summary, missing_items (array of {item, reason}), risks (array of strings).", hints)
+    return build_payload(f"{user_prompt}\n\nDocument:\n\n{text_content}")
+
+# -----------------------
+# Chunking on clause / section boundaries
+# -----------------------
+# a new segment starts at a blank line or at a line that looks like a heading:
+# "Section 4", "ARTICLE IV", "12.", "12.3 Term", "(a)", or an ALL-CAPS title
+_BOUNDARY_RE = re.compile(
+    r"\n\s*\n"
+    r"|\n(?=[ \t]*(?:(?:section|article|clause|schedule|exhibit|annex)\b"
+    r"|\d+(?:\.\d+)*[.)]\s|\d+(?:\.\d+)+\s"
+    r"|\([a-z0-9]{1,3}\)\s"
+    r"|(?-i:[A-Z][A-Z0-9 ,&'\-]{3,})$))",
+    re.IGNORECASE | re.MULTILINE
+)
+_SENTENCE_RE = re.compile(r"(?<=[.;:])\s+")
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _split_oversized(segment, max_chars):
+    # a single clause over budget: fall back to sentence, then hard character, splits
+    pieces, current = [], ""
+    for sentence in _SENTENCE_RE.split(segment):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_segments(text, max_chars=None):
+    # clause / paragraph segments in document order, none longer than max_chars
+    max_chars = max_chars or ANALYSIS_CHUNK_TOKENS * CHARS_PER_TOKEN
+    segments = []
+    for seg in _BOUNDARY_RE.split(text):
+        seg = seg.strip()
+        if not seg:
+            continue
+        segments.extend(_split_oversized(seg, max_chars) if len(seg) > max_chars else [seg])
+    return segments
+
+def split_into_chunks(text, chunk_tokens=None, overlap_tokens=None):
+    chunk_tokens = chunk_tokens or ANALYSIS_CHUNK_TOKENS
+    overlap_tokens = ANALYSIS_CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, max_chars // 2)
+
+    segments = split_segments(text, max_chars)
+
+    chunks, current, size = [], [], 0
+    for seg in segments:
+        if current and size + len(seg) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            # carry trailing whole segments into the next chunk as overlap context
+            carry, carried = [], 0
+            for prev in reversed(current):
+                if carried + len(prev) + 1 > overlap_chars:
+                    break
+                carry.insert(0, prev)
+                carried += len(prev) + 1
+            if carried + len(seg) + 1 > max_chars:
+                carry, carried = [], 0
+            current, size = carry, carried
+        current.append(seg)
+        size += len(seg) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+# -----------------------
+# Map: one model call per chunk
+# -----------------------
+def chunk_payload(chunk, index, total, hints=None):
+    user_prompt = _with_hints(
+        f"This is part {index + 1} of {total} of a longer document; other parts are analyzed separately. "
+        "Analyze this part for document type, missing clauses and risks. Only list an item as missing if it is "
+        "essential for this kind of document and absent from this part; list the clauses this part does contain "
+        "in present_items. Return JSON with keys: document_type, analysis_summary, missing_items (array of "
+        "{item, reason}), risks (array of strings), present_items (array of strings).",
+        hints
+    )
+    return build_payload(f"{user_prompt}\n\nDocument part:\n\n{chunk}", CHUNK_RESPONSE_SCHEMA)
+
+# -----------------------
+# Reduce: merge chunk answers with de-duplication
+# -----------------------
+_NORM_RE = re.compile(r"[^a-z0-9]+")
+
+def norm_key(s):
+    return _NORM_RE.sub(" ", str(s or "").lower()).strip()
+
+def merge_analyses(results):
+    # results: list of (analysis, ok) in chunk order
+    good = [a for a, ok in results if ok and isinstance(a, dict)]
+    failed = len(results) - len(good)
+    if not good:
+        return results[0][0] if results else failed_analysis("No analysis performed."), False
+
+    types = Counter(a.get("document_type") for a in good if a.get("document_type") and a.get("document_type") != "Unknown")
+    document_type = types.most_common(1)[0][0] if types else "Unknown"
+
+    # a clause the model saw in one chunk is not missing because another chunk lacks it
+    present = {norm_key(p) for a in good for p in (a.get("present_items") or [])}
+    missing_items, seen_missing = [], set()
+    for a in good:
+        for it in a.get("missing_items") or []:
+            if not isinstance(it, dict):
+                it = {"item": str(it), "reason": ""}
+            key = norm_key(it.get("item"))
+            if not key or key in seen_missing or key in present:
+                continue
+            seen_missing.add(key)
+            missing_items.append({"item": it.get("item", ""), "reason": it.get("reason", "")})
+
+    risks, seen_risks = [], set()
+    for a in good:
+        for r in a.get("risks") or []:
+            key = norm_key(r)
+            if key and key not in seen_risks:
+                seen_risks.add(key)
+                risks.append(r)
+
+    summaries, seen_summaries = [], set()
+    for a in good:
+        s = (a.get("analysis_summary") or "").strip()
+        if s and norm_key(s) not in seen_summaries:
+            seen_summaries.add(norm_key(s))
+            summaries.append(s)
+    summary = " ".join(summaries)
+    if failed:
+        summary = f"{summary} (Partial analysis: {failed} of {len(results)} sections could not be analyzed.)".strip()
+
+    merged = {"document_type": document_type, "analysis_summary": summary, "missing_items": missing_items, "risks": risks}
+    return merged, failed == 0
+
+# -----------------------
+# Plan: what a text needs (nothing, one call, or one call per chunk), whatever the transport
+# -----------------------
+def _chunked(mode, tokens):
+    return mode == "chunked" or (mode == "auto" and tokens > ANALYSIS_CHUNK_TOKENS)
+
+def plan_analysis(text_content, mode=None, chunk_tokens=None, overlap_tokens=None):
+    # {"result": (analysis, cacheable)} when no model call is needed, else {"mode": "single" |
+    # "chunked", "payloads": [...]}; CPU work only (rules scan, chunking)
+    if not text_content:
+        return {"result": (failed_analysis("No analysis performed."), False)}
+
+    mode = mode or ANALYSIS_MODE
+    if mode == "fast":
+        # rules only; never cached, so a later full analysis of the same text is not shadowed
+        return {"result": (fast_analysis(prescreen(text_content)), False)}
+
+    # If API_KEY is missing, skip LLM call and provide a helpful message
+    if not API_CONFIGURED:
+        return {"result": (failed_analysis("Skipping AI analysis because GOOGLE_API_KEY is not set in environment."), False)}
+
+    screen = prescreen(text_content) if PRESCREEN_HINTS else None
+    hints = prompt_hints(screen) if screen else None
+    if not _chunked(mode, estimate_tokens(text_content)):
+        return {"mode": "single", "payloads": [single_payload(text_content, hints)]}
+    chunks = split_into_chunks(text_content, chunk_tokens, overlap_tokens)
+    return {"mode": "chunked", "payloads": [chunk_payload(c, i, len(chunks), hints) for i, c in enumerate(chunks)]}
+
+def finish_plan(plan, results):
+    # results: (analysis, ok) per payload, in payload order
+    if plan["mode"] == "single":
+        return results[0]
+    return merge_analyses(results)
+
+def _chunk_pool(plan, max_in_flight=None):
+    workers = min(max(1, max_in_flight or ANALYSIS_MAX_IN_FLIGHT), len(plan["payloads"])) or 1
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk")
+
+# -----------------------
+# Entry points: the same plan over blocking calls, a stream, or awaited calls
+# -----------------------
+def analyze_text(text_content: str, mode=None, max_in_flight=None):
+    # returns (document_analysis, cacheable) — failures and placeholders are never cached
+    plan = plan_analysis(text_content, mode)
+    if "result" in plan:
+        return plan["result"]
+    if len(plan["payloads"]) == 1:
+        return finish_plan(plan, [call_model(plan["payloads"][0])])
+    with _chunk_pool(plan, max_in_flight) as pool:
+        return finish_plan(plan, list(pool.map(call_model, plan["payloads"])))
+
+def analyze_text_stream(text_content: str, mode=None, max_in_flight=None):
+    # analyze_text as a generator for /upload/stream: ("partial", analysis) while the model
+    # answers (the JSON so far for one call, a merge of the chunks answered so far otherwise),
+    # then ("final", (document_analysis, cacheable))
+    plan = plan_analysis(text_content, mode)
+    if "result" in plan:
+        yield "final", plan["result"]
+        return
+    if plan["mode"] == "single":
+        yield from stream_model(plan["payloads"][0])
+        return
+    payloads = plan["payloads"]
+    results = [None] * len(payloads)
+    with _chunk_pool(plan, max_in_flight) as pool:
+        futures = {pool.submit(call_model, payload): i for i, payload in enumerate(payloads)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            done = [r for r in results if r is not None]
+            if len(done) < len(payloads):
+                yield "partial", merge_analyses(done)[0]
+    yield "final", finish_plan(plan, results)
+
+async def analyze_text_async(text_content: str, mode=None, max_in_flight=None):
+    # ASGI mode; the rules scan and chunking are CPU work on the whole text: keep them off the event loop
+    plan = await asyncio.to_thread(plan_analysis, text_content, mode)
+    if "result" in plan:
+        return plan["result"]
+    in_flight = asyncio.Semaphore(max(1, max_in_flight or ANALYSIS_MAX_IN_FLIGHT))
+
+    async def one(payload):
+        async with in_flight:
+            return await call_model_async(payload)
+
+    return finish_plan(plan, list(await asyncio.gather(*(one(p) for p in plan["payloads"]))))
+
+# -----------------------
+# Cost estimate: what analyze_text would spend on a text of this length, without the text
+# -----------------------
+def estimate_plan(text_chars, mode=None):
+    mode = mode or ANALYSIS_MODE
+    tokens = text_chars // CHARS_PER_TOKEN + 1 if text_chars else 0
+    if not tokens or mode == "fast" or not API_CONFIGURED:
+        return {"mode": "fast" if mode == "fast" else mode, "model_calls": 0, "input_tokens": 0, "output_tokens": 0, "usd": 0.0}
+    if _chunked(mode, tokens):
+        overlap = min(ANALYSIS_CHUNK_OVERLAP_TOKENS, ANALYSIS_CHUNK_TOKENS // 2)
+        calls = max(1, math.ceil((tokens - overlap) / (ANALYSIS_CHUNK_TOKENS - overlap)))
+        input_tokens, mode = tokens + (calls - 1) * overlap, "chunked"
+    else:
+        calls, input_tokens, mode = 1, tokens, "single"
+    input_tokens += calls * PROMPT_OVERHEAD_TOKENS
+    output_tokens = calls * ANALYSIS_OUTPUT_TOKENS_ESTIMATE
+    usd = (input_tokens * GEMINI_INPUT_USD_PER_MTOK + output_tokens * GEMINI_OUTPUT_USD_PER_MTOK) / 1e6
+    return {"mode": mode, "model_calls": calls, "input_tokens": input_tokens, "output_tokens": output_tokens, "usd": round(usd, 6)}
@@ -1,54 +1,54 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
 import os
-import io
-import re
 import json
-import docx
-import pdfplumber
-import requests
-import mysql.connector
+import base64
+import logging
+import threading
+import time
 from datetime import datetime
 
+from analysis import ANALYSIS_MODE, analyze_text, analyze_text_stream, estimate_plan
+from batch import BatchError, collect_batch_files, run_batch
+from cache import AnalysisCache, digest_bytes, digest_text
+import content_store
+from db import DB_HOST, DB_NAME, DB_USER, connect_server, ensure_column, ensure_index, get_db_connection, pool as db_pool
+from extraction import estimate_text_chars, extract_text_from_bytes, extract_text_offloaded, iter_text_chunks, page_count_hint
+from extractors import EXTENSIONS, MIME_TYPES, detect_type
+from intake import MAX_CONTENT_LENGTH, UploadRejected, UploadRequest, accept_upload
+from jobs import JobQueue, QueueFull, JOB_RETRY_AFTER
+from llm_client import API_CONFIGURED, async_client as async_llm, client as llm, failed_analysis
+from logconfig import configure_logging
+import metrics
+from metrics import (ANALYSIS_SECONDS, DB_SECONDS, EXTRACT_SECONDS, EXTRACTED_CHARS, HTTP_SECONDS, UPLOAD_BYTES,
+                     page_bucket, record_timing, timed)
+from prescreen import prescreen
+from search import SearchError, get_backend as search_backend, parse_filters as parse_search_filters
+from similarity import SIMILARITY_MAX_PAGE_SIZE, SIMILARITY_PAGE_SIZE, SIMILARITY_REUSE_THRESHOLD, get_index as similarity_index
+from versioning import analyze_revision
+
 # -----------------------
 # Config
 # -----------------------
-app = Flask(__name__)
+configure_logging()
+log = logging.getLogger("app")
 
-# MySQL config - you can set these env vars or replace defaults below
-DB_HOST = os.environ.get("DB_HOST", "localhost")
-DB_USER = os.environ.get("DB_USER", "root")
-DB_PASS = os.environ.get("DB_PASS", "tiger")   # change!
-DB_NAME = os.environ.get("DB_NAME", "lexify_db")
-DB_PORT = int(os.environ.get("DB_PORT", 3306))
-
-# Upload folder (we keep files in memory; this is just for potential saves)
-UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+app = Flask(__name__)
+# upload parts are spooled, hashed and checked against the size/type/page limits while the
+# body is still arriving (intake.py); the whole request is capped at MAX_CONTENT_LENGTH
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
 
-# Gemini API (Google AI Studio)
-API_KEY = os.environ.get("GOOGLE_API_KEY", "")
-API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={API_KEY}"
+# /upload/stream appends extracted text to the DB row once this many characters are buffered
+STREAM_DB_FLUSH_CHARS = int(os.environ.get("STREAM_DB_FLUSH_CHARS", 256 * 1024))
 
 # -----------------------
 # Helper: DB connection + ensure table
 # -----------------------
-def get_db_connection():
-    return mysql.connector.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASS,
-        database=DB_NAME,
-        port=DB_PORT,
-        charset='utf8mb4'
-    )
-
 def ensure_table_exists():
     conn = None
     try:
         # connect to server; try to create database if not exists
-        conn = mysql.connector.connect(
-            host=DB_HOST, user=DB_USER, password=DB_PASS, port=DB_PORT, charset='utf8mb4'
-        )
+        conn = connect_server()
         cur = conn.cursor()
         cur.execute(f"CREATE DATABASE IF NOT EXISTS `{DB_NAME}` DEFAULT CHARACTER SET 'utf8mb4'")
         conn.commit()
@@ -66,19 +66,116 @@ def ensure_table_exists():
                 missing_items JSON,
                 risks JSON,
                 content LONGTEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                content_hash CHAR(64),
+                content_size INT UNSIGNED,
+                file_hash CHAR(64),
+                text_hash CHAR(64),
+                analysis_ok TINYINT(1) NOT NULL DEFAULT 0,
+                parent_id INT NULL,
+                root_id INT NULL,
+                version INT NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_documents_file_hash (file_hash),
+                INDEX idx_documents_text_hash (text_hash),
+                INDEX idx_documents_created_id (created_at, id),
+                INDEX idx_documents_type_created_id (document_type, created_at, id),
+                INDEX idx_documents_filename (filename),
+                INDEX idx_documents_root_version (root_id, version)
             ) CHARACTER SET = utf8mb4;
         """)
+        # older tables predate the cache columns
+        ensure_column(cur, "documents", "file_hash", "CHAR(64)")
+        ensure_column(cur, "documents", "text_hash", "CHAR(64)")
+        ensure_column(cur, "documents", "analysis_ok", "TINYINT(1) NOT NULL DEFAULT 0")
+        # extracted text lives compressed in document_contents; content is only read for legacy rows
+        ensure_column(cur, "documents", "content_hash", "CHAR(64)")
+        ensure_column(cur, "documents", "content_size", "INT UNSIGNED")
+        content_store.ensure_schema(cur)
+        # version chain: root_id is the first upload, parent_id the revision this one was diffed against
+        ensure_column(cur, "documents", "parent_id", "INT NULL")
+        ensure_column(cur, "documents", "root_id", "INT NULL")
+        ensure_column(cur, "documents", "version", "INT NOT NULL DEFAULT 1")
+        ensure_index(cur, "documents", "idx_documents_file_hash", "(file_hash)")
+        ensure_index(cur, "documents", "idx_documents_text_hash", "(text_hash)")
+        # /history: newest-first keyset pages, optionally per document type or filename prefix
+        ensure_index(cur, "documents", "idx_documents_created_id", "(created_at, id)")
+        ensure_index(cur, "documents", "idx_documents_type_created_id", "(document_type, created_at, id)")
+        ensure_index(cur, "documents", "idx_documents_filename", "(filename)")
+        ensure_index(cur, "documents", "idx_documents_root_version", "(root_id, version)")
+        search_backend().ensure_schema(cur)
         conn.commit()
         cur.close()
     except Exception as e:
-        print("Error ensuring DB/table:", e)
+        log.error("could not ensure DB/table", extra={"error": str(e)})
     finally:
         if conn:
             conn.close()
 
 ensure_table_exists()
 
+# -----------------------
+# Analysis cache (in-process LRU in front of the documents table)
+# -----------------------
+def _row_to_analysis(row):
+    def _json(v):
+        if isinstance(v, (bytes, bytearray)):
+            v = v.decode("utf-8")
+        if isinstance(v, str):
+            try:
+                return json.loads(v)
+            except Exception:
+                return []
+        return v or []
+    return {
+        "document_type": row.get("document_type") or "Unknown",
+        "analysis_summary": row.get("analysis_summary") or "",
+        "missing_items": _json(row.get("missing_items")),
+        "risks": _json(row.get("risks")),
+    }
+
+def load_document_content(cur, row):
+    # new rows point into document_contents; rows written before it keep their text inline
+    if row.get("content_hash"):
+        text = content_store.get_content(cur, row["content_hash"])
+        if text is not None:
+            return text
+    return row.get("content") or ""
+
+def cached_row_sql(column, with_content):
+    fields = "document_type, analysis_summary, missing_items, risks" + (", content, content_hash" if with_content else "")
+    return f"SELECT {fields} FROM documents WHERE {column} = %s AND analysis_ok = 1 ORDER BY id DESC LIMIT 1"
+
+def _load_cached_row(column, digest, with_content):
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(dictionary=True)
+        with timed(DB_SECONDS, "db", op="cache_lookup"):
+            cur.execute(cached_row_sql(column, with_content), (digest,))
+            row = cur.fetchone()
+            if row and with_content:
+                row["content"] = load_document_content(cur, row)
+        cur.close()
+        return row
+    except Exception:
+        log.exception("cache lookup failed", extra={"column": column})
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def load_analysis_by_file_hash(file_hash):
+    row = _load_cached_row("file_hash", file_hash, with_content=True)
+    if not row:
+        return None
+    return row.get("content") or "", _row_to_analysis(row)
+
+def load_analysis_by_text_hash(text_hash):
+    row = _load_cached_row("text_hash", text_hash, with_content=False)
+    return _row_to_analysis(row) if row else None
+
+analysis_cache = AnalysisCache(load_by_file=load_analysis_by_file_hash, load_by_text=load_analysis_by_text_hash)
+
 # -----------------------
 # Frontend HTML (complete UI: upload, results, history, full report modal)
 # -----------------------
@@ -100,10 +197,10 @@ HTML_CONTENT = """
   <div class="max-w-5xl mx-auto">
     <div class="p-6 rounded-2xl shadow w-full max-w-2xl mx-auto" style="background-color: #F0EBD8;">
       <h1 class="text-2xl font-bold mb-2" "style=color: #0D1321;">Smart Document Scanner </h1>
-      <p class="text-sm mb-4" style="color: #0D1321;">Upload a DOCX or PDF to extract text and get an AI legal analysis. Results saved to your database.</p>
+      <p class="text-sm mb-4" style="color: #0D1321;">Upload a contract (PDF, DOCX, ODT, RTF, HTML or TXT) to extract text and get an AI legal analysis. Results saved to your database.</p>
 
       <form id="uploadForm" class="space-y-4">
-        <input id="document" name="document" type="file" accept=".pdf,.docx" class="block" required />
+        <input id="document" name="document" type="file" accept="{{ accept }}" class="block" required />
         <div class="flex justify-center space-x-2" >
           <button id="submitBtn" type="submit" class="px-4 py-2 text-white rounded " style = "background-color:#1D2D44;">Extract & Analyze</button>
           <button id="historyBtn" type="button" class="px-4 py-2  text-white rounded" style = "background-color:#1D2D44;">View History</button>
@@ -295,6 +392,14 @@ function showModal(data) {
     modalRisks.appendChild(li);
   });
   modalContent.textContent = data.content || '';
+  if (data.content === undefined && data.content_url) {
+    // the text is loaded on demand; metadata alone renders the modal
+    modalContent.textContent = 'Loading…';
+    fetch(data.content_url)
+      .then(r => r.ok ? r.text() : Promise.reject(r.status))
+      .then(text => { modalContent.textContent = text; })
+      .catch(() => { modalContent.textContent = 'Failed to load document text'; });
+  }
   modal.classList.remove('hidden');
   modal.style.display = 'flex';
 }
@@ -310,38 +415,493 @@ closeModal.addEventListener('click', () => {
 """
 
 # -----------------------
-# Utility: Extract text from file bytes
+# Upload pipeline: extract -> analyze -> save
 # -----------------------
-def extract_text_from_bytes(filename: str, file_bytes: bytes) -> str:
-    text_content = ""
-    lower = filename.lower()
-    bio = io.BytesIO(file_bytes)
+def resolve_analysis(file_hash, text_hash, text_content, stage=None, mode=None):
+    # same text from a different file (re-saved, re-exported): skip the model call
+    document_analysis = analysis_cache.get_by_text(text_hash) if text_content else None
+    if document_analysis is not None:
+        analysis_cache.put(file_hash, text_hash, text_content, document_analysis)
+        return document_analysis, True, "text"
+    if stage:
+        stage("analyzing")
+    similar = resolve_similar(text_hash, text_content, mode)
+    if similar is not None:
+        document_analysis, analysis_ok = similar
+        cache_hit = "similar"
+    else:
+        document_analysis, analysis_ok = analyze_text(text_content, mode)
+        cache_hit = None
+    if analysis_ok:
+        analysis_cache.put(file_hash, text_hash, text_content, document_analysis)
+    return document_analysis, analysis_ok, cache_hit
+
+def resolve_similar(text_hash, text_content, mode=None):
+    # a near-copy of an analyzed document (same template, a few words changed): adapt that
+    # analysis to the clause diff instead of analyzing from scratch; None when nothing is close
+    if not SIMILARITY_REUSE_THRESHOLD or not text_content or mode == "fast":
+        return None
+    index = similarity_index()
+    if index is None:
+        return None
     try:
-        if lower.endswith(".docx"):
-            doc = docx.Document(bio)
-            text_content = "\n".join([p.text for p in doc.paragraphs])
-        elif lower.endswith(".pdf"):
-            # pdfplumber accepts a file-like object
-            with pdfplumber.open(bio) as pdf:
-                pages = []
-                for page in pdf.pages:
-                    txt = page.extract_text()
-                    if txt:
-                        pages.append(txt)
-                text_content = "\n".join(pages)
+        matches = index.similar_to_text(text_content, key=text_hash, limit=1,
+                                        min_similarity=SIMILARITY_REUSE_THRESHOLD, analyzed_only=True)
+        source = load_parent(matches[0]["id"]) if matches else None
+    except Exception:
+        log.exception("similarity lookup failed")
+        return None
+    if not source or not source["analysis_ok"]:
+        return None
+    document_analysis, analysis_ok, revision = analyze_revision(_row_to_analysis(source), source["content"], text_content)
+    log.info("adapted the analysis of a similar document",
+             extra={"source_id": source["id"], "similarity": matches[0]["similarity"], "revision_mode": revision["mode"]})
+    return document_analysis, analysis_ok
+
+def resolve_analysis_stream(file_hash, text_hash, text_content, mode=None):
+    # resolve_analysis for /upload/stream: yields ("partial", analysis) while the model is still
+    # answering, then ("final", (document_analysis, analysis_ok, cache_hit))
+    document_analysis = analysis_cache.get_by_text(text_hash) if text_content else None
+    if document_analysis is not None:
+        analysis_cache.put(file_hash, text_hash, text_content, document_analysis)
+        yield "final", (document_analysis, True, "text")
+        return
+    similar = resolve_similar(text_hash, text_content, mode)
+    if similar is not None:
+        if similar[1]:
+            analysis_cache.put(file_hash, text_hash, text_content, similar[0])
+        yield "final", (similar[0], similar[1], "similar")
+        return
+    for kind, value in analyze_text_stream(text_content, mode):
+        if kind == "partial":
+            yield kind, value
+            continue
+        document_analysis, analysis_ok = value
+        if analysis_ok:
+            analysis_cache.put(file_hash, text_hash, text_content, document_analysis)
+        yield "final", (document_analysis, analysis_ok, None)
+
+DOCUMENT_INSERT_SQL = """INSERT INTO documents (filename, document_type, analysis_summary, missing_items, risks, content_hash, content_size, file_hash, text_hash, analysis_ok, parent_id, root_id, version)
+                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+
+METRIC_FILE_TYPES = tuple(MIME_TYPES)
+
+def _file_type(filename, file_bytes):
+    # bounded label values from the sniffed format: anything unreadable is "other"
+    return detect_type(file_bytes, filename) or "other"
+
+def observe_extraction(filename, file_bytes, text_content, seconds):
+    file_type = _file_type(filename, file_bytes)
+    pages = page_count_hint(filename, file_bytes, kind=file_type)
+    EXTRACT_SECONDS.observe(seconds, file_type=file_type, pages=page_bucket(pages))
+    EXTRACTED_CHARS.observe(len(text_content or ""), file_type=file_type)
+    record_timing("extract", seconds)
+
+def observe_analysis(seconds, mode, cache_hit):
+    ANALYSIS_SECONDS.observe(seconds, mode=mode or ANALYSIS_MODE, cache=cache_hit or "miss")
+    record_timing("analyze", seconds)
+
+def run_pipeline(filename, file_bytes, stage=None, extract=extract_text_from_bytes, mode=None):
+    # extract + analyze without touching the documents table; returns a record for save_document(s)
+    stage = stage or (lambda status: None)
+    started = time.perf_counter()
+    timings = {}
+
+    UPLOAD_BYTES.observe(len(file_bytes), file_type=_file_type(filename, file_bytes))
+    # byte-identical re-upload: skip extraction and the model call entirely
+    file_hash = digest_bytes(file_bytes)
+    cached = analysis_cache.get_by_file(file_hash)
+    if cached is not None:
+        text_content, document_analysis = cached
+        text_hash = digest_text(text_content)
+        analysis_ok, cache_hit = True, "file"
+    else:
+        stage("extracting")
+        t = time.perf_counter()
+        text_content = extract(filename, file_bytes)
+        elapsed = time.perf_counter() - t
+        timings["extract_ms"] = round(elapsed * 1000, 1)
+        observe_extraction(filename, file_bytes, text_content, elapsed)
+
+        text_hash = digest_text(text_content)
+        t = time.perf_counter()
+        document_analysis, analysis_ok, cache_hit = resolve_analysis(file_hash, text_hash, text_content, stage, mode)
+        elapsed = time.perf_counter() - t
+        timings["analyze_ms"] = round(elapsed * 1000, 1)
+        observe_analysis(elapsed, mode, cache_hit)
+
+    timings["pipeline_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return {
+        "filename": filename,
+        "text_content": text_content,
+        "analysis": document_analysis,
+        "analysis_ok": analysis_ok,
+        "file_hash": file_hash,
+        "text_hash": text_hash,
+        "cache": cache_hit,
+        "timings": timings,
+    }
+
+def _document_row(rec, content_hash):
+    document_analysis = rec["analysis"]
+    return (
+        rec["filename"],
+        document_analysis.get("document_type", "Unknown"),
+        document_analysis.get("analysis_summary", ""),
+        json.dumps(document_analysis.get("missing_items", [])),
+        json.dumps(document_analysis.get("risks", [])),
+        content_hash,
+        len((rec["text_content"] or "").encode("utf-8")),
+        rec["file_hash"],
+        rec["text_hash"],
+        1 if rec["analysis_ok"] else 0,
+        rec.get("parent_id"),
+        rec.get("root_id"),
+        rec.get("version", 1)
+    )
+
+def index_for_search(recs, ids):
+    try:
+        search_backend().index([
+            {"id": doc_id, "filename": r["filename"], "document_type": r["analysis"].get("document_type"),
+             "analysis_summary": r["analysis"].get("analysis_summary"), "content": r["text_content"]}
+            for r, doc_id in zip(recs, ids)
+        ])
+    except Exception:
+        log.exception("search index failed", extra={"ids": [i for i in ids if i]})
+    index = similarity_index()
+    if index is None:
+        return
+    try:
+        index.add([
+            {"id": doc_id, "filename": r["filename"], "document_type": r["analysis"].get("document_type"),
+             "analysis_ok": r.get("analysis_ok"), "content": r["text_content"], "text_hash": r.get("text_hash")}
+            for r, doc_id in zip(recs, ids) if doc_id
+        ])
+    except Exception:
+        log.exception("similarity index failed", extra={"ids": [i for i in ids if i]})
+
+def save_document(rec):
+    # Save to DB (attempt, but do not fail the API response if DB error occurs)
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        with timed(DB_SECONDS, "db", op="insert"):
+            content_hash = content_store.put_content(cur, rec["text_content"])
+            cur.execute(DOCUMENT_INSERT_SQL, _document_row(rec, content_hash))
+            conn.commit()
+        doc_id = cur.lastrowid
+        cur.close()
+        conn.close()
+    except Exception:
+        log.exception("DB save failed", extra={"upload": rec["filename"]})
+        doc_id = None
+    index_for_search([rec], [doc_id])
+    return doc_id
+
+def save_documents(recs):
+    # one multi-row INSERT in one transaction; returns ids in order (all None on failure)
+    if not recs:
+        return []
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        with timed(DB_SECONDS, "db", op="insert_batch"):
+            hashes = content_store.put_contents(cur, [r["text_content"] for r in recs])
+            cur.executemany(DOCUMENT_INSERT_SQL, [_document_row(r, h) for r, h in zip(recs, hashes)])
+            conn.commit()
+        # mysql-connector sends executemany() of an INSERT ... VALUES as one multi-row INSERT: it
+        # reports its first id, and InnoDB gives a single statement a consecutive block of ids in
+        # every innodb_autoinc_lock_mode, so concurrent inserts cannot land inside it
+        first_id = cur.lastrowid
+        cur.close()
+        ids = [first_id + i for i in range(len(recs))] if first_id else [None] * len(recs)
+    except Exception:
+        log.exception("DB batch save failed", extra={"count": len(recs)})
+        try:
+            if conn:
+                conn.rollback()
+        except Exception:
+            pass
+        ids = [None] * len(recs)
+    finally:
+        if conn:
+            conn.close()
+    index_for_search(recs, ids)
+    return ids
+
+def document_response(rec, doc_id):
+    text_content = rec["text_content"]
+    return {
+        "id": doc_id,
+        "filename": rec["filename"],
+        "content": text_content if text_content else "No text could be extracted.",
+        "analysis": rec["analysis"],
+        "cache": rec["cache"]
+    }
+
+def process_document(filename, file_bytes, on_stage=None, extract=extract_text_from_bytes, mode=None):
+    # on_stage(status) is called as the pipeline advances (used by the async job queue)
+    rec = run_pipeline(filename, file_bytes, on_stage, extract, mode)
+    if on_stage:
+        on_stage("saving")
+    return document_response(rec, save_document(rec))
+
+# -----------------------
+# Versions: re-analyze only what changed since the parent revision
+# -----------------------
+def load_parent(doc_id):
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(
+            "SELECT id, filename, root_id, version, document_type, analysis_summary, missing_items, risks, analysis_ok, content, content_hash FROM documents WHERE id = %s",
+            (doc_id,)
+        )
+        row = cur.fetchone()
+        if row:
+            row["content"] = load_document_content(cur, row)
+        cur.close()
+        return row
+    finally:
+        conn.close()
+
+def run_version_pipeline(parent, filename, file_bytes, extract=extract_text_from_bytes):
+    started = time.perf_counter()
+    timings = {}
+    file_hash = digest_bytes(file_bytes)
+    cached = analysis_cache.get_by_file(file_hash)
+    revision = None
+    if cached is not None:
+        text_content, document_analysis = cached
+        text_hash = digest_text(text_content)
+        analysis_ok, cache_hit = True, "file"
+    else:
+        t = time.perf_counter()
+        text_content = extract(filename, file_bytes)
+        elapsed = time.perf_counter() - t
+        timings["extract_ms"] = round(elapsed * 1000, 1)
+        observe_extraction(filename, file_bytes, text_content, elapsed)
+        text_hash = digest_text(text_content)
+        document_analysis = analysis_cache.get_by_text(text_hash) if text_content else None
+        analysis_ok, cache_hit = document_analysis is not None, "text" if document_analysis is not None else None
+
+        t = time.perf_counter()
+        if document_analysis is None and parent["analysis_ok"]:
+            document_analysis, analysis_ok, revision = analyze_revision(_row_to_analysis(parent), parent["content"], text_content)
+        elif document_analysis is None:
+            # nothing trustworthy to build on
+            document_analysis, analysis_ok = analyze_text(text_content)
+            revision = {"mode": "full"}
+        elapsed = time.perf_counter() - t
+        timings["analyze_ms"] = round(elapsed * 1000, 1)
+        observe_analysis(elapsed, "revision", cache_hit)
+        if analysis_ok and cache_hit is None:
+            analysis_cache.put(file_hash, text_hash, text_content, document_analysis)
+
+    timings["pipeline_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return {
+        "filename": filename,
+        "text_content": text_content,
+        "analysis": document_analysis,
+        "analysis_ok": analysis_ok,
+        "file_hash": file_hash,
+        "text_hash": text_hash,
+        "cache": cache_hit,
+        "timings": timings,
+        "revision": revision,
+        "parent_id": parent["id"],
+        "root_id": parent["root_id"] or parent["id"],
+        "version": (parent["version"] or 1) + 1,
+    }
+
+# -----------------------
+# Streaming pipeline: spooled upload -> page/paragraph chunks -> NDJSON + incremental DB writes
+# -----------------------
+class StreamingRowWriter:
+    # inserts the documents row up front, then appends content in batches
+    def __init__(self, filename, file_hash):
+        self.doc_id = None
+        self.conn = None
+        self._buf = []
+        self._buffered = 0
+        self._chunks = 0
+        try:
+            self.conn = get_db_connection()
+            cur = self.conn.cursor()
+            with timed(DB_SECONDS, "db", op="stream_insert"):
+                cur.execute(
+                    "INSERT INTO documents (filename, document_type, analysis_summary, missing_items, risks, content, file_hash) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                    (filename, "Unknown", "Analysis in progress.", "[]", "[]", "", file_hash)
+                )
+                self.conn.commit()
+            self.doc_id = cur.lastrowid
+            cur.close()
+        except Exception:
+            log.exception("DB save failed", extra={"upload": filename})
+            self.close()
+
+    def append(self, text):
+        if self.doc_id is None:
+            return
+        # chunks are joined with newlines, same as the non-streaming extractor
+        self._buf.append("\n" + text if self._chunks else text)
+        self._chunks += 1
+        self._buffered += len(text)
+        if self._buffered >= STREAM_DB_FLUSH_CHARS:
+            self.flush()
+
+    def flush(self):
+        if self.doc_id is None or not self._buf:
+            return
+        try:
+            cur = self.conn.cursor()
+            with timed(DB_SECONDS, "db", op="stream_append"):
+                cur.execute("UPDATE documents SET content = CONCAT(content, %s) WHERE id = %s", ("".join(self._buf), self.doc_id))
+                self.conn.commit()
+            cur.close()
+        except Exception:
+            log.exception("DB save failed", extra={"doc_id": self.doc_id})
+            self.doc_id = None
+            self.close()
+        self._buf, self._buffered = [], 0
+
+    def finish(self, text_content, document_analysis, text_hash, analysis_ok):
+        self.flush()
+        if self.doc_id is None:
+            return None
+        try:
+            cur = self.conn.cursor()
+            started = time.perf_counter()
+            # the inline content column was only staging; the text moves to the compressed store
+            content_hash = content_store.put_content(cur, text_content)
+            cur.execute(
+                "UPDATE documents SET document_type = %s, analysis_summary = %s, missing_items = %s, risks = %s, text_hash = %s, analysis_ok = %s, content_hash = %s, content_size = %s, content = NULL WHERE id = %s",
+                (
+                    document_analysis.get("document_type", "Unknown"),
+                    document_analysis.get("analysis_summary", ""),
+                    json.dumps(document_analysis.get("missing_items", [])),
+                    json.dumps(document_analysis.get("risks", [])),
+                    text_hash,
+                    1 if analysis_ok else 0,
+                    content_hash,
+                    len(text_content.encode("utf-8")),
+                    self.doc_id
+                )
+            )
+            self.conn.commit()
+            DB_SECONDS.observe(time.perf_counter() - started, op="stream_finish")
+            cur.close()
+        except Exception:
+            log.exception("DB save failed", extra={"doc_id": self.doc_id})
+            self.doc_id = None
+        return self.doc_id
+
+    def close(self):
+        if self.conn:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+def _ndjson(obj):
+    return json.dumps(obj) + "\n"
+
+def stream_document(filename, spool, file_hash):
+    writer = StreamingRowWriter(filename, file_hash)
+    try:
+        yield _ndjson({"event": "start", "filename": filename, "id": writer.doc_id})
+
+        cached = analysis_cache.get_by_file(file_hash)
+        chunks = [cached[0]] if cached is not None else iter_text_chunks(filename, spool)
+        # the model needs the whole text, so the chunks are kept; the upload bytes and
+        # pdfplumber page objects are not
+        texts = []
+        extraction_failed = False
+        try:
+            for index, text in enumerate(chunks):
+                texts.append(text)
+                writer.append(text)
+                yield _ndjson({"event": "chunk", "index": index, "text": text})
+        except Exception as e:
+            log.exception("streaming extraction failed", extra={"upload": filename})
+            yield _ndjson({"event": "error", "error": f"Extraction failed: {str(e)}"})
+            extraction_failed = True
+        spool.close()
+
+        text_content = "\n".join(texts)
+        text_hash = digest_text(text_content)
+        if cached is not None:
+            document_analysis, analysis_ok, cache_hit = cached[1], True, "file"
+        elif extraction_failed:
+            # the text is truncated: neither analyzed nor cached under the upload's hash, and
+            # the row is kept with analysis_ok = 0 so no cache lookup ever serves it
+            document_analysis, analysis_ok, cache_hit = failed_analysis("No analysis performed: text extraction did not complete."), False, None
         else:
-            text_content = ""
-    except Exception as e:
-        print("Extraction error:", e)
-        text_content = ""
-    return text_content
+            for kind, value in resolve_analysis_stream(file_hash, text_hash, text_content):
+                if kind == "partial":
+                    yield _ndjson({"event": "analysis_partial", "analysis": value})
+                else:
+                    document_analysis, analysis_ok, cache_hit = value
+        yield _ndjson({"event": "analysis", "analysis": document_analysis, "cache": cache_hit})
+
+        doc_id = writer.finish(text_content, document_analysis, text_hash, analysis_ok)
+        index_for_search([{"filename": filename, "analysis": document_analysis, "text_content": text_content,
+                           "analysis_ok": analysis_ok, "text_hash": text_hash}], [doc_id])
+        yield _ndjson({"event": "saved", "id": doc_id})
+    finally:
+        spool.close()
+        writer.close()
+
+# -----------------------
+# Async job queue (created lazily so importing the app never spawns workers)
+# -----------------------
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(process_document)
+        return _job_queue
+
+# -----------------------
+# Request instrumentation: latency histogram + Server-Timing breakdown
+# -----------------------
+@app.before_request
+def _start_request_timer():
+    metrics.begin_request()
+    request.environ["lexify.started"] = time.perf_counter()
+
+@app.after_request
+def _finish_request_timer(response):
+    timings = metrics.end_request()
+    started = request.environ.get("lexify.started")
+    if started is not None:
+        total = time.perf_counter() - started
+        timings["total"] = total
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_SECONDS.observe(total, method=request.method, route=route, status=response.status_code)
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+# -----------------------
+# Upload limits hit while the body is being parsed (intake.UploadSpool)
+# -----------------------
+@app.errorhandler(413)
+@app.errorhandler(415)
+def upload_limit_error(e):
+    return jsonify({"error": e.description}), e.code
 
 # -----------------------
 # Routes
 # -----------------------
 @app.route('/')
 def home():
-    return render_template_string(HTML_CONTENT)
+    return render_template_string(HTML_CONTENT, accept=",".join(EXTENSIONS))
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -353,190 +913,456 @@ def upload_file():
         return jsonify({"error": "No selected file"}), 400
 
     try:
-        file_bytes = file.read()
-        text_content = extract_text_from_bytes(file.filename, file_bytes)
+        file_bytes = accept_upload(file).read_bytes()
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": f"Failed to read file: {str(e)}"}), 500
 
-    # default analysis if no text
-    document_analysis = {"document_type": "Unknown", "analysis_summary": "No analysis performed.", "missing_items": [], "risks": []}
+    # mode=fast: rule-based pre-screen only, no model call (so nothing worth queueing)
+    mode = request.args.get('mode') or None
+    if mode not in (None, 'fast', 'single', 'chunked', 'auto'):
+        return jsonify({"error": "mode must be one of auto, single, chunked, fast"}), 400
 
-    if text_content:
-        # Prepare prompt & payload for Gemini
-        system_instruction = """You are a legal-tech assistant.
-Step 1: Identify the type of document (contract, NDA, employment letter, lease, terms of service, etc.).
-Step 2: List potentially missing clauses or essential legal elements.
-Step 3: Highlight risks or red flags if present.
-Step 4: Return only valid JSON that matches the described schema.
-"""
+    if mode != 'fast' and request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        try:
+            job_id = get_job_queue().submit(file.filename, file_bytes, mode)
+        except QueueFull as e:
+            resp = jsonify({"error": str(e)})
+            resp.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+            return resp, 429
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
 
-        user_prompt = f"Analyze this document for document type, missing clauses and risks. Return JSON with keys: document_type, analysis_summary, missing_items (array of {{item, reason}}), risks (array of strings).\n\nDocument:\n\n{text_content}"
-
-        payload = {
-            "contents": [{"parts": [{"text": user_prompt}]}],
-            "systemInstruction": {"parts": [{"text": system_instruction}]},
-            "generationConfig": {
-                "responseMimeType": "application/json",
-                "responseSchema": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "document_type": {"type": "STRING"},
-                        "analysis_summary": {"type": "STRING"},
-                        "missing_items": {
-                            "type": "ARRAY",
-                            "items": {
-                                "type": "OBJECT",
-                                "properties": {
-                                    "item": {"type": "STRING"},
-                                    "reason": {"type": "STRING"}
-                                }
-                            }
-                        },
-                        "risks": {
-                            "type": "ARRAY",
-                            "items": {"type": "STRING"}
-                        }
-                    }
-                }
-            }
-        }
-
-        # If API_KEY is missing, skip LLM call and provide a helpful message
-        if not API_KEY:
-            document_analysis = {
-                "document_type": "Unknown",
-                "analysis_summary": "Skipping AI analysis because GOOGLE_API_KEY is not set in environment.",
-                "missing_items": [],
-                "risks": []
-            }
-        else:
-            try:
-                resp = requests.post(API_URL, headers={"Content-Type": "application/json"}, data=json.dumps(payload), timeout=30)
-                resp.raise_for_status()
-                resp_json = resp.json()
-
-                # Attempt to extract JSON content robustly
-                document_analysis = None
-                if resp_json and 'candidates' in resp_json and len(resp_json['candidates'])>0:
-                    # The model output is often in candidates[0].content.parts[0].text
-                    candidate = resp_json['candidates'][0]
-                    content = candidate.get('content', {})
-                    parts = content.get('parts', []) if isinstance(content, dict) else []
-                    if parts and isinstance(parts, list) and len(parts)>0:
-                        text_out = parts[0].get('text', '')
-                        # find JSON object inside text_out
-                        match = re.search(r'\{.*\}', text_out, re.DOTALL)
-                        if match:
-                            try:
-                                document_analysis = json.loads(match.group(0))
-                            except Exception:
-                                # fallback: try to evaluate safely by trimming trailing/leading characters
-                                # but avoid eval — keep fallback as string message
-                                document_analysis = {"document_type": "Unknown", "analysis_summary": "Analysis failed: Could not parse JSON cleanly from model output.", "missing_items": [], "risks": []}
-                        else:
-                            # maybe it's already the direct JSON (unlikely) or plain text
-                            try:
-                                document_analysis = json.loads(text_out)
-                            except Exception:
-                                document_analysis = {"document_type": "Unknown", "analysis_summary": "Analysis failed: Model returned non-JSON output.", "missing_items": [], "risks": []}
-                    else:
-                        document_analysis = {"document_type": "Unknown", "analysis_summary": "Analysis failed: No content in model response.", "missing_items": [], "risks": []}
-                else:
-                    document_analysis = {"document_type": "Unknown", "analysis_summary": "Analysis failed: Unexpected response format from LLM.", "missing_items": [], "risks": []}
+    return jsonify(process_document(file.filename, file_bytes, mode=mode))
 
-            except requests.exceptions.RequestException as e:
-                document_analysis = {"document_type": "Unknown", "analysis_summary": f"Analysis failed: API error: {str(e)}", "missing_items": [], "risks": []}
+@app.route('/prescreen', methods=['POST'])
+def prescreen_upload():
+    # clause pre-screen only: found clauses with character offsets and missing-clause candidates; nothing is saved
+    if 'document' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+    file = request.files['document']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    try:
+        text_content = extract_text_from_bytes(file.filename, accept_upload(file).read_bytes())
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": f"Failed to read file: {str(e)}"}), 500
+    t = time.perf_counter()
+    screen = prescreen(text_content)
+    screen["scan_ms"] = round((time.perf_counter() - t) * 1000, 3)
+    screen["filename"] = file.filename
+    return jsonify(screen)
+
+@app.route('/upload/stream', methods=['POST'])
+def upload_stream():
+    if 'document' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = request.files['document']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
 
-    # Save to DB (attempt, but do not fail the API response if DB error occurs)
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        sql = """INSERT INTO documents (filename, document_type, analysis_summary, missing_items, risks, content)
-                 VALUES (%s, %s, %s, %s, %s, %s)"""
-        vals = (
-            file.filename,
-            document_analysis.get("document_type", "Unknown"),
-            document_analysis.get("analysis_summary", ""),
-            json.dumps(document_analysis.get("missing_items", [])),
-            json.dumps(document_analysis.get("risks", [])),
-            text_content
-        )
-        cur.execute(sql, vals)
-        conn.commit()
-        doc_id = cur.lastrowid
-        cur.close()
-        conn.close()
+        upload = accept_upload(file)
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
-        print("DB save error:", e)
-        doc_id = None
+        return jsonify({"error": f"Failed to read file: {str(e)}"}), 500
+
+    resp = Response(stream_with_context(stream_document(file.filename, upload.stream.detach(), upload.sha256)),
+                    mimetype="application/x-ndjson")
+    resp.headers['X-Accel-Buffering'] = 'no'   # let nginx pass chunks straight through
+    return resp
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    uploads = [f for key in ('documents', 'document') for f in request.files.getlist(key) if f.filename]
+    if not uploads:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    started = time.perf_counter()
+    # files over their type's limits (or of no supported type) are skipped, not fatal
+    accepted, rejected = [], []
+    for f in uploads:
+        try:
+            accepted.append((f.filename, accept_upload(f, archives=True).read_bytes()))
+        except UploadRejected as e:
+            rejected.append({"filename": f.filename, "status": "skipped", "error": str(e)})
+    try:
+        items, skipped = collect_batch_files(accepted)
+        skipped = rejected + skipped
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        return jsonify({"error": f"Failed to read files: {str(e)}"}), 500
+    if not items:
+        return jsonify({"error": "No supported documents in upload", "results": skipped}), 400
+
+    mode = request.args.get('mode') or None   # read here: run_one runs on worker threads outside the request
+    results, save_ms = run_batch(
+        items,
+        run_one=lambda filename, data: run_pipeline(filename, data, extract=extract_text_offloaded, mode=mode),
+        save_many=save_documents
+    )
+    for r in results:
+        rec = r.pop("rec", None)
+        if rec is not None:
+            r.update(analysis=rec["analysis"], cache=rec["cache"], content_chars=len(rec["text_content"] or ""))
 
     return jsonify({
-        "id": doc_id,
-        "filename": file.filename,
-        "content": text_content if text_content else "No text could be extracted.",
-        "analysis": document_analysis
+        "count": len(results),
+        "saved": sum(1 for r in results if r["status"] == "saved"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "skipped": skipped,
+        "timings": {"total_ms": round((time.perf_counter() - started) * 1000, 1), "save_ms": save_ms},
+        "results": results
     })
 
+@app.route('/upload/preflight', methods=['POST'])
+def upload_preflight():
+    # type, size and page checks plus an estimate of the text and the model spend, without
+    # extracting in full, calling the model or saving anything
+    if 'document' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+    file = request.files['document']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    try:
+        upload = accept_upload(file)
+    except UploadRejected as e:
+        return jsonify({"error": str(e), "accepted": False}), e.status
+
+    mode = request.args.get('mode') or None
+    if mode not in (None, 'fast', 'single', 'chunked', 'auto'):
+        return jsonify({"error": "mode must be one of auto, single, chunked, fast"}), 400
+    out = upload.describe()
+    out.update(accepted=True, sha256=upload.sha256)
+    if analysis_cache.get_by_file(upload.sha256) is not None:
+        out["estimate"] = {"cached": True, "model_calls": 0, "usd": 0.0}
+        return jsonify(out)
+    t = time.perf_counter()
+    try:
+        chars, exact = estimate_text_chars(upload.kind, upload.stream, upload.pages)
+    except Exception as e:
+        return jsonify({"error": f"Failed to read file: {str(e)}"}), 500
+    record_timing("estimate", time.perf_counter() - t)
+    out["estimate"] = dict(estimate_plan(chars, mode), cached=False, text_chars=chars, exact=exact)
+    return jsonify(out)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route('/search', methods=['GET'])
+def search():
+    try:
+        filters = parse_search_filters(request.args)
+        with timed(DB_SECONDS, "db", op="search"):
+            results, next_cursor = search_backend().search(filters)
+    except SearchError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Search failed: {str(e)}"}), 500
+    return jsonify({"query": filters["q"], "backend": search_backend().name, "results": results, "next_cursor": next_cursor})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus text format; counters are per process, so scrape each worker
+    body = metrics.render({"db_pool": db_pool.stats(), "analysis_cache": analysis_cache.stats(), "llm_client": llm.stats()})
+    return Response(body, mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(analysis_cache.stats())
+
+@app.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    # the async client (ASGI mode) shares the limiter and breaker but counts its own calls
+    return jsonify(dict(llm.stats(), async_client=async_llm.stats()))
+
+@app.route('/db/pool', methods=['GET'])
+def db_pool_stats():
+    return jsonify(db_pool.stats())
+
+HISTORY_FIELDS = ("id", "filename", "document_type", "analysis_summary", "created_at")
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+def _encode_history_cursor(created_at, doc_id):
+    raw = json.dumps([created_at, doc_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_history_cursor(cursor):
+    data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    return datetime.strptime(data[0], "%Y-%m-%d %H:%M:%S"), int(data[1])
+
+def history_count_sql(where, params, mode):
+    # "estimate" without filters reads InnoDB's row estimate instead of scanning;
+    # anything filtered is an index-only COUNT over the matching range.
+    # Returns (sql, params, approximate)
+    if mode == "estimate" and not where:
+        return "SELECT TABLE_ROWS AS n FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'documents'", (DB_NAME,), True
+    return f"SELECT COUNT(*) AS n FROM documents {'WHERE ' + ' AND '.join(where) if where else ''}", params, False
+
+def _history_count(cur, where, params, mode):
+    sql, sql_params, approximate = history_count_sql(where, params, mode)
+    cur.execute(sql, sql_params)
+    row = cur.fetchone()
+    return (row["n"] if row else 0), approximate
+
+def history_query(args):
+    # the page SQL for /history's arguments (shared with the ASGI app); raises ValueError on bad input
+    try:
+        limit = min(max(int(args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        fields = [f for f in args.get('fields', ",".join(HISTORY_FIELDS)).split(",") if f in HISTORY_FIELDS]
+        cursor = _decode_history_cursor(args['cursor']) if args.get('cursor') else None
+    except Exception:
+        raise ValueError("Invalid limit, fields or cursor")
+    # id and created_at are needed for the cursor even when not requested
+    columns = list(dict.fromkeys(["id", "created_at"] + fields))
+
+    where, params = [], []
+    if args.get('document_type'):
+        where.append("document_type = %s")
+        params.append(args['document_type'])
+    if args.get('filename'):
+        # prefix match only, so idx_documents_filename can serve it
+        prefix = args['filename'].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append("filename LIKE %s")
+        params.append(prefix + "%")
+    page_where = where + (["(created_at < %s OR (created_at = %s AND id < %s))"] if cursor else [])
+    page_params = params + ([cursor[0], cursor[0], cursor[1]] if cursor else [])
+    return {
+        "limit": limit,
+        "fields": fields,
+        "where": where,
+        "params": params,
+        "count": args['count'] if args.get('count') in ('exact', 'estimate', '1') else None,
+        "sql": f"""
+                SELECT {", ".join(columns)}
+                FROM documents
+                {"WHERE " + " AND ".join(page_where) if page_where else ""}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            """,
+        "sql_params": page_params + [limit + 1],
+    }
+
+def history_page(rows, q, total=None, approximate=False):
+    # (body rows, headers) for one page of history_query(q) results
+    # format datetime
+    for r in rows:
+        if isinstance(r.get('created_at'), datetime):
+            r['created_at'] = r['created_at'].strftime("%Y-%m-%d %H:%M:%S")
+    next_cursor = None
+    if len(rows) > q["limit"]:
+        rows = rows[:q["limit"]]
+        next_cursor = _encode_history_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    rows = [{k: r[k] for k in q["fields"]} for r in rows]
+
+    headers = {'Access-Control-Expose-Headers': 'X-Next-Cursor, X-Total-Count, X-Total-Count-Approximate'}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    if total is not None:
+        headers['X-Total-Count'] = str(total)
+        headers['X-Total-Count-Approximate'] = "1" if approximate else "0"
+    return rows, headers
 
 @app.route('/history', methods=['GET'])
 def history():
+    # keyset pagination on (created_at, id): every page is one index range read, however deep.
+    # The body stays a plain list; paging metadata travels in X-Next-Cursor / X-Total-Count.
+    try:
+        q = history_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
         conn = get_db_connection()
         cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT id, filename, document_type, analysis_summary, created_at
-            FROM documents
-            ORDER BY created_at DESC
-            LIMIT 20
-        """)
-        rows = cur.fetchall()
+        with timed(DB_SECONDS, "db", op="history"):
+            cur.execute(q["sql"], q["sql_params"])
+            rows = cur.fetchall()
+        total, approximate = None, False
+        if q["count"]:
+            total, approximate = _history_count(cur, q["where"], q["params"], q["count"])
         cur.close()
         conn.close()
-        # format datetime
-        for r in rows:
-            if isinstance(r.get('created_at'), datetime):
-                r['created_at'] = r['created_at'].strftime("%Y-%m-%d %H:%M:%S")
-        return jsonify(rows)
+        rows, headers = history_page(rows, q, total, approximate)
+        resp = jsonify(rows)
+        resp.headers.update(headers)
+        return resp
     except Exception as e:
         return jsonify({"error": f"Database fetch failed: {str(e)}"}), 500
 
+DOCUMENT_FIELDS = ("id", "filename", "document_type", "analysis_summary", "missing_items", "risks",
+                   "content_size", "file_hash", "text_hash", "analysis_ok", "parent_id", "root_id", "version", "created_at")
+
+def document_sql(include_content):
+    fields = ", ".join(DOCUMENT_FIELDS) + (", content, content_hash" if include_content else "")
+    return f"SELECT {fields} FROM documents WHERE id = %s"
+
+def format_document(row, doc_id):
+    # convert JSON fields from string to objects if necessary
+    try:
+        if isinstance(row.get('missing_items'), str):
+            row['missing_items'] = json.loads(row['missing_items'])
+    except Exception:
+        row['missing_items'] = []
+    try:
+        if isinstance(row.get('risks'), str):
+            row['risks'] = json.loads(row['risks'])
+    except Exception:
+        row['risks'] = []
+
+    # ensure created_at is string
+    if isinstance(row.get('created_at'), datetime):
+        row['created_at'] = row['created_at'].strftime("%Y-%m-%d %H:%M:%S")
+    row['content_url'] = f"/document/{doc_id}/content"
+    return row
+
 @app.route('/document/<int:doc_id>', methods=['GET'])
 def get_document(doc_id):
+    # metadata only; the text is fetched separately from /document/<id>/content
+    include_content = request.args.get("include_content") == "1"
     try:
         conn = get_db_connection()
         cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM documents WHERE id = %s", (doc_id,))
-        row = cur.fetchone()
+        with timed(DB_SECONDS, "db", op="document"):
+            cur.execute(document_sql(include_content), (doc_id,))
+            row = cur.fetchone()
+            if row and include_content:
+                row["content"] = load_document_content(cur, row)
+                row.pop("content_hash", None)
         cur.close()
         conn.close()
         if not row:
             return jsonify({"error": "Document not found"}), 404
+        return jsonify(format_document(row, doc_id))
+    except Exception as e:
+        return jsonify({"error": f"Database fetch failed: {str(e)}"}), 500
 
-        # convert JSON fields from string to objects if necessary
-        try:
-            if isinstance(row.get('missing_items'), str):
-                row['missing_items'] = json.loads(row['missing_items'])
-        except Exception:
-            row['missing_items'] = []
-        try:
-            if isinstance(row.get('risks'), str):
-                row['risks'] = json.loads(row['risks'])
-        except Exception:
-            row['risks'] = []
+@app.route('/document/<int:doc_id>/content', methods=['GET'])
+def get_document_content(doc_id):
+    # plain text; supports Range and If-None-Match so large contracts can be paged or cached
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(dictionary=True)
+        with timed(DB_SECONDS, "db", op="content"):
+            cur.execute("SELECT content_hash, content FROM documents WHERE id = %s", (doc_id,))
+            row = cur.fetchone()
+            data = None
+            if row and row.get("content_hash"):
+                data = content_store.get_content_bytes(cur, row["content_hash"])
+        cur.close()
+        conn.close()
+        if not row:
+            return jsonify({"error": "Document not found"}), 404
+        if data is None:
+            data = (row.get("content") or "").encode("utf-8")
+    except Exception as e:
+        return jsonify({"error": f"Database fetch failed: {str(e)}"}), 500
+
+    resp = Response(data, mimetype="text/plain; charset=utf-8")
+    resp.set_etag(row.get("content_hash") or content_store.content_hash(data.decode("utf-8")))
+    resp.headers["Cache-Control"] = "private, max-age=3600"
+    return resp.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+@app.route('/document/<int:doc_id>/versions', methods=['POST'])
+def upload_version(doc_id):
+    # a revised version of doc_id: only the clauses that changed go to the model
+    if 'document' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+    file = request.files['document']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    try:
+        file_bytes = accept_upload(file).read_bytes()
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": f"Failed to read file: {str(e)}"}), 500
+
+    try:
+        parent = load_parent(doc_id)
+    except Exception as e:
+        return jsonify({"error": f"Database fetch failed: {str(e)}"}), 500
+    if not parent:
+        return jsonify({"error": "Document not found"}), 404
 
-        # ensure created_at is string
-        if isinstance(row.get('created_at'), datetime):
-            row['created_at'] = row['created_at'].strftime("%Y-%m-%d %H:%M:%S")
-        return jsonify(row)
+    rec = run_version_pipeline(parent, file.filename, file_bytes)
+    out = document_response(rec, save_document(rec))
+    out.update(parent_id=rec["parent_id"], root_id=rec["root_id"], version=rec["version"],
+               revision=rec["revision"], timings=rec["timings"])
+    return jsonify(out)
+
+@app.route('/document/<int:doc_id>/versions', methods=['GET'])
+def list_versions(doc_id):
+    # the whole chain doc_id belongs to, oldest first
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT COALESCE(root_id, id) AS root FROM documents WHERE id = %s", (doc_id,))
+        row = cur.fetchone()
+        rows = []
+        if row:
+            cur.execute(
+                "SELECT id, filename, document_type, parent_id, version, analysis_ok, created_at FROM documents WHERE id = %s OR root_id = %s ORDER BY version, id",
+                (row["root"], row["root"])
+            )
+            rows = cur.fetchall()
+        cur.close()
+        conn.close()
     except Exception as e:
         return jsonify({"error": f"Database fetch failed: {str(e)}"}), 500
+    if not row:
+        return jsonify({"error": "Document not found"}), 404
+    for r in rows:
+        if isinstance(r.get('created_at'), datetime):
+            r['created_at'] = r['created_at'].strftime("%Y-%m-%d %H:%M:%S")
+    return jsonify({"root_id": row["root"], "versions": rows})
+
+@app.route('/document/<int:doc_id>/similar', methods=['GET'])
+def similar_documents(doc_id):
+    # nearest stored documents by shingle similarity (MinHash estimate of Jaccard), best first
+    index = similarity_index()
+    if index is None:
+        return jsonify({"error": "Similarity search is disabled (SIMILARITY_ENABLED=0 or numpy is not installed)"}), 503
+    try:
+        limit = min(max(int(request.args.get("limit", SIMILARITY_PAGE_SIZE)), 1), SIMILARITY_MAX_PAGE_SIZE)
+        min_similarity = float(request.args.get("min_similarity", 0))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer and min_similarity a number"}), 400
+
+    signature = index.signature(doc_id)
+    if signature is None:
+        # saved before the index existed (or too short to fingerprint): fingerprint it now
+        try:
+            row = load_parent(doc_id)
+        except Exception as e:
+            return jsonify({"error": f"Database fetch failed: {str(e)}"}), 500
+        if not row:
+            return jsonify({"error": "Document not found"}), 404
+        index.add([{"id": doc_id, "document_type": row["document_type"], "analysis_ok": row["analysis_ok"],
+                    "content": row["content"], "filename": row["filename"]}])
+        signature = index.signature(doc_id)
+        if signature is None:
+            return jsonify({"id": doc_id, "similar": []})
+    results = index.query(signature, limit, min_similarity, exclude=doc_id)
+    return jsonify({"id": doc_id, "similar": results})
 
 # -----------------------
 # Run
 # -----------------------
 if __name__ == '__main__':
     # helpful debug message
-    if not API_KEY:
-        print("⚠️ GOOGLE_API_KEY is not set. The app will skip AI analysis and save documents with a placeholder analysis.")
-    print(f"Starting app — DB: {DB_USER}@{DB_HOST}/{DB_NAME}")
+    if not API_CONFIGURED:
+        log.warning("GOOGLE_API_KEY is not set. The app will skip AI analysis and save documents with a placeholder analysis.")
+    log.info("starting app", extra={"db": f"{DB_USER}@{DB_HOST}/{DB_NAME}"})
     app.run(debug=True, port=5000)
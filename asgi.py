@@ -0,0 +1,281 @@
+import time
+import asyncio
+import logging
+
+from quart import Quart, Request, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+from hypercorn.middleware import AsyncioWSGIMiddleware
+
+import content_store
+import db_async
+import metrics
+from analysis import analyze_text_async
+from app import (DOCUMENT_INSERT_SQL, _document_row, _file_type, _row_to_analysis, analysis_cache, app as flask_app,
+                 cached_row_sql, document_response, document_sql, format_document, get_job_queue, history_count_sql,
+                 history_page, history_query, index_for_search, observe_analysis, observe_extraction, resolve_similar)
+from cache import digest_text
+from extraction import extract_text_async
+from intake import LENIENT_ENDPOINTS, MAX_CONTENT_LENGTH, UploadRejected, UploadSpool, accept_upload
+from jobs import JOB_RETRY_AFTER, QueueFull
+from llm_client import async_client
+from metrics import DB_SECONDS, HTTP_SECONDS, UPLOAD_BYTES, timed
+
+log = logging.getLogger("asgi")
+
+# -----------------------
+# ASGI serving mode: uvicorn asgi:application (hypercorn workers are daemonic: extraction falls back to threads)
+# /upload, /history and /document/<id> run as coroutines (httpx to Gemini, aiomysql to MySQL,
+# extraction awaited on the process pool), so a request waiting on the model holds no worker.
+# Every other route is the Flask app, run on the server's thread pool.
+# -----------------------
+class UploadRequest(Request):
+    # intake.UploadSpool as the multipart stream factory, as in the Flask app
+    def make_form_data_parser(self):
+        parser = super().make_form_data_parser()
+        strict = (self.url_rule.endpoint if self.url_rule else None) not in LENIENT_ENDPOINTS
+        parser.stream_factory = lambda total_content_length, content_type, filename=None, content_length=None: \
+            UploadSpool(filename, strict)
+        return parser
+
+async_app = Quart(__name__)
+async_app.request_class = UploadRequest
+async_app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+
+# -----------------------
+# Analysis cache: the Flask app's cache, with its persistent tier read over aiomysql
+# -----------------------
+async def _load_cached_row(column, digest, with_content):
+    try:
+        async with db_async.connection() as conn, conn.cursor(db_async.aiomysql.DictCursor) as cur:
+            with timed(DB_SECONDS, "db", op="cache_lookup"):
+                await cur.execute(cached_row_sql(column, with_content), (digest,))
+                row = await cur.fetchone()
+                if row and with_content:
+                    row["content"] = await load_document_content(cur, row)
+        return row
+    except Exception:
+        log.exception("cache lookup failed", extra={"column": column})
+        return None
+
+async def load_analysis_by_file_hash(file_hash):
+    row = await _load_cached_row("file_hash", file_hash, with_content=True)
+    if not row:
+        return None
+    return row.get("content") or "", _row_to_analysis(row)
+
+async def load_analysis_by_text_hash(text_hash):
+    row = await _load_cached_row("text_hash", text_hash, with_content=False)
+    return _row_to_analysis(row) if row else None
+
+analysis_cache.load_by_file_async = load_analysis_by_file_hash
+analysis_cache.load_by_text_async = load_analysis_by_text_hash
+
+async def load_document_content(cur, row):
+    if row.get("content_hash"):
+        text = await content_store.get_content_async(cur, row["content_hash"])
+        if text is not None:
+            return text
+    return row.get("content") or ""
+
+# -----------------------
+# Pipeline: app.run_pipeline / save_document with every wait awaited
+# -----------------------
+async def resolve_analysis(file_hash, text_hash, text_content, mode=None):
+    document_analysis = await analysis_cache.get_by_text_async(text_hash) if text_content else None
+    if document_analysis is not None:
+        analysis_cache.put(file_hash, text_hash, text_content, document_analysis)
+        return document_analysis, True, "text"
+    # the index lookup, the source row and the clause-diff calls are blocking: run them on a thread
+    similar = await asyncio.to_thread(resolve_similar, text_hash, text_content, mode)
+    if similar is not None:
+        document_analysis, analysis_ok = similar
+        cache_hit = "similar"
+    else:
+        document_analysis, analysis_ok = await analyze_text_async(text_content, mode)
+        cache_hit = None
+    if analysis_ok:
+        analysis_cache.put(file_hash, text_hash, text_content, document_analysis)
+    return document_analysis, analysis_ok, cache_hit
+
+async def run_pipeline(filename, file_bytes, file_hash, mode=None):
+    started = time.perf_counter()
+    timings = {}
+
+    UPLOAD_BYTES.observe(len(file_bytes), file_type=_file_type(filename, file_bytes))
+    cached = await analysis_cache.get_by_file_async(file_hash)
+    if cached is not None:
+        text_content, document_analysis = cached
+        text_hash = digest_text(text_content)
+        analysis_ok, cache_hit = True, "file"
+    else:
+        t = time.perf_counter()
+        text_content = await extract_text_async(filename, file_bytes)
+        elapsed = time.perf_counter() - t
+        timings["extract_ms"] = round(elapsed * 1000, 1)
+        observe_extraction(filename, file_bytes, text_content, elapsed)
+
+        text_hash = digest_text(text_content)
+        t = time.perf_counter()
+        document_analysis, analysis_ok, cache_hit = await resolve_analysis(file_hash, text_hash, text_content, mode)
+        elapsed = time.perf_counter() - t
+        timings["analyze_ms"] = round(elapsed * 1000, 1)
+        observe_analysis(elapsed, mode, cache_hit)
+
+    timings["pipeline_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return {
+        "filename": filename,
+        "text_content": text_content,
+        "analysis": document_analysis,
+        "analysis_ok": analysis_ok,
+        "file_hash": file_hash,
+        "text_hash": text_hash,
+        "cache": cache_hit,
+        "timings": timings,
+    }
+
+async def save_document(rec):
+    # Save to DB (attempt, but do not fail the API response if DB error occurs)
+    try:
+        async with db_async.transaction() as conn, conn.cursor() as cur:
+            with timed(DB_SECONDS, "db", op="insert"):
+                content_hash = await content_store.put_content_async(cur, rec["text_content"])
+                await cur.execute(DOCUMENT_INSERT_SQL, _document_row(rec, content_hash))
+            doc_id = cur.lastrowid
+    except Exception:
+        log.exception("DB save failed", extra={"upload": rec["filename"]})
+        doc_id = None
+    # the search backends are synchronous (mysql.connector / sqlite3)
+    await asyncio.to_thread(index_for_search, [rec], [doc_id])
+    return doc_id
+
+async def process_document(filename, file_bytes, file_hash, mode=None):
+    rec = await run_pipeline(filename, file_bytes, file_hash, mode)
+    return document_response(rec, await save_document(rec))
+
+# -----------------------
+# Request instrumentation (same histogram and Server-Timing header as the Flask app)
+# -----------------------
+@async_app.before_request
+async def _start_request_timer():
+    metrics.begin_request()
+    g.started = time.perf_counter()
+
+@async_app.after_request
+async def _finish_request_timer(response):
+    timings = metrics.end_request()
+    started = g.get("started")
+    if started is not None:
+        total = time.perf_counter() - started
+        timings["total"] = total
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_SECONDS.observe(total, method=request.method, route=route, status=response.status_code)
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+@async_app.errorhandler(413)
+@async_app.errorhandler(415)
+async def upload_limit_error(e):
+    return jsonify({"error": e.description}), e.code
+
+@async_app.after_serving
+async def _close_clients():
+    await async_client.aclose()
+    await db_async.close_pool()
+
+# -----------------------
+# Routes
+# -----------------------
+@async_app.route('/upload', methods=['POST'])
+async def upload_file():
+    files = await request.files
+    if 'document' not in files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = files['document']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+
+    try:
+        # page counting and the copy out of the spool are blocking file work
+        upload = await asyncio.to_thread(accept_upload, file)
+        file_bytes = await asyncio.to_thread(upload.read_bytes)
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": f"Failed to read file: {str(e)}"}), 500
+
+    mode = request.args.get('mode') or None
+    if mode not in (None, 'fast', 'single', 'chunked', 'auto'):
+        return jsonify({"error": "mode must be one of auto, single, chunked, fast"}), 400
+
+    if mode != 'fast' and request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        try:
+            job_id = get_job_queue().submit(file.filename, file_bytes, mode)
+        except QueueFull as e:
+            resp = jsonify({"error": str(e)})
+            resp.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+            return resp, 429
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
+
+    return jsonify(await process_document(file.filename, file_bytes, upload.sha256, mode))
+
+@async_app.route('/history', methods=['GET'])
+async def history():
+    try:
+        q = history_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        async with db_async.connection() as conn, conn.cursor(db_async.aiomysql.DictCursor) as cur:
+            with timed(DB_SECONDS, "db", op="history"):
+                await cur.execute(q["sql"], q["sql_params"])
+                rows = list(await cur.fetchall())
+            total, approximate = None, False
+            if q["count"]:
+                sql, params, approximate = history_count_sql(q["where"], q["params"], q["count"])
+                await cur.execute(sql, params)
+                row = await cur.fetchone()
+                total = row["n"] if row else 0
+        rows, headers = history_page(rows, q, total, approximate)
+        resp = jsonify(rows)
+        resp.headers.update(headers)
+        return resp
+    except Exception as e:
+        return jsonify({"error": f"Database fetch failed: {str(e)}"}), 500
+
+@async_app.route('/document/<int:doc_id>', methods=['GET'])
+async def get_document(doc_id):
+    include_content = request.args.get("include_content") == "1"
+    try:
+        async with db_async.connection() as conn, conn.cursor(db_async.aiomysql.DictCursor) as cur:
+            with timed(DB_SECONDS, "db", op="document"):
+                await cur.execute(document_sql(include_content), (doc_id,))
+                row = await cur.fetchone()
+                if row and include_content:
+                    row["content"] = await load_document_content(cur, row)
+                    row.pop("content_hash", None)
+        if not row:
+            return jsonify({"error": "Document not found"}), 404
+        return jsonify(format_document(row, doc_id))
+    except Exception as e:
+        return jsonify({"error": f"Database fetch failed: {str(e)}"}), 500
+
+# -----------------------
+# Entry point: async routes first, everything else falls through to Flask
+# -----------------------
+_wsgi = AsyncioWSGIMiddleware(flask_app, max_body_size=MAX_CONTENT_LENGTH)
+_async_routes = async_app.url_map.bind("localhost")
+
+def _is_async_route(scope):
+    try:
+        _async_routes.match(scope["path"], method=scope["method"])
+        return True
+    except HTTPException:
+        return False
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and not _is_async_route(scope):
+        await _wsgi(scope, receive, send)
+    else:
+        await async_app(scope, receive, send)
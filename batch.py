@@ -0,0 +1,105 @@
+import io
+import os
+import time
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from extractors import EXTENSIONS, detect_type
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Config
+# -----------------------
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 500))
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("BATCH_MAX_IN_FLIGHT", 8))          # documents in extract/analyze at once
+BATCH_MAX_UNCOMPRESSED = int(os.environ.get("BATCH_MAX_UNCOMPRESSED", 512 * 1024 * 1024))  # zip bomb guard, bytes
+BATCH_EXTENSIONS = tuple(EXTENSIONS)   # archive members are pre-filtered by name, then sniffed like uploads
+
+class BatchError(Exception):
+    pass
+
+# -----------------------
+# Collect (filename, bytes) items from uploads and ZIP archives
+# -----------------------
+def _is_zip_upload(filename, data):
+    # a .docx is also a zip, so go by the name, not the magic bytes
+    return filename.lower().endswith(".zip") and data[:4] == b"PK\x03\x04"
+
+def _expand_zip(archive_name, data, items, skipped, budget):
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        skipped.append({"filename": archive_name, "status": "failed", "error": "Not a valid ZIP archive"})
+        return budget
+    with zf:
+        for info in zf.infolist():
+            name = info.filename
+            base = os.path.basename(name)
+            if info.is_dir() or not base or base.startswith(".") or name.startswith("__MACOSX/"):
+                continue
+            if not base.lower().endswith(BATCH_EXTENSIONS):
+                skipped.append({"filename": name, "status": "skipped", "error": "Unsupported file type"})
+                continue
+            if info.file_size > budget:
+                raise BatchError(f"ZIP archive {archive_name} expands past {BATCH_MAX_UNCOMPRESSED} bytes")
+            budget -= info.file_size
+            member = zf.read(info)
+            if detect_type(member, name) is None:
+                skipped.append({"filename": name, "status": "skipped", "error": "Unsupported file type"})
+                continue
+            items.append((name, member))
+    return budget
+
+def collect_batch_files(uploads):
+    # uploads: iterable of (filename, bytes); returns (items, skipped)
+    items, skipped = [], []
+    budget = BATCH_MAX_UNCOMPRESSED
+    for filename, data in uploads:
+        if _is_zip_upload(filename, data):
+            budget = _expand_zip(filename, data, items, skipped, budget)
+        elif detect_type(data, filename) is not None:
+            items.append((filename, data))
+        else:
+            skipped.append({"filename": filename, "status": "skipped", "error": "Unsupported file type"})
+        if len(items) > BATCH_MAX_FILES:
+            raise BatchError(f"Batch exceeds {BATCH_MAX_FILES} files")
+    return items, skipped
+
+# -----------------------
+# Fan out, then save in one go
+# -----------------------
+def run_batch(items, run_one, save_many, max_in_flight=None):
+    # run_one(filename, bytes) -> record; save_many(records) -> ids in the same order.
+    # A failing document is reported on its own; the others are still saved.
+    max_in_flight = max(1, max_in_flight or BATCH_MAX_IN_FLIGHT)
+
+    def one(item):
+        filename, data = item
+        started = time.perf_counter()
+        try:
+            rec = run_one(filename, data)
+            return rec, None, time.perf_counter() - started
+        except Exception as e:
+            log.exception("batch item failed", extra={"upload": filename})
+            return None, str(e), time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(items)) or 1, thread_name_prefix="batch") as pool:
+        outcomes = list(pool.map(one, items))
+
+    recs = [rec for rec, _, _ in outcomes if rec is not None]
+    t = time.perf_counter()
+    ids = iter(save_many(recs))
+    save_ms = round((time.perf_counter() - t) * 1000, 1)
+
+    results = []
+    for (filename, _), (rec, error, elapsed) in zip(items, outcomes):
+        if rec is None:
+            results.append({"filename": filename, "status": "failed", "error": error,
+                            "timings": {"total_ms": round(elapsed * 1000, 1)}})
+            continue
+        doc_id = next(ids)
+        results.append({"filename": filename, "status": "saved" if doc_id else "analyzed", "id": doc_id,
+                        "rec": rec, "timings": dict(rec.get("timings", {}), total_ms=round(elapsed * 1000, 1))})
+    return results, save_ms
@@ -0,0 +1,140 @@
+"""Extraction micro-benchmarks: throughput, peak RSS and Python allocations per path.
+
+    python benchmarks/bench_extraction.py --pdf-pages 10 100 --docx-paragraphs 200 2000 --json out.json
+    python benchmarks/bench_extraction.py --pdf-pages --docx-paragraphs 2000 20000 --paths whole python-docx
+    python benchmarks/bench_extraction.py --pdf-pages 10 100 --docx-paragraphs --paths whole pdfplumber
+
+Each case runs in a fresh spawned process so peak RSS belongs to that case alone.
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import tracemalloc
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import make_document  # noqa: E402
+from results import write_results  # noqa: E402
+
+
+def _paths():
+    import extraction
+    import extractors
+
+    def streamed(filename, data):
+        import io
+        return "\n".join(extraction.iter_text_chunks(filename, io.BytesIO(data)))
+
+    def engine_first(order):
+        # the same chain with one engine moved to the front, e.g. the pre-registry paths
+        def fn(filename, data):
+            saved, extractors.EXTRACTOR_ORDER = extractors.EXTRACTOR_ORDER, order
+            try:
+                return extraction.extract_text_from_bytes(filename, data, parallel=False)
+            finally:
+                extractors.EXTRACTOR_ORDER = saved
+        return fn
+
+    return {
+        "whole": lambda filename, data: extraction.extract_text_from_bytes(filename, data, parallel=False),
+        "python-docx": engine_first("docx=python-docx"),
+        "pdfplumber": engine_first("pdf=pdfplumber"),
+        "parallel": lambda filename, data: extraction.extract_text_from_bytes(filename, data, parallel=True),
+        "stream": streamed,
+    }
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case(kind, size, path, repeat):
+    # runs inside the child process
+    import extraction
+
+    data = make_document(kind, size)
+    filename = f"bench.{kind}"
+    fn = _paths()[path]
+    if path == "parallel":
+        extraction.get_process_pool().submit(int).result()   # pool start-up is not part of the measurement
+    rss_before = _peak_rss_mb()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = fn(filename, data)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(filename, data)
+    current, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if path == "parallel":
+        extraction.get_process_pool().shutdown()
+        extraction._pool = None   # a later --inline case starts a fresh one
+    best = min(times)
+    return {
+        "kind": kind, "size": size, "path": path, "input_bytes": len(data), "text_chars": len(text),
+        "best_s": round(best, 4), "mean_s": round(sum(times) / len(times), 4),
+        "mb_per_s": round(len(data) / best / 1e6, 2), "units_per_s": round(size / best, 1),
+        "peak_rss_mb": _peak_rss_mb(), "rss_growth_mb": round(_peak_rss_mb() - rss_before, 1),
+        "peak_alloc_mb": round(peak_alloc / 1e6, 2), "retained_alloc_mb": round(current / 1e6, 2),
+    }
+
+
+def _child(conn, args):
+    try:
+        conn.send(run_case(*args))
+    except Exception as e:
+        conn.send({"error": repr(e)})
+    finally:
+        conn.close()
+
+
+def run_isolated(args):
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(child, args))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf-pages", type=int, nargs="*", default=[10, 100])
+    parser.add_argument("--docx-paragraphs", type=int, nargs="*", default=[200, 2000])
+    parser.add_argument("--paths", nargs="+", default=["whole", "parallel", "stream", "python-docx", "pdfplumber"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--inline", action="store_true", help="run in this process (faster, RSS is cumulative)")
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    cases = [("pdf", n) for n in args.pdf_pages] + [("docx", n) for n in args.docx_paragraphs]
+    results = []
+    for kind, size in cases:
+        for path in args.paths:
+            if (kind, path) in (("docx", "parallel"), ("docx", "pdfplumber"), ("pdf", "python-docx")):
+                continue   # path does not apply to this format
+            case = (kind, size, path, args.repeat)
+            result = run_case(*case) if args.inline else run_isolated(case)
+            results.append(result)
+            if args.json != "-":
+                print(f"{kind:>4} {size:>6} {path:>11}  {result.get('best_s', 'error')!s:>8}s  "
+                      f"{result.get('mb_per_s', '-')!s:>7} MB/s  rss {result.get('peak_rss_mb', '-')!s:>7} MB  "
+                      f"alloc {result.get('peak_alloc_mb', '-')!s:>7} MB  chars {result.get('text_chars', '-')}", flush=True)
+
+    if args.json:
+        write_results("extraction", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
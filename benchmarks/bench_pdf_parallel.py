@@ -0,0 +1,58 @@
+"""Serial vs page-range parallel PDF extraction, by page count.
+
+    python benchmarks/bench_pdf_parallel.py --pages 10 50 100 200 400 --workers 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_pdf  # noqa: E402
+import extraction  # noqa: E402
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    parser.add_argument("--workers", type=int, default=extraction.PDF_WORKERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    extraction.PDF_WORKERS = args.workers
+    # warm the pool so process start-up is not billed to the first run
+    extraction.get_process_pool().submit(int).result()
+
+    results = []
+    for pages in args.pages:
+        data = make_pdf(pages)
+        serial, a = best_of(lambda: extraction.extract_pdf_text(data, parallel=False), args.repeat)
+        parallel, b = best_of(lambda: extraction.extract_pdf_text(data, workers=args.workers, min_pages=0), args.repeat)
+        assert a == b, "parallel extraction changed the text or page order"
+        results.append({"pages": pages, "workers": args.workers, "serial_s": round(serial, 4),
+                        "parallel_s": round(parallel, 4), "speedup": round(serial / parallel, 2)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'pages':>6} {'serial s':>10} {'parallel s':>11} {'speedup':>8}")
+        for r in results:
+            print(f"{r['pages']:>6} {r['serial_s']:>10.3f} {r['parallel_s']:>11.3f} {r['speedup']:>7.2f}x")
+    extraction.get_process_pool().shutdown()
+
+
+if __name__ == "__main__":
+    main()
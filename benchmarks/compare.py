@@ -0,0 +1,73 @@
+"""Compare two benchmark JSON files and flag regressions.
+
+    python benchmarks/compare.py baseline.json current.json --threshold 0.10
+
+Exits 1 if any tracked metric got worse by more than the threshold.
+"""
+import sys
+import json
+import argparse
+
+# metric -> True if higher is better
+TRACKED = {
+    "extraction": {"best_s": False, "peak_rss_mb": False, "peak_alloc_mb": False, "mb_per_s": True},
+    "load": {"rps": True, "latency_ms.p50": False, "latency_ms.p99": False, "errors": False},
+}
+
+
+def _key(result):
+    if "scenario" in result:
+        return result["scenario"]
+    return f"{result.get('kind')}/{result.get('size')}/{result.get('path')}"
+
+
+def _get(result, dotted):
+    value = result
+    for part in dotted.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(baseline, current, threshold):
+    metrics = TRACKED.get(current["suite"], {})
+    base = {_key(r): r for r in baseline["results"]}
+    rows, regressions = [], 0
+    for result in current["results"]:
+        old = base.get(_key(result))
+        if old is None:
+            continue
+        for metric, higher_better in metrics.items():
+            a, b = _get(old, metric), _get(result, metric)
+            if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+                continue
+            change = (b - a) / a if a else (0.0 if b == a else float("inf"))
+            worse = -change if higher_better else change
+            regressed = worse > threshold
+            regressions += regressed
+            rows.append((_key(result), metric, a, b, change, regressed))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    if baseline["suite"] != current["suite"]:
+        sys.exit(f"suite mismatch: {baseline['suite']} vs {current['suite']}")
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    for key, metric, a, b, change, regressed in rows:
+        print(f"{key:<24} {metric:<16} {a!s:>10} -> {b!s:<10} {change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
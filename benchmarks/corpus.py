@@ -0,0 +1,103 @@
+import io
+import random
+
+# -----------------------
+# Synthetic contract corpus (deterministic for a given seed)
+# -----------------------
+WORDS = (
+    "agreement party parties tenant landlord licensor licensee shall term termination notice "
+    "payment rent deposit indemnify liability confidential information governing law jurisdiction "
+    "breach remedy warranty covenant assignment sublease premises effective date obligations "
+    "schedule fees invoice dispute arbitration severability waiver amendment entire consent"
+).split()
+
+def sentence(rng, words=14):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def paragraph(rng, sentences=4):
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+def contract_pages(pages, lines_per_page=45, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for p in range(pages):
+        lines = [f"Section {p + 1}. {rng.choice(WORDS).title()}"]
+        lines += [sentence(rng, 10) for _ in range(lines_per_page - 1)]
+        out.append(lines)
+    return out
+
+# -----------------------
+# Minimal PDF writer (Helvetica text only, no external deps)
+# -----------------------
+def _pdf_escape(s):
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(pages, lines_per_page=45, seed=0) -> bytes:
+    page_lines = contract_pages(pages, lines_per_page, seed)
+    objects = []   # 1-based object bodies
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    kids = []
+    for lines in page_lines:
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 780 Td"]
+        ops += [f"({_pdf_escape(line)}) '" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = (b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids)
+                              + b"] /Count %d >>" % len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+# -----------------------
+# DOCX writer (python-docx is already an app dependency)
+# -----------------------
+def make_docx(paragraphs, tables=0, rows=6, cols=4, seed=0) -> bytes:
+    import docx
+
+    rng = random.Random(seed)
+    doc = docx.Document()
+    doc.sections[0].header.paragraphs[0].text = "Confidential - Master Services Agreement"
+    doc.sections[0].footer.paragraphs[0].text = "Initials: ______  ______"
+    doc.add_heading("MASTER SERVICES AGREEMENT", level=1)
+    # tables are spread evenly through the body, like fee schedules in a real contract
+    table_every = max(1, paragraphs // tables) if tables else 0
+    for i in range(paragraphs):
+        if i % 10 == 0:
+            doc.add_paragraph(f"Section {i // 10 + 1}. {rng.choice(WORDS).title()}")
+        doc.add_paragraph(paragraph(rng))
+        if table_every and (i + 1) % table_every == 0 and tables:
+            tables -= 1
+            table = doc.add_table(rows=rows, cols=cols)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = sentence(rng, 4)
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+def make_document(kind, size, seed=0) -> bytes:
+    # kind "pdf": size pages; kind "docx": size paragraphs, one table per 50
+    if kind == "pdf":
+        return make_pdf(size, seed=seed)
+    return make_docx(size, tables=size // 50, seed=seed)
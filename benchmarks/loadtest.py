@@ -0,0 +1,146 @@
+"""Load test /upload, /history and /document/<id> in-process through the Flask test client.
+
+    python benchmarks/loadtest.py --requests 200 --concurrency 8 --llm-latency 0.05 --json load.json
+
+Gemini is a local stub with a fixed latency. The database is SQLite behind the
+mysql.connector calls (standins.py) unless --mysql is given, in which case the
+DB_* settings are used as usual.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import make_document  # noqa: E402
+from results import write_results  # noqa: E402
+from standins import sqlite_standin, start_gemini_stub  # noqa: E402
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def parse_server_timing(header):
+    out = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";dur=")
+        if name and rest:
+            out[name] = float(rest)
+    return out
+
+
+def run_scenario(app, name, make_request, count, concurrency):
+    # make_request(client, i) -> response; one test client per worker thread
+    local = threading.local()
+    latencies, statuses, stages = [], {}, {}
+    lock = threading.Lock()
+
+    def one(i):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        resp = make_request(client, i)
+        elapsed = time.perf_counter() - start
+        timing = parse_server_timing(resp.headers.get("Server-Timing"))
+        with lock:
+            latencies.append(elapsed)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            for stage, ms in timing.items():
+                stages.setdefault(stage, []).append(ms)
+        return resp
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(pool.map(one, range(count)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return responses, {
+        "scenario": name, "requests": count, "concurrency": concurrency, "wall_s": round(wall, 3),
+        "rps": round(count / wall, 1) if wall else None,
+        "latency_ms": {q: round(percentile(latencies, p) * 1000, 1) for q, p in (("p50", 50), ("p90", 90), ("p99", 99))}
+                      | {"max": round(latencies[-1] * 1000, 1) if latencies else None},
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+        "errors": sum(v for k, v in statuses.items() if k >= 400),
+        "server_timing_mean_ms": {k: round(sum(v) / len(v), 2) for k, v in sorted(stages.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", nargs="+", default=["upload", "history", "document"])
+    parser.add_argument("--kind", choices=["pdf", "docx"], default="docx")
+    parser.add_argument("--size", type=int, default=50, help="pages (pdf) or paragraphs (docx) per upload")
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="distinct upload documents, reused round-robin (0: every upload is new, no cache hits)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub Gemini latency, seconds")
+    parser.add_argument("--mysql", action="store_true", help="use the configured MySQL instead of SQLite")
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="lexify-load-")
+    stub, url = start_gemini_stub(args.llm_latency)
+    os.environ["GEMINI_API_URL"] = url
+    os.environ.setdefault("GEMINI_RATE_PER_SEC", "0")   # measure the app, not the client-side limiter
+    os.environ.setdefault("SEARCH_BACKEND", "sqlite")
+    os.environ.setdefault("SEARCH_SQLITE_PATH", os.path.join(workdir, "search.sqlite3"))
+    os.environ.setdefault("SIMILARITY_INDEX_PATH", os.path.join(workdir, "similarity.sqlite3"))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import db
+    if not args.mysql:
+        db.pool = db.ConnectionPool(creator=sqlite_standin(os.path.join(workdir, "documents.sqlite3")), pre_ping=False)
+    import app as app_module
+    app = app_module.app
+
+    distinct = args.distinct or args.requests
+    documents = [make_document(args.kind, args.size, seed=i) for i in range(min(distinct, args.requests))]
+    filename = f"contract.{args.kind}"
+
+    def upload(client, i):
+        import io
+        data = documents[i % len(documents)]
+        return client.post("/upload", data={"document": (io.BytesIO(data), filename)}, content_type="multipart/form-data")
+
+    results, ids = [], []
+    if "upload" in args.scenarios:
+        responses, summary = run_scenario(app, "upload", upload, args.requests, args.concurrency)
+        summary["llm_calls"] = stub.RequestHandlerClass.calls
+        results.append(summary)
+        ids = [r.get_json().get("id") for r in responses if r.status_code == 200 and r.get_json().get("id")]
+    if not ids and {"history", "document"} & set(args.scenarios):
+        # seed directly so the read scenarios have rows to page through
+        _, _ = run_scenario(app, "seed", upload, min(args.requests, 20), args.concurrency)
+        ids = [row["id"] for row in app.test_client().get("/history?limit=100&fields=id").get_json()]
+
+    if "history" in args.scenarios:
+        _, summary = run_scenario(app, "history", lambda c, i: c.get("/history?limit=20"), args.requests, args.concurrency)
+        results.append(summary)
+    if "document" in args.scenarios and ids:
+        _, summary = run_scenario(app, "document", lambda c, i: c.get(f"/document/{ids[i % len(ids)]}"),
+                                  args.requests, args.concurrency)
+        results.append(summary)
+
+    for r in results:
+        lat = r["latency_ms"]
+        print(f"{r['scenario']:>9}  {r['rps']!s:>7} req/s  p50 {lat['p50']}ms  p90 {lat['p90']}ms  p99 {lat['p99']}ms  "
+              f"errors {r['errors']}  {r['server_timing_mean_ms']}", file=sys.stderr)
+    if args.json:
+        write_results("load", results, args.json, **{k: v for k, v in vars(args).items() if k != "json"})
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
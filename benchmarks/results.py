@@ -0,0 +1,36 @@
+import os
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+# -----------------------
+# Common JSON envelope, so runs from different suites and machines can be compared
+# -----------------------
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def environment():
+    return {
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def write_results(suite, results, path, **params):
+    doc = {"suite": suite, "environment": environment(), "params": params, "results": results}
+    text = json.dumps(doc, indent=2)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"wrote {path}", file=sys.stderr)
+    return doc
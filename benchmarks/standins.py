@@ -0,0 +1,171 @@
+import re
+import json
+import time
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------
+# Gemini stand-in: answers generateContent with a fixed analysis after a configurable delay;
+# with ?alt=sse in the URL (GEMINI_STREAM_URL) it streams the answer in a few events over that delay
+# -----------------------
+STUB_ANALYSIS = {
+    "document_type": "Service Agreement",
+    "analysis_summary": "Synthetic benchmark analysis.",
+    "missing_items": [{"item": "Governing Law", "reason": "benchmark"}],
+    "risks": ["Auto renewal"],
+}
+
+class _GeminiHandler(BaseHTTPRequestHandler):
+    latency = 0.05
+    calls = 0
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        with _GeminiHandler._lock:
+            _GeminiHandler.calls += 1
+        prompt = body.get("contents", [{}])[0].get("parts", [{}])[0].get("text", "")
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": 60, "totalTokenCount": len(prompt) // 4 + 60}
+        if "alt=sse" in self.path:
+            self._stream(json.dumps(STUB_ANALYSIS), usage)
+            return
+        time.sleep(self.latency)
+        data = json.dumps({
+            "candidates": [{"content": {"parts": [{"text": json.dumps(STUB_ANALYSIS)}]}}],
+            "usageMetadata": usage,
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, text, usage, events=4):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        step = len(text) // events + 1
+        for i in range(0, len(text), step):
+            time.sleep(self.latency / events)
+            chunk = {"candidates": [{"content": {"parts": [{"text": text[i:i + step]}]}}]}
+            if i + step >= len(text):
+                chunk["usageMetadata"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+        self.close_connection = True
+
+def start_gemini_stub(latency=0.05, port=0):
+    # returns (server, url); port 0 picks a free port
+    handler = type("GeminiHandler", (_GeminiHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/generate"
+
+# -----------------------
+# MySQL stand-in: sqlite3 behind the mysql.connector calls the app makes
+# -----------------------
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL, document_type TEXT, analysis_summary TEXT, missing_items TEXT, risks TEXT,
+    content TEXT, content_hash TEXT, content_size INTEGER, file_hash TEXT, text_hash TEXT,
+    analysis_ok INTEGER NOT NULL DEFAULT 0, parent_id INTEGER, root_id INTEGER, version INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_documents_file_hash ON documents (file_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_text_hash ON documents (text_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_created_id ON documents (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_documents_type_created_id ON documents (document_type, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents (filename);
+CREATE INDEX IF NOT EXISTS idx_documents_root_version ON documents (root_id, version);
+CREATE TABLE IF NOT EXISTS document_contents (
+    content_hash TEXT PRIMARY KEY, codec TEXT NOT NULL, raw_size INTEGER NOT NULL, data BLOB NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+_CONCAT_RE = re.compile(r"CONCAT\((\w+),\s*%s\)")
+_INFO_SCHEMA_ROWS_RE = re.compile(r"SELECT TABLE_ROWS AS n FROM information_schema\.TABLES.*", re.S)
+
+def _translate(sql):
+    sql = _CONCAT_RE.sub(r"(\1 || %s)", sql)
+    sql = sql.replace("INSERT IGNORE", "INSERT OR IGNORE")
+    if _INFO_SCHEMA_ROWS_RE.match(sql.strip()):
+        # the estimate path: SQLite has no row-count statistics, so count
+        return "SELECT COUNT(*) AS n FROM documents WHERE %s IS NOT NULL"
+    return sql.replace("%s", "?")
+
+class _Cursor:
+    def __init__(self, conn, dictionary):
+        self._conn = conn
+        self._cur = conn.cursor()
+        self._dictionary = dictionary
+        self.lastrowid = None
+
+    def execute(self, sql, params=()):
+        self._cur.execute(_translate(sql), [self._param(p) for p in params])
+        self.lastrowid = self._cur.lastrowid
+
+    def executemany(self, sql, seq):
+        self._cur.executemany(_translate(sql), [[self._param(p) for p in params] for params in seq])
+        if sql.lstrip().upper().startswith("INSERT") and self._cur.rowcount > 0:
+            # MySQL reports the first id of a multi-row INSERT; sqlite3 does not report one at all
+            last = self._conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            self.lastrowid = last - self._cur.rowcount + 1
+
+    @staticmethod
+    def _param(value):
+        return value.strftime("%Y-%m-%d %H:%M:%S") if hasattr(value, "strftime") else value
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {d[0]: v for d, v in zip(self._cur.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def close(self):
+        self._cur.close()
+
+class SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+    def cursor(self, dictionary=False):
+        return _Cursor(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        self._conn.close()
+
+def sqlite_standin(path):
+    # creates the schema and returns a connection factory for db.ConnectionPool(creator=...)
+    conn = sqlite3.connect(path)
+    conn.executescript("PRAGMA journal_mode=WAL;" + SQLITE_SCHEMA)
+    conn.close()
+    return lambda: SQLiteConnection(path)
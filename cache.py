@@ -0,0 +1,162 @@
+import os
+import re
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# -----------------------
+# Config
+# -----------------------
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", 512))
+ANALYSIS_CACHE_TTL = float(os.environ.get("ANALYSIS_CACHE_TTL", 24 * 3600))  # seconds, 0 = never expire
+
+_WS_RE = re.compile(r"\s+")
+
+# -----------------------
+# Digests
+# -----------------------
+def digest_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def digest_text(text: str) -> str:
+    # collapse whitespace so trivially re-flowed extractions share a key
+    normalized = _WS_RE.sub(" ", text or "").strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+# -----------------------
+# In-process LRU tier
+# -----------------------
+class LRUCache:
+    def __init__(self, maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (expires_at, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+# -----------------------
+# Two-tier analysis cache
+# -----------------------
+class AnalysisCache:
+    """Memory LRU in front of an optional persistent tier.
+
+    `by_file` maps a digest of the uploaded bytes to (text_content, analysis),
+    so a byte-identical re-upload skips extraction as well as the model call.
+    `by_text` maps a digest of the extracted text to the analysis alone.
+    The persistent loaders take a digest and return the same shapes (or None);
+    the async loaders are coroutine functions used by the *_async getters.
+    """
+
+    def __init__(self, load_by_file=None, load_by_text=None,
+                 maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL,
+                 load_by_file_async=None, load_by_text_async=None):
+        self.by_file = LRUCache(maxsize, ttl)
+        self.by_text = LRUCache(maxsize, ttl)
+        self.load_by_file = load_by_file
+        self.load_by_text = load_by_text
+        self.load_by_file_async = load_by_file_async
+        self.load_by_text_async = load_by_text_async
+        self.persistent_hits = 0
+
+    def get_by_file(self, file_hash):
+        hit = self.by_file.get(file_hash)
+        if hit is None and self.load_by_file:
+            hit = self.load_by_file(file_hash)
+            if hit is not None:
+                self.persistent_hits += 1
+                self.by_file.set(file_hash, hit)
+        return hit
+
+    def get_by_text(self, text_hash):
+        hit = self.by_text.get(text_hash)
+        if hit is None and self.load_by_text:
+            hit = self.load_by_text(text_hash)
+            if hit is not None:
+                self.persistent_hits += 1
+                self.by_text.set(text_hash, hit)
+        return hit
+
+    async def get_by_file_async(self, file_hash):
+        hit = self.by_file.get(file_hash)
+        if hit is None and self.load_by_file_async:
+            hit = await self.load_by_file_async(file_hash)
+            if hit is not None:
+                self.persistent_hits += 1
+                self.by_file.set(file_hash, hit)
+        return hit
+
+    async def get_by_text_async(self, text_hash):
+        hit = self.by_text.get(text_hash)
+        if hit is None and self.load_by_text_async:
+            hit = await self.load_by_text_async(text_hash)
+            if hit is not None:
+                self.persistent_hits += 1
+                self.by_text.set(text_hash, hit)
+        return hit
+
+    def put(self, file_hash, text_hash, text_content, analysis):
+        if file_hash:
+            self.by_file.set(file_hash, (text_content, analysis))
+        if text_hash:
+            self.by_text.set(text_hash, analysis)
+
+    def clear(self):
+        self.by_file.clear()
+        self.by_text.clear()
+
+    def stats(self):
+        return {
+            "by_file": self.by_file.stats(),
+            "by_text": self.by_text.stats(),
+            "persistent_hits": self.persistent_hits,
+        }
@@ -0,0 +1,150 @@
+import os
+import sys
+import zlib
+import hashlib
+import logging
+
+try:
+    import zstandard
+except ImportError:   # optional: zlib is always available
+    zstandard = None
+
+from db import get_db_connection
+from logconfig import configure_logging
+from search import get_backend as search_backend
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Config
+# -----------------------
+CONTENT_CODEC = os.environ.get("CONTENT_CODEC", "zstd" if zstandard else "zlib")   # zstd | zlib | none
+CONTENT_LEVEL = int(os.environ.get("CONTENT_LEVEL", 6))
+
+# -----------------------
+# Codecs
+# -----------------------
+def compress(text, codec=None):
+    codec = codec or CONTENT_CODEC
+    raw = (text or "").encode("utf-8")
+    if codec == "zstd" and zstandard:
+        return "zstd", raw, zstandard.ZstdCompressor(level=CONTENT_LEVEL).compress(raw)
+    if codec == "none":
+        return "none", raw, raw
+    return "zlib", raw, zlib.compress(raw, CONTENT_LEVEL)
+
+def decompress_bytes(codec, data):
+    if codec == "zstd":
+        if not zstandard:
+            raise RuntimeError("Content is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return bytes(data)
+
+def content_hash(text):
+    # exact bytes, unlike cache.digest_text: stored content must round-trip unchanged
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+# -----------------------
+# Schema + access (all take an open cursor so callers control the transaction)
+# -----------------------
+def ensure_schema(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS document_contents (
+            content_hash CHAR(64) PRIMARY KEY,
+            codec VARCHAR(16) NOT NULL,
+            raw_size INT UNSIGNED NOT NULL,
+            data LONGBLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) CHARACTER SET = utf8mb4;
+    """)
+
+PUT_CONTENT_SQL = "INSERT IGNORE INTO document_contents (content_hash, codec, raw_size, data) VALUES (%s, %s, %s, %s)"
+GET_CONTENT_SQL = "SELECT codec, data FROM document_contents WHERE content_hash = %s"
+
+def _content_rows(texts):
+    # content-addressed and deduplicated: identical texts are stored once
+    rows, hashes = {}, []
+    for text in texts:
+        h = content_hash(text)
+        hashes.append(h)
+        if h not in rows:
+            codec, raw, data = compress(text)
+            rows[h] = (h, codec, len(raw), data)
+    return list(rows.values()), hashes
+
+def _row_bytes(row):
+    if not row:
+        return None
+    codec, data = (row["codec"], row["data"]) if isinstance(row, dict) else row
+    return decompress_bytes(codec, data)
+
+def put_contents(cur, texts):
+    rows, hashes = _content_rows(texts)
+    if rows:
+        cur.executemany(PUT_CONTENT_SQL, rows)
+    return hashes
+
+def put_content(cur, text):
+    return put_contents(cur, [text])[0]
+
+def get_content_bytes(cur, h):
+    # UTF-8 bytes of the stored text, or None
+    cur.execute(GET_CONTENT_SQL, (h,))
+    return _row_bytes(cur.fetchone())
+
+def get_content(cur, h):
+    data = get_content_bytes(cur, h)
+    return data.decode("utf-8") if data is not None else None
+
+# the same with an aiomysql cursor (ASGI mode)
+async def put_contents_async(cur, texts):
+    rows, hashes = _content_rows(texts)
+    if rows:
+        await cur.executemany(PUT_CONTENT_SQL, rows)
+    return hashes
+
+async def put_content_async(cur, text):
+    return (await put_contents_async(cur, [text]))[0]
+
+async def get_content_async(cur, h):
+    await cur.execute(GET_CONTENT_SQL, (h,))
+    data = _row_bytes(await cur.fetchone())
+    return data.decode("utf-8") if data is not None else None
+
+# -----------------------
+# One-off migration of inline documents.content into the store
+# -----------------------
+def migrate_inline_content(batch_size=200):
+    # python content_store.py migrate — safe to re-run; moves a batch per transaction
+    moved = 0
+    while True:
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("SELECT id, filename, analysis_summary, content FROM documents WHERE content IS NOT NULL AND content_hash IS NULL ORDER BY id LIMIT %s", (batch_size,))
+            rows = cur.fetchall()
+            if not rows:
+                cur.close()
+                return moved
+            hashes = put_contents(cur, [r["content"] for r in rows])
+            cur.executemany("UPDATE documents SET content_hash = %s, content_size = %s, content = NULL WHERE id = %s",
+                            [(h, len(r["content"].encode("utf-8")), r["id"]) for h, r in zip(hashes, rows)])
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+        # the search index keeps an excerpt of the text
+        search_backend().index([{"id": r["id"], "filename": r["filename"], "analysis_summary": r["analysis_summary"],
+                               "content": r["content"]} for r in rows])
+        moved += len(rows)
+        log.info("moved inline content into document_contents", extra={"moved": moved})
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        configure_logging()
+        migrate_inline_content()
+    else:
+        print("usage: python content_store.py migrate")
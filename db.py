@@ -0,0 +1,224 @@
+import os
+import time
+import threading
+from collections import deque
+
+import mysql.connector
+
+from metrics import DB_POOL_WAIT_SECONDS, record_timing
+
+# -----------------------
+# Config
+# -----------------------
+# MySQL config - you can set these env vars or replace defaults below
+DB_HOST = os.environ.get("DB_HOST", "localhost")
+DB_USER = os.environ.get("DB_USER", "root")
+DB_PASS = os.environ.get("DB_PASS", "tiger")   # change!
+DB_NAME = os.environ.get("DB_NAME", "lexify_db")
+DB_PORT = int(os.environ.get("DB_PORT", 3306))
+
+# Connection pool
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))              # connections kept open
+DB_POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", 10))  # extra connections during bursts, closed on return
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))     # seconds to wait for a free connection
+DB_POOL_RECYCLE = float(os.environ.get("DB_POOL_RECYCLE", 1800))   # replace connections idle longer than this (below wait_timeout)
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"  # ping on checkout, reconnect if the server dropped us
+
+class PoolTimeout(Exception):
+    pass
+
+def connect_server():
+    # raw connection without a default database (used once to CREATE DATABASE)
+    return mysql.connector.connect(
+        host=DB_HOST, user=DB_USER, password=DB_PASS, port=DB_PORT, charset='utf8mb4'
+    )
+
+def connect_database():
+    return mysql.connector.connect(
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASS,
+        database=DB_NAME,
+        port=DB_PORT,
+        charset='utf8mb4'
+    )
+
+# -----------------------
+# Pool
+# -----------------------
+class PooledConnection:
+    # proxy for a pooled mysql.connector connection; close() hands it back to the pool
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"connection already returned to pool ({name})")
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._checkin(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # a caller that forgot close() must not leak a pool slot
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, creator=connect_database, size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW,
+                 timeout=DB_POOL_TIMEOUT, recycle=DB_POOL_RECYCLE, pre_ping=DB_POOL_PRE_PING):
+        self.creator = creator
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._idle = deque()    # (raw, idle_since); LIFO so the warmest connection is reused
+        self._cond = threading.Condition()
+        self._open = 0
+        self._checked_out = 0
+        self._waiters = 0
+        self._stats = {"checkouts": 0, "timeouts": 0, "created": 0, "recycled": 0, "ping_failures": 0,
+                       "wait_count": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    def connect(self):
+        start = time.monotonic()
+        raw = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, idle_since = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No DB connection available within {self.timeout}s "
+                                      f"(pool size {self.size}, overflow {self.max_overflow})")
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            self._checked_out += 1
+            self._stats["checkouts"] += 1
+            waited = time.monotonic() - start
+            DB_POOL_WAIT_SECONDS.observe(waited)
+            if waited > 0.001:
+                self._stats["wait_count"] += 1
+                self._stats["wait_seconds_total"] += waited
+                self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+
+        try:
+            if raw is not None:
+                raw = self._revalidate(raw, idle_since)
+            if raw is None:
+                raw = self.creator()
+                with self._cond:
+                    self._stats["created"] += 1
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+        if waited > 0.001:
+            record_timing("db_wait", waited)
+        return PooledConnection(self, raw)
+
+    def _revalidate(self, raw, idle_since):
+        # returns raw if still usable, None if the caller should open a fresh one
+        if self.recycle and time.monotonic() - idle_since > self.recycle:
+            self._close_quietly(raw)
+            with self._cond:
+                self._stats["recycled"] += 1
+            return None
+        if self.pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                self._close_quietly(raw)
+                with self._cond:
+                    self._stats["ping_failures"] += 1
+                return None
+        return raw
+
+    def _checkin(self, raw):
+        try:
+            # never hand the next caller an open transaction (or a stale REPEATABLE READ snapshot)
+            if raw.in_transaction:
+                raw.rollback()
+            usable = raw.is_connected()
+        except Exception:
+            usable = False
+        with self._cond:
+            self._checked_out -= 1
+            if usable and len(self._idle) < self.size:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if raw is not None:
+            self._close_quietly(raw)
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def dispose(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for raw, _ in idle:
+            self._close_quietly(raw)
+
+    def stats(self):
+        with self._cond:
+            out = dict(self._stats)
+            out.update(size=self.size, max_overflow=self.max_overflow, open=self._open, idle=len(self._idle),
+                       checked_out=self._checked_out, waiters=self._waiters)
+        out["wait_seconds_avg"] = round(out["wait_seconds_total"] / out["wait_count"], 6) if out["wait_count"] else 0.0
+        return out
+
+pool = ConnectionPool()
+
+def get_db_connection():
+    return pool.connect()
+
+# -----------------------
+# Schema helpers
+# -----------------------
+def ensure_column(cur, table, column, ddl):
+    cur.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (DB_NAME, table, column)
+    )
+    if cur.fetchone()[0] == 0:
+        cur.execute(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {ddl}")
+
+def ensure_index(cur, table, index, ddl, kind=""):
+    # kind: "" for a plain index, or "UNIQUE" / "FULLTEXT"
+    cur.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (DB_NAME, table, index)
+    )
+    if cur.fetchone()[0] == 0:
+        cur.execute(f"ALTER TABLE `{table}` ADD {kind + ' ' if kind else ''}INDEX `{index}` {ddl}")
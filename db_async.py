@@ -0,0 +1,88 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+try:
+    import aiomysql
+except ImportError:   # optional: only the ASGI app (asgi.py) needs it
+    aiomysql = None
+
+from db import (DB_HOST, DB_NAME, DB_PASS, DB_POOL_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+                DB_PORT, DB_USER, PoolTimeout)
+from metrics import DB_POOL_WAIT_SECONDS, record_timing
+
+# -----------------------
+# aiomysql pool for the ASGI app: same database and limits as db.pool, one pool per event loop
+# -----------------------
+# aiomysql pools and asyncio locks are bound to the loop that made them, so both are keyed by
+# loop; entries of closed loops (asyncio.run() in scripts and tests) are dropped on the next create
+_pools = {}
+_pool_locks = {}
+_stats = {"checkouts": 0, "timeouts": 0, "wait_count": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+async def get_pool():
+    loop = asyncio.get_running_loop()
+    if loop not in _pools:
+        if aiomysql is None:
+            raise RuntimeError("The async database pool needs the aiomysql package")
+        async with _pool_locks.setdefault(loop, asyncio.Lock()):
+            if loop not in _pools:
+                for closed in [l for l in _pool_locks if l.is_closed()]:
+                    _pools.pop(closed, None)
+                    _pool_locks.pop(closed, None)
+                # autocommit on: aiomysql drops connections released mid-transaction, so reads never
+                # open one and writes use an explicit begin()/commit()
+                _pools[loop] = await aiomysql.create_pool(
+                    host=DB_HOST, user=DB_USER, password=DB_PASS, db=DB_NAME, port=DB_PORT, charset="utf8mb4",
+                    minsize=0, maxsize=DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW,
+                    pool_recycle=int(DB_POOL_RECYCLE) if DB_POOL_RECYCLE else -1, autocommit=True,
+                )
+    return _pools[loop]
+
+@asynccontextmanager
+async def connection():
+    pool = await get_pool()
+    started = time.monotonic()
+    try:
+        conn = await asyncio.wait_for(pool.acquire(), DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats["timeouts"] += 1
+        raise PoolTimeout(f"No DB connection available within {DB_POOL_TIMEOUT}s (pool max {pool.maxsize})") from None
+    waited = time.monotonic() - started
+    _stats["checkouts"] += 1
+    DB_POOL_WAIT_SECONDS.observe(waited)
+    if waited > 0.001:
+        _stats["wait_count"] += 1
+        _stats["wait_seconds_total"] += waited
+        _stats["wait_seconds_max"] = max(_stats["wait_seconds_max"], waited)
+        record_timing("db_wait", waited)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+@asynccontextmanager
+async def transaction():
+    async with connection() as conn:
+        await conn.begin()
+        try:
+            yield conn
+        except BaseException:
+            await conn.rollback()
+            raise
+        await conn.commit()
+
+async def close_pool():
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+
+def stats():
+    out = dict(_stats)
+    pools = list(_pools.values())
+    if pools:
+        out.update(size=sum(p.size for p in pools), idle=sum(p.freesize for p in pools),
+                   max_size=sum(p.maxsize for p in pools))
+    out["wait_seconds_avg"] = round(out["wait_seconds_total"] / out["wait_count"], 6) if out["wait_count"] else 0.0
+    return out
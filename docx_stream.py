@@ -0,0 +1,138 @@
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+# -----------------------
+# Streaming DOCX text: iterparse over the WordprocessingML parts, no object model
+# -----------------------
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+# related parts and where they go relative to the body
+BEFORE_BODY = ("header",)
+AFTER_BODY = ("footer", "footnotes", "endnotes")
+
+# parts' block containers: their children are cleared once processed
+_CONTAINERS = {W + "body", W + "hdr", W + "ftr", W + "footnote", W + "endnote", W + "tc"}
+_BREAKS = {W + "tab": "\t", W + "br": "\n", W + "cr": "\n", W + "noBreakHyphen": "-"}
+CELL_SEPARATOR = " | "
+
+def _rels(zf, part):
+    # {relationship type suffix: [target part names]} for one part, in document order
+    folder, name = posixpath.split(part)
+    path = posixpath.join(folder, "_rels", name + ".rels")
+    try:
+        root = ET.fromstring(zf.read(path))
+    except KeyError:
+        return {}
+    out = {}
+    for rel in root.iter(REL):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target", "")
+        target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+        out.setdefault(rel.get("Type", "").rsplit("/", 1)[-1], []).append(target)
+    return out
+
+def _main_part(zf):
+    try:
+        root = ET.fromstring(zf.read("_rels/.rels"))
+    except KeyError:
+        return "word/document.xml"
+    for rel in root.iter(REL):
+        if rel.get("Type") == OFFICE_DOCUMENT:
+            return rel.get("Target", "").lstrip("/")
+    return "word/document.xml"
+
+def iter_part_blocks(stream, keep_empty=True):
+    # yields one string per paragraph, or per table row (cells joined by CELL_SEPARATOR),
+    # in document order; memory stays flat because finished blocks are cleared as we go
+    text = []        # stack of run-text buffers, one per open paragraph (text boxes nest them)
+    rows = []        # stack of open table rows, each a list of cell texts
+    cells = []       # stack of open cells, each a list of paragraph texts
+    skip = 0         # depth inside mc:Fallback (duplicate of the mc:Choice content)
+    parents = []
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            parents.append(elem)
+            if tag == MC_FALLBACK or skip:
+                skip += 1
+            elif tag == W + "p":
+                text.append([])
+            elif tag == W + "tr":
+                rows.append([])
+            elif tag == W + "tc":
+                cells.append([])
+            continue
+
+        parents.pop()
+        if skip:
+            skip -= 1
+            continue
+        if tag == W + "t":
+            if text and elem.text:
+                text[-1].append(elem.text)
+        elif tag in _BREAKS:
+            if text:
+                text[-1].append(_BREAKS[tag])
+        elif tag == W + "p":
+            para = "".join(text.pop()) if text else ""
+            if cells:
+                if para:
+                    cells[-1].append(para)
+            elif text:
+                if para:
+                    text[-1].append("\n" + para)   # text box inside a paragraph
+            elif para or keep_empty:
+                yield para
+        elif tag == W + "tc":
+            if cells and rows:
+                rows[-1].append(" ".join(cells.pop()))
+        elif tag == W + "tr":
+            row = rows.pop() if rows else []
+            while row and not row[-1]:
+                row.pop()
+            line = CELL_SEPARATOR.join(row)
+            if cells:
+                if line:
+                    cells[-1].append(line)   # nested table
+            elif line:
+                yield line
+        # drop finished blocks so the tree never grows past one of them
+        if parents and parents[-1].tag in _CONTAINERS:
+            parents[-1].clear()
+
+def iter_docx_blocks(fileobj, headers=True, footers=True, notes=True):
+    # fileobj: path or seekable binary file. Headers come first, then the body, then
+    # footers, footnotes and endnotes; identical header/footer text is emitted once
+    with zipfile.ZipFile(fileobj) as zf:
+        main = _main_part(zf)
+        rels = _rels(zf, main)
+        wanted = {"header": headers, "footer": footers, "footnotes": notes, "endnotes": notes}
+        seen = set()
+
+        def related(kinds):
+            for kind in kinds:
+                if not wanted[kind]:
+                    continue
+                for part in rels.get(kind, ()):
+                    try:
+                        with zf.open(part) as f:
+                            blocks = list(iter_part_blocks(f, keep_empty=False))
+                    except KeyError:
+                        continue
+                    key = "\n".join(blocks)
+                    if key and key not in seen:
+                        seen.add(key)
+                        yield from blocks
+
+        yield from related(BEFORE_BODY)
+        with zf.open(main) as f:
+            yield from iter_part_blocks(f)
+        yield from related(AFTER_BODY)
+
+def extract_docx_text(fileobj, **parts) -> str:
+    return "\n".join(iter_docx_blocks(fileobj, **parts))
@@ -0,0 +1,309 @@
+import io
+import os
+import re
+import asyncio
+import logging
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import docx
+import pdfplumber
+
+try:
+    import pypdfium2
+except ImportError:   # optional: pdfplumber is always available
+    pypdfium2 = None
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+import text_formats  # noqa: F401  (registers the txt/html/rtf/odt extractors)
+from docx_stream import iter_docx_blocks
+from extractors import (collect_engine_events, detect_type, detect_type_stream, register, register_page_counter,
+                        replay_engine_events, run_chain, run_paged_chain)
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Config
+# -----------------------
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 300))  # below this, stay serial (pdfium reads ~2ms/page)
+PDF_TASKS_PER_WORKER = int(os.environ.get("PDF_TASKS_PER_WORKER", 2))      # >1 smooths out uneven pages
+STREAM_CHUNK_CHARS = int(os.environ.get("STREAM_CHUNK_CHARS", 8192))       # DOCX paragraphs are batched up to this
+STREAM_PDF_PAGES = int(os.environ.get("STREAM_PDF_PAGES", 8))              # pages per engine pass when streaming a PDF
+PREFLIGHT_SAMPLE_PAGES = int(os.environ.get("PREFLIGHT_SAMPLE_PAGES", 5))   # PDF pages read to estimate a document's text length
+DOCX_ENGINE = os.environ.get("DOCX_ENGINE", "stream")   # stream (iterparse: tables, headers, footers, notes) | python-docx (body paragraphs only)
+
+# -----------------------
+# Shared process pool for CPU-bound parsing (created on first use)
+# -----------------------
+_pool = None
+
+def get_process_pool():
+    global _pool
+    if _pool is None:
+        if multiprocessing.current_process().daemon:
+            # daemonic server workers (hypercorn's, for one) may not start child processes
+            log.warning("daemonic worker process: extraction runs on threads", extra={"workers": PDF_WORKERS})
+            _pool = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="extract")
+        else:
+            # spawn, not fork: callers are multi-threaded web workers
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+# -----------------------
+# PDF engines, fastest first: each reads a list of pages from bytes or a seekable file,
+# and the registry only hands pages a faster engine garbled to the next one
+# -----------------------
+_pdfium_lock = threading.Lock()   # pdfium is not thread-safe within a process
+
+def _rewound(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+def _pdfium_pages(source, indices):
+    with _pdfium_lock:
+        pdf = pypdfium2.PdfDocument(source if isinstance(source, (bytes, bytearray)) else _rewound(source))
+        try:
+            texts = []
+            for i in indices:
+                page = pdf[i]
+                textpage = page.get_textpage()
+                texts.append(textpage.get_text_range().replace("\r\n", "\n").strip())
+                textpage.close()
+                page.close()
+            return texts
+        finally:
+            pdf.close()
+
+def _pypdf_pages(source, indices):
+    reader = pypdf.PdfReader(_rewound(source))
+    return [(reader.pages[i].extract_text() or "").strip() for i in indices]
+
+def _pdfplumber_pages(source, indices):
+    # layout-accurate and by far the slowest; the last resort for garbled pages
+    texts = []
+    with pdfplumber.open(_rewound(source)) as pdf:
+        for i in indices:
+            page = pdf.pages[i]
+            texts.append(page.extract_text() or "")
+            # drop the parsed layout objects before moving on so memory stays flat
+            page.close()
+    return texts
+
+def pdf_page_count(source) -> int:
+    if pypdfium2:
+        try:
+            with _pdfium_lock:
+                pdf = pypdfium2.PdfDocument(source if isinstance(source, (bytes, bytearray)) else _rewound(source))
+                try:
+                    return len(pdf)
+                finally:
+                    pdf.close()
+        except pypdfium2.PdfiumError:
+            pass   # let the more forgiving parsers have a go
+    with pdfplumber.open(_rewound(source)) as pdf:
+        return len(pdf.pages)
+
+register("pdf", "pdfium", _pdfium_pages, paged=True, available=pypdfium2 is not None)
+register("pdf", "pypdf", _pypdf_pages, paged=True, available=pypdf is not None)
+register("pdf", "pdfplumber", _pdfplumber_pages, paged=True)
+register_page_counter("pdf", pdf_page_count)
+
+# -----------------------
+# PDF: serial and page-range parallel extraction
+# -----------------------
+def _extract_page_range(file_bytes: bytes, start: int, stop: int):
+    # runs in a worker process: reopen the document, read only our slice; the engine
+    # stats travel back with the text
+    with collect_engine_events() as events:
+        texts = run_paged_chain("pdf", file_bytes, range(start, stop))
+    return texts, events
+
+def split_page_ranges(page_count: int, chunks: int):
+    chunks = max(1, min(chunks, page_count))
+    size, extra = divmod(page_count, chunks)
+    ranges, start = [], 0
+    for i in range(chunks):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+def _submit_page_ranges(pool, file_bytes: bytes, page_count: int, workers: int):
+    ranges = split_page_ranges(page_count, workers * PDF_TASKS_PER_WORKER)
+    return [pool.submit(_extract_page_range, file_bytes, start, stop) for start, stop in ranges]
+
+def _join_page_ranges(results) -> str:
+    # results are in range order, so pages reassemble in document order
+    texts = []
+    for page_texts, events in results:
+        replay_engine_events(events)
+        texts.extend(page_texts)
+    return "\n".join(t for t in texts if t)
+
+def _extract_pdf_parallel(file_bytes: bytes, page_count: int, workers: int, pool=None) -> str:
+    futures = _submit_page_ranges(pool or get_process_pool(), file_bytes, page_count, workers)
+    return _join_page_ranges(fut.result() for fut in futures)
+
+def _use_parallel(page_count, workers, min_pages):
+    return workers > 1 and page_count >= min_pages
+
+def extract_pdf_text(file_bytes: bytes, parallel=True, workers=None, min_pages=None, pool=None) -> str:
+    workers = workers or PDF_WORKERS
+    min_pages = PDF_PARALLEL_MIN_PAGES if min_pages is None else min_pages
+    page_count = pdf_page_count(file_bytes)
+    if not (parallel and _use_parallel(page_count, workers, min_pages)):
+        texts = run_paged_chain("pdf", file_bytes, range(page_count))
+        return "\n".join(t for t in texts if t)
+    return _extract_pdf_parallel(file_bytes, page_count, workers, pool)
+
+# -----------------------
+# DOCX engines
+# -----------------------
+def _docx_stream(data: bytes) -> str:
+    return "\n".join(iter_docx_blocks(io.BytesIO(data)))
+
+def _docx_python_docx(data: bytes) -> str:
+    # the full object model; body paragraphs only
+    return "\n".join(p.text for p in docx.Document(io.BytesIO(data)).paragraphs)
+
+_DOCX_ENGINES = [("stream", _docx_stream), ("python-docx", _docx_python_docx)]
+for _name, _fn in sorted(_DOCX_ENGINES, key=lambda e: e[0] != DOCX_ENGINE):
+    register("docx", _name, _fn)
+
+# -----------------------
+# Utility: Extract text from file bytes
+# -----------------------
+def extract_text_from_bytes(filename: str, file_bytes: bytes, parallel=True) -> str:
+    # the format comes from the bytes; the filename only separates .html from .txt
+    kind = detect_type(file_bytes, filename)
+    try:
+        if kind == "pdf":
+            return extract_pdf_text(file_bytes, parallel=parallel)
+        if kind is None:
+            log.warning("unsupported file type", extra={"upload": filename})
+            return ""
+        return run_chain(kind, file_bytes)
+    except Exception:
+        log.exception("extraction failed", extra={"upload": filename, "file_type": kind})
+        return ""
+
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+_DOCX_PAGES_RE = re.compile(rb"<Pages>(\d+)</Pages>")
+
+def page_count_hint(filename: str, file_bytes: bytes, kind=None):
+    # cheap page count for metrics labels, without parsing the document; None if unknown
+    kind = kind or detect_type(file_bytes, filename)
+    try:
+        if kind == "pdf":
+            return len(_PDF_PAGE_RE.findall(file_bytes)) or None
+        if kind == "docx":
+            # Word records the page count it last rendered in docProps/app.xml
+            with zipfile.ZipFile(io.BytesIO(file_bytes)) as zf:
+                m = _DOCX_PAGES_RE.search(zf.read("docProps/app.xml"))
+            return int(m.group(1)) if m else None
+    except Exception:
+        return None
+    return None
+
+def estimate_text_chars(kind, fileobj, pages=None):
+    # (chars, exact): large PDFs read PREFLIGHT_SAMPLE_PAGES evenly spaced pages and scale up;
+    # everything else is extracted whole (the per-type byte limits keep that cheap)
+    fileobj.seek(0)
+    if kind == "pdf":
+        pages = pages or pdf_page_count(fileobj)
+        if pages > PREFLIGHT_SAMPLE_PAGES:
+            step = pages / PREFLIGHT_SAMPLE_PAGES
+            sample = sorted({int(i * step) for i in range(PREFLIGHT_SAMPLE_PAGES)})
+            texts = run_paged_chain("pdf", fileobj, sample)
+            return round(sum(len(t) + 1 for t in texts) * pages / len(sample)), False
+        texts = run_paged_chain("pdf", fileobj, range(pages))
+        return len("\n".join(t for t in texts if t)), True
+    text = run_chain(kind, fileobj.read())
+    fileobj.seek(0)
+    return len(text), True
+
+def _extract_serial(filename: str, file_bytes: bytes):
+    with collect_engine_events() as events:
+        text = extract_text_from_bytes(filename, file_bytes, parallel=False)
+    return text, events
+
+def extract_text_offloaded(filename: str, file_bytes: bytes, pool=None) -> str:
+    # keep all parsing off the calling thread: large PDFs fan out by page range,
+    # everything else runs whole in one worker (workers never start nested pools)
+    pool = pool or get_process_pool()
+    if detect_type(file_bytes, filename) == "pdf":
+        try:
+            page_count = pdf_page_count(file_bytes)
+            if _use_parallel(page_count, PDF_WORKERS, PDF_PARALLEL_MIN_PAGES):
+                return _extract_pdf_parallel(file_bytes, page_count, PDF_WORKERS, pool)
+        except Exception:
+            log.exception("extraction failed", extra={"upload": filename})
+            return ""
+    text, events = pool.submit(_extract_serial, filename, file_bytes).result()
+    replay_engine_events(events)
+    return text
+
+async def extract_text_async(filename: str, file_bytes: bytes, pool=None) -> str:
+    # extract_text_offloaded for the ASGI app: the worker futures are awaited, so the event
+    # loop keeps serving other requests while the document is parsed
+    pool = pool or get_process_pool()
+    if detect_type(file_bytes, filename) == "pdf":
+        try:
+            page_count = pdf_page_count(file_bytes)
+            if _use_parallel(page_count, PDF_WORKERS, PDF_PARALLEL_MIN_PAGES):
+                futures = _submit_page_ranges(pool, file_bytes, page_count, PDF_WORKERS)
+                return _join_page_ranges(await asyncio.gather(*map(asyncio.wrap_future, futures)))
+        except Exception:
+            log.exception("extraction failed", extra={"upload": filename})
+            return ""
+    text, events = await asyncio.wrap_future(pool.submit(_extract_serial, filename, file_bytes))
+    replay_engine_events(events)
+    return text
+
+# -----------------------
+# Streaming: yield text chunks instead of building one string
+# -----------------------
+def _iter_pdf_pages(fileobj):
+    page_count = pdf_page_count(fileobj)
+    for start in range(0, page_count, STREAM_PDF_PAGES):
+        for txt in run_paged_chain("pdf", fileobj, range(start, min(start + STREAM_PDF_PAGES, page_count))):
+            if txt:
+                yield txt
+
+def _iter_docx_blocks(fileobj):
+    if DOCX_ENGINE == "python-docx":
+        return (p.text for p in docx.Document(fileobj).paragraphs)
+    return iter_docx_blocks(fileobj)
+
+def _iter_docx_paragraphs(fileobj):
+    batch, size = [], 0
+    for block in _iter_docx_blocks(fileobj):
+        batch.append(block)
+        size += len(block) + 1
+        if size >= STREAM_CHUNK_CHARS:
+            yield "\n".join(batch)
+            batch, size = [], 0
+    if batch:
+        yield "\n".join(batch)
+
+def iter_text_chunks(filename: str, fileobj):
+    # fileobj is any seekable binary file (e.g. a SpooledTemporaryFile); chunks are
+    # pages for PDF and paragraph/table-row batches for DOCX, and "\n".join(chunks) matches
+    # extract_text_from_bytes for the same document. Other formats come as one chunk
+    kind = detect_type_stream(fileobj, filename)
+    if kind == "docx":
+        yield from _iter_docx_paragraphs(fileobj)
+    elif kind == "pdf":
+        yield from _iter_pdf_pages(fileobj)
+    elif kind is not None:
+        text = run_chain(kind, fileobj.read())
+        if text:
+            yield text
@@ -0,0 +1,237 @@
+import os
+import re
+import time
+import logging
+import zipfile
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+
+from metrics import EXTRACTOR_PAGES, EXTRACTOR_SECONDS
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Config
+# -----------------------
+EXTRACT_GARBAGE_RATIO = float(os.environ.get("EXTRACT_GARBAGE_RATIO", 0.15))   # share of junk characters that rejects an engine's output
+EXTRACT_GARBAGE_SAMPLE = int(os.environ.get("EXTRACT_GARBAGE_SAMPLE", 20000))  # characters inspected per text
+# per-format engine order, e.g. "pdf=pdfium,pypdf,pdfplumber;docx=stream,python-docx"; unlisted engines keep registration order
+EXTRACTOR_ORDER = os.environ.get("EXTRACTOR_ORDER", "")
+
+# -----------------------
+# Format detection: magic bytes first, the filename only breaks ties
+# -----------------------
+MIME_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "odt": "application/vnd.oasis.opendocument.text",
+    "rtf": "application/rtf",
+    "html": "text/html",
+    "txt": "text/plain",
+}
+EXTENSIONS = {".pdf": "pdf", ".docx": "docx", ".odt": "odt", ".rtf": "rtf", ".html": "html", ".htm": "html", ".txt": "txt"}
+
+SNIFF_BYTES = 4096
+_HTML_RE = re.compile(rb"^\s*(?:<\?xml[^>]*>\s*)?(?:<!--.*?-->\s*)*<(?:!doctype\s+html|html|head|body)\b", re.I | re.S)
+
+def _zip_kind(fileobj):
+    try:
+        with zipfile.ZipFile(fileobj) as zf:
+            names = set(zf.namelist())
+            if "word/document.xml" in names:
+                return "docx"
+            if "mimetype" in names and zf.read("mimetype").strip() == MIME_TYPES["odt"].encode():
+                return "odt"
+    except zipfile.BadZipFile:
+        return None
+    return None
+
+def _looks_like_text(head):
+    if head.startswith((b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")):
+        return True
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:   # a multi-byte character cut off at the sample edge is fine
+            return False
+    return True
+
+def detect_type(data: bytes, filename: str = ""):
+    # returns a key of MIME_TYPES, or None if nothing registered can read it
+    head = data[:SNIFF_BYTES]
+    if b"%PDF-" in head[:1024]:
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return _zip_kind(BytesIO(data))
+    if head.lstrip().startswith(b"{\\rtf"):
+        return "rtf"
+    if _HTML_RE.match(head):
+        return "html"
+    if _looks_like_text(head):
+        ext = EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+        return "html" if ext == "html" else "txt"
+    return None
+
+def detect_type_stream(fileobj, filename: str = ""):
+    # for spooled uploads: sniffs the head and, for zips, the central directory; leaves the position at 0
+    fileobj.seek(0)
+    head = fileobj.read(SNIFF_BYTES)
+    fileobj.seek(0)
+    kind = _zip_kind(fileobj) if head.startswith(b"PK\x03\x04") else detect_type(head, filename)
+    fileobj.seek(0)
+    return kind
+
+# -----------------------
+# Garbage check: is this text worth keeping, or should the next engine try?
+# -----------------------
+_CID_RE = re.compile(r"\(cid:\d+\)")   # pdfminer's placeholder for glyphs without a Unicode mapping
+# replacement character, control characters, private-use glyphs, lone surrogates
+_JUNK_RE = re.compile(r"[\ufffd\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f\ue000-\uf8ff\ud800-\udfff\U000f0000-\U0010ffff]")
+
+def garbage_ratio(text: str) -> float:
+    sample = text[:EXTRACT_GARBAGE_SAMPLE]
+    if not sample.strip():
+        return 0.0
+    bad = len(_CID_RE.findall(sample)) * 8 + len(_JUNK_RE.findall(sample))
+    # words run together with no spaces is the other common failure of fast text engines
+    if len(sample) > 200 and sample.count(" ") + sample.count("\n") < len(sample) / 50:
+        return 1.0
+    return bad / len(sample)
+
+def looks_garbled(text: str) -> bool:
+    return garbage_ratio(text) > EXTRACT_GARBAGE_RATIO
+
+# -----------------------
+# Engine stats (Prometheus; worker processes hand their events back to the parent)
+# -----------------------
+_collector = threading.local()
+
+def record_engine(engine, outcome, seconds, pages=0):
+    # outcome: ok | garbled | empty | error
+    events = getattr(_collector, "events", None)
+    if events is not None:
+        events.append((engine, outcome, seconds, pages))
+        return
+    EXTRACTOR_SECONDS.observe(seconds, engine=engine, outcome=outcome)
+    if pages:
+        EXTRACTOR_PAGES.inc(pages, engine=engine, outcome=outcome)
+
+@contextmanager
+def collect_engine_events():
+    _collector.events = events = []
+    try:
+        yield events
+    finally:
+        _collector.events = None
+
+def replay_engine_events(events):
+    for event in events or ():
+        record_engine(*event)
+
+# -----------------------
+# Registry
+# -----------------------
+class Engine:
+    def __init__(self, kind, name, fn, paged=False, available=True):
+        # fn(data) -> str, or for paged engines fn(data, page_indices) -> [str] (one per index)
+        self.kind = kind
+        self.name = name
+        self.fn = fn
+        self.paged = paged
+        self.available = available
+
+_engines = {}   # kind -> [Engine] in registration order
+_page_counters = {}
+
+def register(kind, name, fn, paged=False, available=True):
+    _engines.setdefault(kind, [])
+    _engines[kind] = [e for e in _engines[kind] if e.name != name] + [Engine(kind, name, fn, paged, available)]
+
+def register_page_counter(kind, fn):
+    _page_counters[kind] = fn
+
+def _configured_order():
+    order = {}
+    for spec in filter(None, (s.strip() for s in EXTRACTOR_ORDER.split(";"))):
+        kind, _, names = spec.partition("=")
+        order[kind.strip()] = [n.strip() for n in names.split(",") if n.strip()]
+    return order
+
+def engines_for(kind, order=None):
+    engines = [e for e in _engines.get(kind, ()) if e.available]
+    preferred = (order or _configured_order()).get(kind)
+    if preferred:
+        rank = {name: i for i, name in enumerate(preferred)}
+        engines.sort(key=lambda e: rank.get(e.name, len(rank)))
+    return engines
+
+def formats():
+    return {kind: [e.name for e in engines_for(kind)] for kind in _engines}
+
+def page_count(kind, data):
+    counter = _page_counters.get(kind)
+    return counter(data) if counter else None
+
+def run_chain(kind, data, engines=None):
+    # whole-document chain: the first engine with clean, non-empty output wins; otherwise the
+    # least garbled output seen; raises the last error if every engine failed
+    best, best_ratio, error = None, None, None
+    for engine in engines or engines_for(kind):
+        started = time.perf_counter()
+        try:
+            text = engine.fn(data) or ""
+        except Exception as e:
+            record_engine(engine.name, "error", time.perf_counter() - started)
+            log.warning("extractor failed", extra={"engine": engine.name, "error": repr(e)})
+            error = e
+            continue
+        ratio = garbage_ratio(text)
+        outcome = "empty" if not text.strip() else ("garbled" if ratio > EXTRACT_GARBAGE_RATIO else "ok")
+        record_engine(engine.name, outcome, time.perf_counter() - started)
+        if outcome == "ok":
+            return text
+        if best is None or (text.strip() and (not best.strip() or ratio < best_ratio)):
+            best, best_ratio = text, ratio
+    if best is None and error is not None:
+        raise error
+    return best or ""
+
+def run_paged_chain(kind, data, indices, engines=None):
+    # per-page chain: the first engine reads every page, later ones only re-read the pages the
+    # earlier ones failed on or garbled; returns texts in the order of indices
+    texts = {}
+    pending = list(indices)
+    error = None
+    for engine in engines or engines_for(kind):
+        if not pending:
+            break
+        started = time.perf_counter()
+        try:
+            results = engine.fn(data, pending)
+        except Exception as e:
+            record_engine(engine.name, "error", time.perf_counter() - started, len(pending))
+            log.warning("extractor failed", extra={"engine": engine.name, "error": repr(e)})
+            error = e
+            continue
+        retry, clean = [], 0
+        for index, text in zip(pending, results):
+            text = text or ""
+            if looks_garbled(text):
+                retry.append(index)
+                if index not in texts:
+                    texts[index] = text   # kept in case nothing later does better
+            else:
+                texts[index] = text
+                clean += 1
+        elapsed = time.perf_counter() - started
+        if clean:
+            record_engine(engine.name, "ok", elapsed * clean / len(pending), clean)
+        if retry:
+            record_engine(engine.name, "garbled", elapsed * len(retry) / len(pending), len(retry))
+        pending = retry
+    if not texts and error is not None:
+        raise error
+    return [texts.get(i, "") for i in indices]
@@ -0,0 +1,228 @@
+import io
+import os
+import re
+import json
+import hashlib
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from extractors import MIME_TYPES, SNIFF_BYTES, detect_type, detect_type_stream, page_count
+
+# -----------------------
+# Config
+# -----------------------
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", os.path.join(os.getcwd(), "uploads"))
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# upload bodies above this many bytes roll over from memory to a temp file in UPLOAD_FOLDER
+SPOOL_MAX_MEMORY = int(os.environ.get("SPOOL_MAX_MEMORY", 1024 * 1024))
+MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", 200 * 1024 * 1024))   # whole request, batches included
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 50 * 1024 * 1024))        # per file, unless its type says otherwise
+UPLOAD_MAX_PAGES = int(os.environ.get("UPLOAD_MAX_PAGES", 1000))
+# per-type overrides as JSON, e.g. {"pdf": {"max_bytes": 104857600, "max_pages": 2000}, "txt": {"max_bytes": 5242880}}
+UPLOAD_TYPE_LIMITS = json.loads(os.environ.get("UPLOAD_TYPE_LIMITS", "{}"))
+
+DEFAULT_TYPE_LIMITS = {
+    "pdf": {},
+    "docx": {"max_bytes": 25 * 1024 * 1024},
+    "odt": {"max_bytes": 25 * 1024 * 1024},
+    "rtf": {"max_bytes": 20 * 1024 * 1024},
+    "html": {"max_bytes": 10 * 1024 * 1024},
+    "txt": {"max_bytes": 10 * 1024 * 1024},
+}
+# these endpoints report a rejected file as a skipped item instead of failing the whole request
+LENIENT_ENDPOINTS = {"upload_batch"}
+
+def limits_for(kind):
+    limits = {"max_bytes": UPLOAD_MAX_BYTES, "max_pages": UPLOAD_MAX_PAGES}
+    limits.update(DEFAULT_TYPE_LIMITS.get(kind, {}))
+    limits.update(UPLOAD_TYPE_LIMITS.get(kind, {}))
+    return limits
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=415):
+        super().__init__(message)
+        self.status = status
+
+# -----------------------
+# Sniffing on the first bytes (before the rest of the body has arrived)
+# -----------------------
+_ODT_HEAD = b"mimetype" + MIME_TYPES["odt"].encode()
+
+def sniff_head(head, filename=""):
+    # like extractors.detect_type, but zips are only told apart once the central directory
+    # (at the end) has arrived, so they come back as "zip" unless the ODT mimetype entry leads
+    if head.startswith(b"PK\x03\x04"):
+        return "odt" if head[30:30 + len(_ODT_HEAD)] == _ODT_HEAD else "zip"
+    return detect_type(head, filename)
+
+def _zip_limits(filename):
+    if filename.lower().endswith(".zip"):
+        return {"max_bytes": None, "max_pages": None}   # batch archive: MAX_CONTENT_LENGTH and BATCH_MAX_UNCOMPRESSED apply
+    return {"max_bytes": max(limits_for("docx")["max_bytes"], limits_for("odt")["max_bytes"]), "max_pages": None}
+
+# -----------------------
+# Spooled, hashed, size/page-checked upload stream
+# -----------------------
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+_PAGE_SCAN_HOLD = 32   # bytes kept back so a marker split across two writes is still seen once
+
+class UploadSpool:
+    # werkzeug writes the file part into this while parsing the request body; we hash and
+    # spool it, sniff the first SNIFF_BYTES, and stop as soon as a limit is crossed
+    def __init__(self, filename="", strict=True):
+        self.filename = filename or ""
+        self.strict = strict
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, dir=UPLOAD_FOLDER)
+        self.size = 0
+        self.kind = None
+        self.limits = None
+        self.pages_seen = 0
+        self.rejected = None   # (status, message) when not strict
+        self._sha = hashlib.sha256()
+        self._pending = b""    # bytes written before the type is known
+        self._scan_tail = b""
+
+    def _reject(self, message, status):
+        if self.strict:
+            raise (RequestEntityTooLarge if status == 413 else UnsupportedMediaType)(message)
+        self.rejected = (status, message)
+        self.file.truncate(0)   # nothing more is kept for a rejected file
+
+    def _sniff(self, head):
+        self.kind = sniff_head(head, self.filename)
+        if self.kind is None:
+            self._reject(f"Unsupported file type: {self.filename or 'upload'}", 415)
+            return
+        self.limits = _zip_limits(self.filename) if self.kind == "zip" else limits_for(self.kind)
+
+    def _check(self, data):
+        max_bytes = self.limits.get("max_bytes")
+        if max_bytes and self.size > max_bytes:
+            self._reject(f"{self.kind.upper()} uploads are limited to {max_bytes} bytes", 413)
+            return
+        max_pages = self.limits.get("max_pages")
+        if self.kind == "pdf" and max_pages:
+            scan = self._scan_tail + data
+            cut = max(0, len(scan) - _PAGE_SCAN_HOLD)
+            self.pages_seen += sum(1 for m in _PDF_PAGE_RE.finditer(scan) if m.start() < cut)
+            self._scan_tail = scan[cut:]
+            if self.pages_seen > max_pages:
+                self._reject(f"PDF uploads are limited to {max_pages} pages", 413)
+
+    def write(self, data):
+        n = len(data)
+        if self.rejected:
+            return n
+        self.size += n
+        self._sha.update(data)
+        self.file.write(data)
+        if self.kind is None:
+            self._pending += data
+            if len(self._pending) < SNIFF_BYTES:
+                return n
+            data, self._pending = self._pending, b""
+            self._sniff(data[:SNIFF_BYTES])
+            if self.rejected:
+                return n
+        self._check(data)
+        return n
+
+    def finish(self):
+        # end of the part: sniff files shorter than SNIFF_BYTES, count the held-back page markers
+        if self.rejected:
+            return
+        if self.kind is None:
+            data, self._pending = self._pending, b""
+            self._sniff(data)
+            if self.rejected:
+                return
+            self._check(data)
+            if self.rejected:
+                return
+        if self.kind == "pdf" and self._scan_tail:
+            self.pages_seen += len(_PDF_PAGE_RE.findall(self._scan_tail))
+            self._scan_tail = b""
+
+    def detach(self):
+        # hand the spooled file to a caller that outlives the request (werkzeug closes the
+        # request's files when it ends)
+        file, self.file = self.file, io.BytesIO()
+        file.seek(0)
+        return file
+
+    @property
+    def sha256(self):
+        return self._sha.hexdigest()
+
+    def __getattr__(self, name):
+        # read/seek/tell/close for werkzeug's FileStorage go to the spooled file
+        return getattr(self.file, name)
+
+class UploadRequest(Request):
+    # install with app.request_class = UploadRequest; the request cap is app.config["MAX_CONTENT_LENGTH"]
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        endpoint = self.url_rule.endpoint if self.url_rule else None
+        return UploadSpool(filename, strict=endpoint not in LENIENT_ENDPOINTS)
+
+# -----------------------
+# After the part is complete: authoritative type and page checks
+# -----------------------
+class Upload:
+    def __init__(self, filename, stream, size, sha256, kind, pages):
+        self.filename = filename
+        self.stream = stream
+        self.size = size
+        self.sha256 = sha256
+        self.kind = kind
+        self.pages = pages
+
+    def read_bytes(self):
+        self.stream.seek(0)
+        data = self.stream.read()
+        self.stream.seek(0)
+        return data
+
+    def describe(self):
+        return {"filename": self.filename, "file_type": self.kind, "mime_type": MIME_TYPES.get(self.kind, "application/zip"),
+                "size_bytes": self.size, "pages": self.pages, "limits": limits_for(self.kind)}
+
+def _as_spool(file):
+    stream = file.stream
+    if isinstance(stream, UploadSpool):
+        return stream
+    # not parsed by UploadRequest (e.g. an app without it): copy through the same checks
+    spool = UploadSpool(file.filename)
+    stream.seek(0)
+    for block in iter(lambda: stream.read(64 * 1024), b""):
+        spool.write(block)
+    return spool
+
+def accept_upload(file, archives=False):
+    # file: werkzeug FileStorage; returns an Upload or raises UploadRejected. With archives=True
+    # a .zip batch archive passes as kind "zip" (its members are checked when it is unpacked)
+    spool = _as_spool(file)
+    spool.finish()
+    if spool.rejected:
+        raise UploadRejected(spool.rejected[1], spool.rejected[0])
+    name = file.filename or ""
+    kind = spool.kind
+    if kind == "zip" and archives and name.lower().endswith(".zip"):
+        spool.seek(0)
+        return Upload(name, spool, spool.size, spool.sha256, "zip", None)
+    if kind in ("zip", "odt"):
+        kind = detect_type_stream(spool.file, name)   # now the central directory is here
+        if kind is None:
+            raise UploadRejected(f"Unsupported file type: {name or 'upload'}")
+    limits = limits_for(kind)
+    if limits.get("max_bytes") and spool.size > limits["max_bytes"]:
+        raise UploadRejected(f"{kind.upper()} uploads are limited to {limits['max_bytes']} bytes", 413)
+    try:
+        pages = page_count(kind, spool.file)
+    except Exception:
+        pages = spool.pages_seen or None   # unreadable here; extraction will say so properly
+    if pages and limits.get("max_pages") and pages > limits["max_pages"]:
+        raise UploadRejected(f"{kind.upper()} uploads are limited to {limits['max_pages']} pages", 413)
+    spool.seek(0)
+    return Upload(name, spool, spool.size, spool.sha256, kind, pages)
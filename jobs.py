@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from extraction import extract_text_offloaded
+from intake import UPLOAD_FOLDER
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Config
+# -----------------------
+JOB_BACKEND = os.environ.get("JOB_BACKEND", "memory")          # memory | sqlite
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(UPLOAD_FOLDER, "jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))            # threads: LLM round trip + DB insert
+JOB_EXTRACT_PROCESSES = int(os.environ.get("JOB_EXTRACT_PROCESSES", 2))  # processes: pdfplumber/docx parse
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 32))     # queued + running jobs before we answer 429
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", 3600))   # seconds finished jobs stay pollable
+JOB_RETRY_AFTER = int(os.environ.get("JOB_RETRY_AFTER", 5))
+
+FINISHED_STATES = ("saved", "analyzed", "failed")   # analyzed: result ready, DB insert failed
+
+class QueueFull(Exception):
+    pass
+
+# -----------------------
+# Job stores
+# -----------------------
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, filename):
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {"id": job_id, "filename": filename, "status": "queued",
+                                  "result": None, "error": None, "created_at": now, "updated_at": now}
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def prune(self, older_than):
+        with self._lock:
+            for job_id in [k for k, j in self._jobs.items()
+                           if j["status"] in FINISHED_STATES and j["updated_at"] < older_than]:
+                del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, job_id, filename):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, filename, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                         (job_id, filename, now, now))
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def prune(self, older_than):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('saved', 'analyzed', 'failed') AND updated_at < ?", (older_than,))
+
+
+def make_job_store(backend=JOB_BACKEND):
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    return MemoryJobStore()
+
+# -----------------------
+# Job queue: bounded thread pool for the pipeline, process pool for extraction
+# -----------------------
+class JobQueue:
+    def __init__(self, pipeline, store=None, workers=JOB_WORKERS,
+                 extract_processes=JOB_EXTRACT_PROCESSES, max_pending=JOB_QUEUE_SIZE):
+        # pipeline(filename, file_bytes, on_stage=..., extract=..., mode=...) -> result dict
+        self.pipeline = pipeline
+        self.store = store or make_job_store()
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        # spawn, not fork: the parent is a multi-threaded web worker
+        self._processes = ProcessPoolExecutor(max_workers=extract_processes,
+                                              mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, filename, file_bytes, mode=None):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"Job queue is full ({self.max_pending} pending), retry later")
+            self._pending += 1
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.prune(time.time() - JOB_RESULT_TTL)
+            self.store.create(job_id, filename)
+            self._threads.submit(self._run, job_id, filename, file_bytes, mode)
+        except Exception:
+            self._release()
+            raise
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {"pending": self._pending, "max_pending": self.max_pending}
+
+    def shutdown(self, wait=True):
+        self._threads.shutdown(wait=wait)
+        self._processes.shutdown(wait=wait)
+
+    def _extract(self, filename, file_bytes):
+        return extract_text_offloaded(filename, file_bytes, pool=self._processes)
+
+    def _run(self, job_id, filename, file_bytes, mode=None):
+        try:
+            result = self.pipeline(
+                filename, file_bytes,
+                on_stage=lambda status: self.store.update(job_id, status=status),
+                extract=self._extract,
+                mode=mode,
+            )
+            self.store.update(job_id, status="saved" if result.get("id") is not None else "analyzed", result=result)
+        except Exception as e:
+            log.exception("job failed", extra={"job_id": job_id, "upload": filename})
+            self.store.update(job_id, status="failed", error=str(e))
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
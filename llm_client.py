@@ -0,0 +1,561 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:   # optional: only the ASGI app (asgi.py) uses the async client
+    httpx = None
+
+from metrics import LLM_ATTEMPT_SECONDS, LLM_DECODES, LLM_RETRIES, LLM_SECONDS, LLM_TOKENS, record_timing
+from response_decoder import DecodeError, PartialJSON, compile_schema, decode_json, parts_text, response_text
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Config
+# -----------------------
+# Gemini API (Google AI Studio); GEMINI_API_URL points the app at a local stub for testing
+API_KEY = os.environ.get("GOOGLE_API_KEY", "")
+API_URL = os.environ.get(
+    "GEMINI_API_URL",
+    f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={API_KEY}"
+)
+API_TIMEOUT = int(os.environ.get("GEMINI_TIMEOUT", 30))
+# streamGenerateContent (server-sent events) for /upload/stream; derived from API_URL when it is the public endpoint
+STREAM_URL = os.environ.get(
+    "GEMINI_STREAM_URL",
+    API_URL.replace(":generateContent", ":streamGenerateContent", 1) + "&alt=sse" if ":generateContent?" in API_URL else ""
+)
+GEMINI_STREAMING = os.environ.get("GEMINI_STREAMING", "1") == "1"
+# a custom endpoint (local stub, proxy) may not need a key
+API_CONFIGURED = bool(API_KEY) or "GEMINI_API_URL" in os.environ
+
+GEMINI_POOL_SIZE = int(os.environ.get("GEMINI_POOL_SIZE", 16))            # keep-alive connections to the API host
+GEMINI_ASYNC_POOL_SIZE = int(os.environ.get("GEMINI_ASYNC_POOL_SIZE", 100))   # same, for the async client (ASGI mode)
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 3))
+GEMINI_BACKOFF_BASE = float(os.environ.get("GEMINI_BACKOFF_BASE", 0.5))   # seconds, doubled per attempt
+GEMINI_BACKOFF_MAX = float(os.environ.get("GEMINI_BACKOFF_MAX", 20))
+GEMINI_RATE_PER_SEC = float(os.environ.get("GEMINI_RATE_PER_SEC", 5))     # client-side limit, 0 disables
+GEMINI_RATE_BURST = int(os.environ.get("GEMINI_RATE_BURST", 10))
+GEMINI_BREAKER_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_THRESHOLD", 5))   # consecutive failed calls to open
+GEMINI_BREAKER_RESET = float(os.environ.get("GEMINI_BREAKER_RESET", 30))        # seconds before a trial call
+# list prices for cost estimates (/upload/preflight), USD per million tokens
+GEMINI_INPUT_USD_PER_MTOK = float(os.environ.get("GEMINI_INPUT_USD_PER_MTOK", 0.30))
+GEMINI_OUTPUT_USD_PER_MTOK = float(os.environ.get("GEMINI_OUTPUT_USD_PER_MTOK", 2.50))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+SYSTEM_INSTRUCTION = """You are a legal-tech assistant.
+Step 1: Identify the type of document (contract, NDA, employment letter, lease, terms of service, etc.).
+Step 2: List potentially missing clauses or essential legal elements.
+Step 3: Highlight risks or red flags if present.
+Step 4: Return only valid JSON that matches the described schema.
+"""
+
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "document_type": {"type": "STRING"},
+        "analysis_summary": {"type": "STRING"},
+        "missing_items": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "item": {"type": "STRING"},
+                    "reason": {"type": "STRING"}
+                }
+            }
+        },
+        "risks": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        }
+    }
+}
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+class RateLimitTimeout(requests.exceptions.RequestException):
+    pass
+
+def failed_analysis(summary):
+    return {"document_type": "Unknown", "analysis_summary": summary, "missing_items": [], "risks": []}
+
+# -----------------------
+# Token bucket rate limiter
+# -----------------------
+class TokenBucket:
+    def __init__(self, rate=GEMINI_RATE_PER_SEC, burst=GEMINI_RATE_BURST):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # 0 if a token was taken, else the seconds until the next one is due
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        # blocks until a token is available; False if that would take longer than timeout
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=None):
+        # acquire() for the event loop: waits without blocking other requests
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+# -----------------------
+# Circuit breaker
+# -----------------------
+class CircuitBreaker:
+    # closed -> open after `threshold` consecutive failures; after `reset_after` one
+    # trial call is let through (half-open) and its outcome closes or re-opens it
+    def __init__(self, threshold=GEMINI_BREAKER_THRESHOLD, reset_after=GEMINI_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        # None when refused, else a ticket for abandon(): 0 for a normal call, the trial's number
+        # for the half-open trial
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self._trial += 1
+                return self._trial
+            return None
+
+    def abandon(self, ticket):
+        # a call that ended without an outcome (cancelled, interrupted): if it was the trial
+        # still in flight, the next call becomes the trial instead
+        with self._lock:
+            if ticket and self._trial_in_flight and ticket == self._trial:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or (self.threshold and self.failures >= self.threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+# -----------------------
+# HTTP client
+# -----------------------
+def parse_retry_after(value):
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+class _GeminiClientBase:
+    # retry/backoff policy, limiter, breaker and stats shared by the sync and async clients
+    def __init__(self, url=API_URL, timeout=API_TIMEOUT, max_retries=GEMINI_MAX_RETRIES,
+                 backoff_base=GEMINI_BACKOFF_BASE, backoff_max=GEMINI_BACKOFF_MAX,
+                 limiter=None, breaker=None):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = limiter or TokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "short_circuited": 0, "rate_limited": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def backoff(self, attempt, retry_after=None):
+        # full jitter; a server-supplied Retry-After is honored as the floor
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    @staticmethod
+    def _observe_usage(data):
+        usage = (data or {}).get("usageMetadata") if isinstance(data, dict) else None
+        if not usage:
+            return
+        for kind, key in (("prompt", "promptTokenCount"), ("output", "candidatesTokenCount"), ("total", "totalTokenCount")):
+            if usage.get(key) is not None:
+                LLM_TOKENS.observe(usage[key], kind=kind)
+
+    def _check_breaker(self):
+        self._count("calls")
+        ticket = self.breaker.allow()
+        if ticket is None:
+            self._count("short_circuited")
+            raise CircuitOpenError("Gemini API circuit is open after repeated failures; failing fast")
+        return ticket
+
+    def _retrying(self, attempt, last_error, retry_after):
+        # counts and logs a retry; returns the delay before the next attempt
+        self._count("retries")
+        reason = str(last_error.response.status_code) if getattr(last_error, "response", None) is not None else type(last_error).__name__
+        LLM_RETRIES.inc(reason=reason)
+        delay = self.backoff(attempt, retry_after)
+        log.warning("gemini call retrying", extra={"attempt": attempt + 1, "reason": reason, "delay_s": round(delay, 3)})
+        return delay
+
+    def _failed(self, last_error):
+        self._count("failures")
+        self.breaker.record_failure()
+        log.error("gemini call failed", extra={"error": str(last_error), "breaker_state": self.breaker.state})
+        return last_error
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+        out["breaker_state"] = self.breaker.state
+        out["breaker_failures"] = self.breaker.failures
+        return out
+
+class GeminiClient(_GeminiClientBase):
+    def __init__(self, url=API_URL, timeout=API_TIMEOUT, max_retries=GEMINI_MAX_RETRIES,
+                 backoff_base=GEMINI_BACKOFF_BASE, backoff_max=GEMINI_BACKOFF_MAX,
+                 limiter=None, breaker=None, pool_size=GEMINI_POOL_SIZE):
+        super().__init__(url, timeout, max_retries, backoff_base, backoff_max, limiter, breaker)
+        # one keep-alive session: TLS to the API host is negotiated once per pooled connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def post_json(self, payload, url=None, timeout=None):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            data = self._post_json(payload, url, timeout)
+            outcome = "ok"
+            self._observe_usage(data)
+            return data
+        except CircuitOpenError:
+            outcome = "short_circuited"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            LLM_SECONDS.observe(elapsed, outcome=outcome)
+            record_timing("llm", elapsed)
+
+    def stream_events(self, payload, url=None, timeout=None):
+        # streamGenerateContent with alt=sse: yields each response chunk as it arrives. Retries
+        # only happen before the stream starts; a broken stream raises like a failed call
+        started = time.perf_counter()
+        outcome = "error"
+        ticket = None
+        try:
+            usage = None
+            ticket = self._check_breaker()
+            resp = self._send(payload, url or STREAM_URL, timeout, stream=True)
+            try:
+                with resp:
+                    for line in resp.iter_lines():
+                        if not line.startswith(b"data:"):
+                            continue
+                        event = json.loads(line[5:])
+                        usage = event.get("usageMetadata") or usage
+                        yield event
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # the stream broke after the headers: a failed call like any other
+                raise self._failed(e)
+            # only a stream read to the end is a success (a consumer that stops early is neither)
+            self.breaker.record_success()
+            outcome = "ok"
+            self._observe_usage({"usageMetadata": usage})
+        except CircuitOpenError:
+            outcome = "short_circuited"
+            raise
+        finally:
+            self.breaker.abandon(ticket)
+            elapsed = time.perf_counter() - started
+            LLM_SECONDS.observe(elapsed, outcome=outcome)
+            record_timing("llm", elapsed)
+
+    def _post_json(self, payload, url, timeout):
+        ticket = self._check_breaker()
+        try:
+            resp = self._send(payload, url, timeout)
+            self.breaker.record_success()
+        finally:
+            self.breaker.abandon(ticket)
+        return resp.json()
+
+    def _send(self, payload, url, timeout, stream=False):
+        # the retrying POST; returns the successful response (body unread when stream=True).
+        # Failures are recorded on the breaker here, success by the caller once the body is read
+        body = json.dumps(payload)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.limiter.acquire(timeout=timeout or self.timeout):
+                # our own throttling, not an upstream failure: the breaker is left alone
+                self._count("rate_limited")
+                raise RateLimitTimeout("Client-side rate limit: no request slot within timeout")
+            self._count("attempts")
+            retry_after = None
+            resp = None
+            attempt_started = time.perf_counter()
+            try:
+                resp = self.session.post(url or self.url, data=body, timeout=timeout or self.timeout, stream=stream)
+                LLM_ATTEMPT_SECONDS.observe(time.perf_counter() - attempt_started, status=resp.status_code)
+                if resp.status_code not in RETRY_STATUSES:
+                    resp.raise_for_status()
+                    return resp
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                resp.close()
+                last_error = requests.exceptions.HTTPError(f"{resp.status_code} Server Error for url: {resp.url}", response=resp)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                LLM_ATTEMPT_SECONDS.observe(time.perf_counter() - attempt_started, status=type(e).__name__)
+                last_error = e
+            except requests.exceptions.HTTPError as e:
+                # 4xx other than 429: retrying will not help, and it is not an outage
+                resp.close()
+                self.breaker.record_success()
+                raise e
+            except Exception as e:
+                if resp is not None:
+                    resp.close()
+                # not retryable (invalid URL, redirect loop, broken body) but still a failed call
+                raise self._failed(e)
+            if attempt < self.max_retries:
+                time.sleep(self._retrying(attempt, last_error, retry_after))
+        raise self._failed(last_error)
+
+class AsyncGeminiClient(_GeminiClientBase):
+    # the same call over httpx for the ASGI app: a request waiting on Gemini holds a coroutine,
+    # not a worker. The httpx client is opened on first use, inside the serving event loop
+    def __init__(self, url=API_URL, timeout=API_TIMEOUT, max_retries=GEMINI_MAX_RETRIES,
+                 backoff_base=GEMINI_BACKOFF_BASE, backoff_max=GEMINI_BACKOFF_MAX,
+                 limiter=None, breaker=None, pool_size=GEMINI_ASYNC_POOL_SIZE):
+        super().__init__(url, timeout, max_retries, backoff_base, backoff_max, limiter, breaker)
+        self.pool_size = pool_size
+        self._http = None
+
+    def _client(self):
+        if self._http is None:
+            if httpx is None:
+                raise RuntimeError("The async Gemini client needs the httpx package")
+            self._http = httpx.AsyncClient(
+                headers={"Content-Type": "application/json"},
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            http, self._http = self._http, None
+            await http.aclose()
+
+    async def post_json(self, payload, url=None, timeout=None):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            data = await self._post_json(payload, url, timeout)
+            outcome = "ok"
+            self._observe_usage(data)
+            return data
+        except CircuitOpenError:
+            outcome = "short_circuited"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            LLM_SECONDS.observe(elapsed, outcome=outcome)
+            record_timing("llm", elapsed)
+
+    async def _post_json(self, payload, url, timeout):
+        # a 200 with a body that is not JSON raises ValueError here, after the breaker recorded
+        # the call as a success: same as the sync client
+        return (await self._send(payload, url, timeout)).json()
+
+    async def _send(self, payload, url, timeout):
+        # the retrying POST; returns the successful response
+        ticket = self._check_breaker()
+        try:
+            http = self._client()
+            body = json.dumps(payload)
+            last_error = None
+            for attempt in range(self.max_retries + 1):
+                if not await self.limiter.acquire_async(timeout=timeout or self.timeout):
+                    # our own throttling, not an upstream failure: the breaker is left alone
+                    self._count("rate_limited")
+                    raise RateLimitTimeout("Client-side rate limit: no request slot within timeout")
+                self._count("attempts")
+                retry_after = None
+                attempt_started = time.perf_counter()
+                try:
+                    resp = await http.post(url or self.url, content=body, timeout=timeout or self.timeout)
+                    LLM_ATTEMPT_SECONDS.observe(time.perf_counter() - attempt_started, status=resp.status_code)
+                    if resp.status_code not in RETRY_STATUSES:
+                        resp.raise_for_status()
+                        self.breaker.record_success()
+                        return resp
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                    last_error = httpx.HTTPStatusError(f"{resp.status_code} Server Error for url: {resp.url}",
+                                                       request=resp.request, response=resp)
+                except httpx.TransportError as e:
+                    LLM_ATTEMPT_SECONDS.observe(time.perf_counter() - attempt_started, status=type(e).__name__)
+                    last_error = e
+                except httpx.HTTPStatusError as e:
+                    self.breaker.record_success()
+                    raise e
+                except Exception as e:
+                    raise self._failed(e)
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._retrying(attempt, last_error, retry_after))
+            raise self._failed(last_error)
+        finally:
+            self.breaker.abandon(ticket)
+
+client = GeminiClient()
+# one rate budget and one outage state per process, whichever client makes the call
+async_client = AsyncGeminiClient(limiter=client.limiter, breaker=client.breaker)
+
+# -----------------------
+# Payload + single model call
+# -----------------------
+def build_payload(user_prompt, schema=RESPONSE_SCHEMA):
+    return {
+        "contents": [{"parts": [{"text": user_prompt}]}],
+        "systemInstruction": {"parts": [{"text": SYSTEM_INSTRUCTION}]},
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "responseSchema": schema
+        }
+    }
+
+def decode_analysis(text, schema=RESPONSE_SCHEMA):
+    # returns (parsed_json, ok): schema-constrained JSON parsed as is, anything else scanned for
+    # the first JSON object, and the result checked against the schema the call asked for
+    try:
+        parsed, path = decode_json(text)
+    except DecodeError as e:
+        LLM_DECODES.inc(path="failed")
+        return failed_analysis(f"Analysis failed: {e}"), False
+    errors = compile_schema(schema)(parsed) if schema else []
+    if errors:
+        LLM_DECODES.inc(path="invalid")
+        log.warning("model output does not match the response schema", extra={"errors": errors[:5]})
+        return failed_analysis("Analysis failed: Model output did not match the response schema."), False
+    LLM_DECODES.inc(path=path)
+    return parsed, True
+
+def parse_model_response(resp_json, schema=RESPONSE_SCHEMA):
+    # returns (parsed_json, ok)
+    try:
+        text = response_text(resp_json)
+    except DecodeError as e:
+        LLM_DECODES.inc(path="failed")
+        return failed_analysis(f"Analysis failed: {e}"), False
+    return decode_analysis(text, schema)
+
+def _payload_schema(payload):
+    return payload.get("generationConfig", {}).get("responseSchema")
+
+def call_model(payload):
+    # returns (parsed_json, ok)
+    try:
+        return parse_model_response(client.post_json(payload), _payload_schema(payload))
+    except requests.exceptions.RequestException as e:
+        return failed_analysis(f"Analysis failed: API error: {str(e)}"), False
+
+# ValueError: a body that is not JSON (requests raises its own RequestException subclass for it)
+_ASYNC_API_ERRORS = (requests.exceptions.RequestException, ValueError) + ((httpx.HTTPError,) if httpx else ())
+
+async def call_model_async(payload):
+    # call_model over the async client (ASGI mode)
+    try:
+        return parse_model_response(await async_client.post_json(payload), _payload_schema(payload))
+    except _ASYNC_API_ERRORS as e:
+        return failed_analysis(f"Analysis failed: API error: {str(e)}"), False
+
+def stream_model(payload):
+    # call_model over streamGenerateContent: yields ("partial", dict) as more of the JSON
+    # completes (see PartialJSON for how often), then ("final", (parsed_json, ok)). Without a
+    # stream endpoint it is a plain call_model with no partials
+    if not (GEMINI_STREAMING and STREAM_URL):
+        yield "final", call_model(payload)
+        return
+    decoder, last = PartialJSON(), None
+    try:
+        for event in client.stream_events(payload):
+            candidates = event.get("candidates") or []
+            piece = parts_text(candidates[0].get("content")) if candidates else ""
+            if not piece or not decoder.feed(piece):
+                continue
+            partial = decoder.value()
+            if partial and partial != last:
+                last = partial
+                yield "partial", partial
+    except (requests.exceptions.RequestException, ValueError) as e:
+        yield "final", (failed_analysis(f"Analysis failed: API error: {str(e)}"), False)
+        return
+    text = decoder.text()
+    if not text.strip():
+        LLM_DECODES.inc(path="failed")
+        yield "final", (failed_analysis("Analysis failed: No content in model response."), False)
+        return
+    yield "final", decode_analysis(text, _payload_schema(payload))
@@ -0,0 +1,176 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# -----------------------
+# Config
+# -----------------------
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_PREFIX = os.environ.get("METRICS_PREFIX", "lexify_")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+# -----------------------
+# Minimal Prometheus-style registry (text exposition format 0.0.4)
+# -----------------------
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = METRICS_PREFIX + name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_one(key, value))
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_one(self, key, value):
+        return [f"{self.name}_total{_label_str(self.labels, key)} {value}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]   # per-bucket counts, count, sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    def _render_one(self, key, state):
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets, state[0]):
+            cumulative += n
+            lines.append(f"{self.name}_bucket{_label_str(self.labels, key, [('le', f'{bound:g}')])} {cumulative}")
+        lines.append(f"{self.name}_bucket{_label_str(self.labels, key, [('le', '+Inf')])} {state[1]}")
+        lines.append(f"{self.name}_count{_label_str(self.labels, key)} {state[1]}")
+        lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {round(state[2], 6)}")
+        return lines
+
+def render(gauges=None):
+    # gauges: {group: stats dict} snapshots (pool, cache, llm client); nested dicts are flattened
+    out = []
+    for metric in _registry:
+        out.extend(metric.render())
+    for group, stats in (gauges or {}).items():
+        for key, value in sorted(_flatten(stats).items()):
+            name = f"{METRICS_PREFIX}{group}_{key}"
+            out += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(out) + "\n"
+
+def _flatten(stats, prefix=""):
+    out = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            out.update(_flatten(value, f"{prefix}{key}_"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[prefix + key] = value
+    return out
+
+# -----------------------
+# Metrics used across the app
+# -----------------------
+HTTP_SECONDS = Histogram("http_request_seconds", "HTTP request latency", ("method", "route", "status"))
+EXTRACT_SECONDS = Histogram("extraction_seconds", "Text extraction time", ("file_type", "pages"))
+UPLOAD_BYTES = Histogram("upload_bytes", "Uploaded file size", ("file_type",), SIZE_BUCKETS)
+EXTRACTED_CHARS = Histogram("extracted_chars", "Extracted text length", ("file_type",), SIZE_BUCKETS)
+EXTRACTOR_SECONDS = Histogram("extractor_seconds", "Time per extraction engine run", ("engine", "outcome"))
+EXTRACTOR_PAGES = Counter("extractor_pages", "Pages handled per extraction engine", ("engine", "outcome"))
+ANALYSIS_SECONDS = Histogram("analysis_seconds", "Analysis time per document, cache hits included", ("mode", "cache"))
+LLM_SECONDS = Histogram("llm_request_seconds", "Gemini call latency including retries", ("outcome",))
+LLM_ATTEMPT_SECONDS = Histogram("llm_attempt_seconds", "Latency of a single Gemini HTTP attempt", ("status",))
+LLM_TOKENS = Histogram("llm_tokens", "Tokens per Gemini call", ("kind",), TOKEN_BUCKETS)
+LLM_RETRIES = Counter("llm_retries", "Gemini attempts that were retried", ("reason",))
+LLM_DECODES = Counter("llm_decodes", "Model responses by decode path", ("path",))
+DB_SECONDS = Histogram("db_query_seconds", "Database statement latency", ("op",))
+DB_POOL_WAIT_SECONDS = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection")
+
+def page_bucket(pages):
+    # page count as a bounded label
+    if pages is None:
+        return "unknown"
+    for bound in (1, 10, 50, 200):
+        if pages <= bound:
+            return f"<={bound}"
+    return ">200"
+
+# -----------------------
+# Per-request timing breakdown (Server-Timing)
+# -----------------------
+# a context variable rather than a thread-local: under the ASGI app many requests share the
+# event loop thread, each in its own task context
+_request_timings = ContextVar("request_timings", default=None)
+
+def begin_request():
+    _request_timings.set({})
+
+def end_request():
+    timings = _request_timings.get() or {}
+    _request_timings.set(None)
+    return timings
+
+def record_timing(name, seconds):
+    # only the request's own thread or task contributes; pool workers have no timings dict
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+def server_timing_header(timings):
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+@contextmanager
+def timed(histogram, timing_name=None, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        if timing_name:
+            record_timing(timing_name, elapsed)
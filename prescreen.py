@@ -0,0 +1,134 @@
+import os
+import re
+import json
+
+# -----------------------
+# Config
+# -----------------------
+PRESCREEN_HINTS = os.environ.get("PRESCREEN_HINTS", "0") == "1"   # pass pre-screen results to the model prompt
+PRESCREEN_RULES_PATH = os.environ.get("PRESCREEN_RULES_PATH", "")   # JSON file merged over the built-in dictionary
+
+# clause name -> patterns (regex fragments, case-insensitive) and the reason reported when none match
+DEFAULT_CLAUSES = {
+    "Governing Law": {
+        "patterns": [r"governing\s+law", r"governed\s+by\s+(?:and\s+construed\s+in\s+accordance\s+with\s+)?the\s+laws?\s+of",
+                     r"laws\s+of\s+the\s+state\s+of", r"jurisdiction\s+of\s+the\s+courts"],
+        "reason": "No governing law or jurisdiction clause was found.",
+    },
+    "Termination": {
+        "patterns": [r"terminat(?:e|ed|es|ion)\b", r"notice\s+of\s+termination", r"may\s+be\s+cancell?ed"],
+        "reason": "No termination clause was found.",
+    },
+    "Indemnity": {
+        "patterns": [r"indemnif(?:y|ies|ied|ication)", r"indemnit(?:y|ies)", r"hold\s+harmless"],
+        "reason": "No indemnification clause was found.",
+    },
+    "Limitation of Liability": {
+        "patterns": [r"limitation\s+of\s+liability", r"shall\s+not\s+be\s+liable", r"aggregate\s+liability",
+                     r"consequential\s+damages", r"liability\s+(?:is|shall\s+be)\s+limited"],
+        "reason": "No limitation of liability clause was found.",
+    },
+    "Confidentiality": {
+        "patterns": [r"confidential(?:ity)?\b", r"non-?disclosure", r"proprietary\s+information"],
+        "reason": "No confidentiality clause was found.",
+    },
+    "Signature Block": {
+        "patterns": [r"in\s+witness\s+whereof", r"signed\s+by", r"signature\s*:", r"authori[sz]ed\s+signatory",
+                     r"executed\s+(?:this|as\s+of)"],
+        "reason": "No signature block was found.",
+    },
+}
+
+DEFAULT_DOCUMENT_TYPES = {
+    "NDA": [r"non-?disclosure\s+agreement", r"confidentiality\s+agreement"],
+    "Lease": [r"\blease\s+agreement", r"\blandlord\b", r"\btenant\b"],
+    "Employment Agreement": [r"employment\s+(?:agreement|contract)", r"offer\s+of\s+employment", r"\bemployee\b"],
+    "Terms of Service": [r"terms\s+of\s+(?:service|use)"],
+    "Service Agreement": [r"services?\s+agreement", r"statement\s+of\s+work"],
+}
+
+def load_rules(path=PRESCREEN_RULES_PATH):
+    # {"clauses": {name: {"patterns": [...], "reason": "..."}}, "document_types": {name: [...]}}
+    clauses, types = dict(DEFAULT_CLAUSES), dict(DEFAULT_DOCUMENT_TYPES)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            custom = json.load(f)
+        clauses.update(custom.get("clauses", {}))
+        types.update(custom.get("document_types", {}))
+    return clauses, types
+
+# -----------------------
+# Engine: one compiled alternation per table (document types, clauses), one finditer pass each
+# -----------------------
+def _compile(table, groups):
+    # table: name -> patterns; fills groups (group name -> rule name) and returns the regex
+    alternatives = []
+    for name, patterns in table.items():
+        group = f"g{len(groups)}"
+        groups[group] = name
+        alternatives.append(f"(?P<{group}>{'|'.join(f'(?:{p})' for p in patterns)})")
+    # every rule starts at a word; the leading \b lets the scanner skip mid-word positions cheaply
+    return re.compile(r"\b(?:" + "|".join(alternatives) + ")", re.IGNORECASE) if alternatives else None
+
+class ClauseScreen:
+    def __init__(self, clauses=None, document_types=None):
+        if clauses is None or document_types is None:
+            default_clauses, default_types = load_rules()
+            clauses = default_clauses if clauses is None else clauses
+            document_types = default_types if document_types is None else document_types
+        self.clauses = clauses
+        # separate passes: finditer matches do not overlap, so a type phrase such as
+        # "confidentiality agreement" must not hide the clause text inside it
+        self._type_groups, self._clause_groups = {}, {}
+        self._type_regex = _compile(document_types, self._type_groups)
+        self._clause_regex = _compile({k: v["patterns"] for k, v in clauses.items()}, self._clause_groups)
+
+    def scan(self, text):
+        found, type_hits = {}, {}
+        if self._type_regex is not None and text:
+            for m in self._type_regex.finditer(text):
+                name = self._type_groups[m.lastgroup]
+                type_hits[name] = type_hits.get(name, 0) + 1
+        if self._clause_regex is not None and text:
+            for m in self._clause_regex.finditer(text):
+                name = self._clause_groups[m.lastgroup]
+                if name in found:
+                    found[name]["count"] += 1
+                else:
+                    found[name] = {"item": name, "start": m.start(), "end": m.end(), "match": m.group(0), "count": 1}
+        missing = [{"item": name, "reason": rule.get("reason") or f"No {name.lower()} clause was found."}
+                   for name, rule in self.clauses.items() if name not in found]
+        document_type = max(type_hits, key=type_hits.get) if type_hits else "Unknown"
+        return {"document_type": document_type, "found": list(found.values()), "missing_items": missing}
+
+_screen = None
+
+def get_screen():
+    global _screen
+    if _screen is None:
+        _screen = ClauseScreen()
+    return _screen
+
+def prescreen(text):
+    return get_screen().scan(text)
+
+# -----------------------
+# Use of the results: fast mode and prompt hints
+# -----------------------
+def fast_analysis(screen):
+    # an analysis built only from the pre-screen, no model call
+    found = ", ".join(f["item"] for f in screen["found"]) or "none"
+    summary = (f"Rule-based pre-screen only (no AI review): found {len(screen['found'])} of "
+               f"{len(screen['found']) + len(screen['missing_items'])} standard clauses ({found}).")
+    return {"document_type": screen["document_type"], "analysis_summary": summary,
+            "missing_items": screen["missing_items"], "risks": [], "prescreen": screen["found"]}
+
+def prompt_hints(screen):
+    # leads for the model, not findings: a single keyword match is not a clause
+    lines = ["A keyword pre-screen flagged the matches below. Treat them as leads only: report a clause as missing "
+             "whenever the document does not actually contain it, whatever the pre-screen says."]
+    for f in screen["found"]:
+        lines.append(f"- found {f['item']} at offset {f['start']}: \"{f['match']}\"")
+    for it in screen["missing_items"]:
+        lines.append(f"- not found: {it['item']}")
+    return "\n".join(lines)
@@ -0,0 +1,189 @@
+import io
+import os
+import json
+
+# -----------------------
+# Config
+# -----------------------
+DECODE_SCAN_MAX_ATTEMPTS = int(os.environ.get("DECODE_SCAN_MAX_ATTEMPTS", 64))   # "{" positions tried when the text is not bare JSON
+
+class DecodeError(ValueError):
+    pass
+
+# -----------------------
+# Response text: every text part of the first candidate, in order
+# -----------------------
+def parts_text(content):
+    parts = content.get("parts") if isinstance(content, dict) else None
+    if not isinstance(parts, list):
+        return ""
+    # thinking models return their reasoning as parts flagged "thought"; only the answer is JSON
+    return "".join(p.get("text") or "" for p in parts if isinstance(p, dict) and not p.get("thought"))
+
+def response_text(resp_json):
+    candidates = resp_json.get("candidates") if isinstance(resp_json, dict) else None
+    if not candidates:
+        blocked = (resp_json or {}).get("promptFeedback", {}).get("blockReason") if isinstance(resp_json, dict) else None
+        raise DecodeError(f"Model blocked the prompt ({blocked})." if blocked else "Unexpected response format from LLM.")
+    text = parts_text(candidates[0].get("content") if isinstance(candidates[0], dict) else None)
+    if not text.strip():
+        raise DecodeError("No content in model response.")
+    return text
+
+# -----------------------
+# JSON: direct parse for schema-constrained output, raw_decode scan for anything wrapped in prose or fences
+# -----------------------
+_decoder = json.JSONDecoder()
+
+def scan_json_object(text, max_attempts=None):
+    # the first complete JSON object in text; each attempt is one raw_decode from a "{"
+    max_attempts = max_attempts or DECODE_SCAN_MAX_ATTEMPTS
+    pos = text.find("{")
+    for _ in range(max_attempts):
+        if pos == -1:
+            break
+        try:
+            return _decoder.raw_decode(text, pos)[0]
+        except ValueError:
+            pos = text.find("{", pos + 1)
+    return None
+
+def decode_json(text):
+    # returns (object, path) with path "direct" or "scan"; raises DecodeError
+    try:
+        value, path = json.loads(text), "direct"
+    except ValueError:
+        value, path = scan_json_object(text), "scan"
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]   # a lone object wrapped in an array
+    if not isinstance(value, dict):
+        raise DecodeError("Model returned non-JSON output.")
+    return value, path
+
+# -----------------------
+# responseSchema validation (Gemini's OpenAPI subset), compiled once per schema object
+# -----------------------
+_TYPES = {"STRING": (str,), "NUMBER": (int, float), "INTEGER": (int,), "BOOLEAN": (bool,), "ARRAY": (list,), "OBJECT": (dict,)}
+_compiled = {}
+
+def _compile(schema):
+    kind = str(schema.get("type", "")).upper()
+    types = _TYPES.get(kind)
+    enum = set(schema["enum"]) if schema.get("enum") else None
+    nullable = schema.get("nullable", False)
+    properties = {k: _compile(v) for k, v in (schema.get("properties") or {}).items()}
+    required = list(schema.get("required") or ())
+    items = _compile(schema["items"]) if isinstance(schema.get("items"), dict) else None
+
+    def validate(value, path, errors):
+        if value is None:
+            if not nullable:
+                errors.append(f"{path}: null")
+            return
+        if types and (not isinstance(value, types) or (kind in ("NUMBER", "INTEGER") and isinstance(value, bool))):
+            errors.append(f"{path}: expected {kind.lower()}")
+            return
+        if enum is not None and value not in enum:
+            errors.append(f"{path}: not one of the allowed values")
+        if kind == "OBJECT":
+            for key in required:
+                if key not in value:
+                    errors.append(f"{path}.{key}: missing")
+            for key, check in properties.items():
+                # optional properties may come back as null
+                if key in value and not (value[key] is None and key not in required):
+                    check(value[key], f"{path}.{key}", errors)
+        elif kind == "ARRAY" and items:
+            for i, item in enumerate(value):
+                items(item, f"{path}[{i}]", errors)
+
+    return validate
+
+def compile_schema(schema):
+    # validator(value) -> [error strings]; the schema object is kept so its id cannot be reused
+    entry = _compiled.get(id(schema))
+    if entry is None or entry[0] is not schema:
+        check = _compile(schema)
+
+        def validator(value):
+            errors = []
+            check(value, "$", errors)
+            return errors
+
+        entry = _compiled[id(schema)] = (schema, validator)
+    return entry[1]
+
+# -----------------------
+# Streaming: best-effort parse of JSON that has only partly arrived
+# -----------------------
+_CLOSERS = {"{": "}", "[": "]"}
+
+class PartialJSON:
+    # feed() scans only the new text, tracking the last point where every value so far is
+    # complete; value() closes the open arrays and objects at that point and parses. feed() says
+    # a re-parse is worth it only once that point has moved a quarter past the last parse, so the
+    # parses of a growing answer add up to linear work, not one full parse per streamed piece
+    def __init__(self):
+        self._buf = io.StringIO()
+        self._size = 0
+        self._stack = []
+        self._in_string = self._escape = self._is_key = self._expect_key = False
+        self._cut, self._cut_stack = None, None
+        self._parsed_cut = None
+
+    def feed(self, piece):
+        stack = self._stack
+        in_string, escape, is_key, expect_key = self._in_string, self._escape, self._is_key, self._expect_key
+        for offset, ch in enumerate(piece, self._size):
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+                    if not is_key:
+                        self._cut, self._cut_stack = offset + 1, list(stack)
+                continue
+            if ch == '"':
+                in_string = True
+                is_key = expect_key
+                expect_key = False
+            elif ch in "{[":
+                stack.append(ch)
+                expect_key = ch == "{"
+                self._cut, self._cut_stack = offset + 1, list(stack)
+            elif ch in "}]":
+                if stack:
+                    stack.pop()
+                self._cut, self._cut_stack = offset + 1, list(stack)
+            elif ch == ",":
+                self._cut, self._cut_stack = offset, list(stack)   # the value before the comma is complete
+                expect_key = bool(stack) and stack[-1] == "{"
+        self._in_string, self._escape, self._is_key, self._expect_key = in_string, escape, is_key, expect_key
+        self._buf.write(piece)
+        self._size += len(piece)
+        if self._cut is None or self._cut == self._parsed_cut:
+            return False
+        return self._parsed_cut is None or self._cut - self._parsed_cut >= self._parsed_cut // 4
+
+    def text(self):
+        return self._buf.getvalue()
+
+    def value(self):
+        # the document up to the last complete value, or None before the opening brace
+        if self._cut is None:
+            return None
+        self._parsed_cut = self._cut
+        candidate = self._buf.getvalue()[:self._cut].rstrip().rstrip(",") + "".join(_CLOSERS[c] for c in reversed(self._cut_stack))
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
+
+def partial_json(text):
+    # one-shot PartialJSON: drops a dangling key, comma, half-written literal or unfinished string
+    decoder = PartialJSON()
+    decoder.feed(text)
+    return decoder.value()
@@ -0,0 +1,266 @@
+import os
+import re
+import json
+import base64
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+
+from db import ensure_index, get_db_connection
+from intake import UPLOAD_FOLDER
+
+# -----------------------
+# Config
+# -----------------------
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "mysql")     # mysql (FULLTEXT) | sqlite (embedded FTS5)
+SEARCH_SQLITE_PATH = os.environ.get("SEARCH_SQLITE_PATH", os.path.join(UPLOAD_FOLDER, "search.sqlite3"))
+SEARCH_CONTENT_CHARS = int(os.environ.get("SEARCH_CONTENT_CHARS", 16000))  # leading text indexed per document (0 = summary only)
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", 20))
+SEARCH_MAX_PAGE_SIZE = 100
+SNIPPET_CHARS = 240
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+class SearchError(Exception):
+    pass
+
+# -----------------------
+# Query parsing helpers
+# -----------------------
+def parse_filters(args):
+    # args: request.args-like mapping -> dict of validated filters
+    q = (args.get("q") or "").strip()
+    if not q or not _TERM_RE.search(q):
+        raise SearchError("Missing search query (q)")
+    try:
+        limit = min(max(int(args.get("limit", SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        raise SearchError("limit must be an integer")
+    filters = {"q": q, "limit": limit, "document_type": args.get("document_type") or None,
+               "date_from": None, "date_to": None, "cursor": decode_cursor(args.get("cursor"))}
+    for key, name in (("date_from", "from"), ("date_to", "to")):
+        value = args.get(name)
+        if value:
+            try:
+                filters[key] = datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise SearchError(f"{name} must be a date (YYYY-MM-DD)")
+    if filters["date_to"]:
+        filters["date_to"] += timedelta(days=1)   # inclusive end date
+    return filters
+
+def encode_cursor(score, key):
+    raw = json.dumps({"s": score, "k": key}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(data["s"]), int(data["k"])
+    except Exception:
+        raise SearchError("Invalid cursor")
+
+def make_snippet(text, terms):
+    if not text:
+        return ""
+    lower = text.lower()
+    pos = min((p for p in (lower.find(t.lower()) for t in terms) if p >= 0), default=0)
+    start = max(pos - SNIPPET_CHARS // 3, 0)
+    snippet = " ".join(text[start:start + SNIPPET_CHARS].split())
+    return ("…" if start else "") + snippet + ("…" if start + SNIPPET_CHARS < len(text) else "")
+
+def excerpt(text, limit=None):
+    # the index holds a bounded prefix, not a second full copy of every document: the text
+    # itself lives once, deduplicated, in document_contents
+    limit = SEARCH_CONTENT_CHARS if limit is None else limit
+    return (text or "")[:max(limit, 0)]
+
+def _format_date(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+# -----------------------
+# MySQL FULLTEXT backend
+# -----------------------
+class MySQLSearch:
+    name = "mysql"
+
+    def ensure_schema(self, cur):
+        # an excerpt of the text (see excerpt()) in its own table so the documents table stays
+        # narrow; /search is the only reader. TEXT holds SEARCH_CONTENT_CHARS at 4 bytes a char
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS document_search_text (
+                doc_id INT PRIMARY KEY,
+                content TEXT,
+                analysis_summary TEXT
+            ) CHARACTER SET = utf8mb4;
+        """)
+        ensure_index(cur, "document_search_text", "ft_search_text", "(content, analysis_summary)", kind="FULLTEXT")
+
+    def index(self, docs):
+        rows = [(d["id"], excerpt(d.get("content")), d.get("analysis_summary") or "") for d in docs if d.get("id")]
+        if not rows:
+            return
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.executemany("REPLACE INTO document_search_text (doc_id, content, analysis_summary) VALUES (%s, %s, %s)", rows)
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+    def search(self, f):
+        terms = _TERM_RE.findall(f["q"])
+        where, params = ["MATCH(t.content, t.analysis_summary) AGAINST (%s IN NATURAL LANGUAGE MODE)"], [f["q"]]
+        if f["document_type"]:
+            where.append("d.document_type = %s")
+            params.append(f["document_type"])
+        if f["date_from"]:
+            where.append("d.created_at >= %s")
+            params.append(f["date_from"])
+        if f["date_to"]:
+            where.append("d.created_at < %s")
+            params.append(f["date_to"])
+        having, having_params = "", []
+        if f["cursor"]:
+            having = "HAVING score < %s OR (score = %s AND id < %s)"
+            having_params = [f["cursor"][0], f["cursor"][0], f["cursor"][1]]
+
+        # the snippet is cut server-side around the first term so the indexed text never leaves MySQL
+        sql = f"""
+            SELECT d.id AS id, d.filename, d.document_type, d.created_at,
+                   MATCH(t.content, t.analysis_summary) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score,
+                   SUBSTRING(t.content, GREATEST(LOCATE(%s, t.content) - {SNIPPET_CHARS // 3}, 1), {SNIPPET_CHARS + 1}) AS snippet_src,
+                   t.analysis_summary
+            FROM document_search_text t
+            JOIN documents d ON d.id = t.doc_id
+            WHERE {" AND ".join(where)}
+            {having}
+            ORDER BY score DESC, d.id DESC
+            LIMIT %s
+        """
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(sql, [f["q"], terms[0]] + params + having_params + [f["limit"] + 1])
+            rows = cur.fetchall()
+            cur.close()
+        finally:
+            conn.close()
+
+        results = []
+        for r in rows[:f["limit"]]:
+            results.append({
+                "id": r["id"], "filename": r["filename"], "document_type": r["document_type"],
+                "created_at": _format_date(r["created_at"]), "score": round(float(r["score"]), 6),
+                "snippet": make_snippet(r["snippet_src"] or r["analysis_summary"], terms),
+            })
+        next_cursor = None
+        if len(rows) > f["limit"]:
+            # the unrounded score, so the next page's HAVING compares exactly
+            last = rows[f["limit"] - 1]
+            next_cursor = encode_cursor(float(last["score"]), last["id"])
+        return results, next_cursor
+
+# -----------------------
+# Embedded SQLite FTS5 backend (local testing, no MySQL needed)
+# -----------------------
+class SQLiteSearch:
+    name = "sqlite"
+
+    def __init__(self, path=SEARCH_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                    content, analysis_summary,
+                    doc_id UNINDEXED, filename UNINDEXED, document_type UNINDEXED, created_at UNINDEXED,
+                    tokenize = 'porter unicode61'
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def ensure_schema(self, cur):
+        pass
+
+    def index(self, docs):
+        # docs: iterable of dicts with id, filename, document_type, analysis_summary, content
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # as in MySQLSearch, an unsaved document (no id) is not indexed: it could never be replaced
+        rows = [(excerpt(d.get("content")), d.get("analysis_summary") or "", d["id"], d.get("filename"),
+                 d.get("document_type"), now) for d in docs if d.get("id")]
+        if rows:
+            with self._lock, self._connect() as conn:
+                # re-indexing a document replaces its entry
+                conn.executemany("DELETE FROM documents_fts WHERE doc_id = ?", [(r[2],) for r in rows])
+                conn.executemany("INSERT INTO documents_fts (content, analysis_summary, doc_id, filename, document_type, created_at) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def search(self, f):
+        terms = _TERM_RE.findall(f["q"])
+        match = " ".join('"' + t.replace('"', '""') + '"' for t in terms)   # implicit AND of literal terms
+        # bm25() is lower-is-better; negate it so scores and cursors read like MySQL's
+        where, params = ["documents_fts MATCH ?"], [match]
+        if f["document_type"]:
+            where.append("document_type = ?")
+            params.append(f["document_type"])
+        if f["date_from"]:
+            where.append("created_at >= ?")
+            params.append(f["date_from"].strftime("%Y-%m-%d %H:%M:%S"))
+        if f["date_to"]:
+            where.append("created_at < ?")
+            params.append(f["date_to"].strftime("%Y-%m-%d %H:%M:%S"))
+        if f["cursor"]:
+            where.append("(-bm25(documents_fts) < ? OR (-bm25(documents_fts) = ? AND rowid < ?))")
+            params += [f["cursor"][0], f["cursor"][0], f["cursor"][1]]
+        sql = f"""
+            SELECT rowid, doc_id, filename, document_type, created_at, -bm25(documents_fts) AS score,
+                   snippet(documents_fts, 0, '', '', '…', 32) AS snippet
+            FROM documents_fts
+            WHERE {" AND ".join(where)}
+            ORDER BY score DESC, rowid DESC
+            LIMIT ?
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(sql, params + [f["limit"] + 1]).fetchall()
+
+        results = [{"id": r["doc_id"], "filename": r["filename"], "document_type": r["document_type"],
+                    "created_at": r["created_at"], "score": r["score"], "snippet": r["snippet"]}
+                   for r in rows[:f["limit"]]]
+        next_cursor = None
+        if len(rows) > f["limit"]:
+            last = rows[f["limit"] - 1]
+            next_cursor = encode_cursor(last["score"], last["rowid"])
+        return results, next_cursor
+
+
+def make_backend(name=SEARCH_BACKEND):
+    if name == "sqlite":
+        return SQLiteSearch()
+    return MySQLSearch()
+
+# created on first use, so importing this module never touches the filesystem or the database
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend()
+        return _backend
@@ -0,0 +1,242 @@
+import os
+import re
+import sys
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import numpy as np
+except ImportError:   # optional: without it documents are not fingerprinted and /similar is off
+    np = None
+
+import content_store
+from db import get_db_connection
+from intake import UPLOAD_FOLDER
+from logconfig import configure_logging
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Config
+# -----------------------
+SIMILARITY_ENABLED = os.environ.get("SIMILARITY_ENABLED", "1") == "1" and np is not None
+SIMILARITY_INDEX_PATH = os.environ.get("SIMILARITY_INDEX_PATH", os.path.join(UPLOAD_FOLDER, "similarity.sqlite3"))
+SIMILARITY_SHINGLE_WORDS = int(os.environ.get("SIMILARITY_SHINGLE_WORDS", 5))
+# an upload at least this similar (estimated Jaccard of word shingles) to an analyzed document
+# reuses that analysis, adapted to the clause diff; 0 disables reuse
+SIMILARITY_REUSE_THRESHOLD = float(os.environ.get("SIMILARITY_REUSE_THRESHOLD", 0.9))
+SIMILARITY_PAGE_SIZE = int(os.environ.get("SIMILARITY_PAGE_SIZE", 10))
+SIMILARITY_MAX_PAGE_SIZE = 50
+# changing these invalidates the index (python similarity.py rebuild)
+PERMUTATIONS = 128      # MinHash signature length
+BANDS = 32              # LSH bands of 4 rows: pairs above ~0.45 similarity share a bucket in some band
+MIN_SHINGLES = 20       # shorter texts are not fingerprinted; a few words say nothing about a template
+CANDIDATES = 200        # bucket matches scored per lookup
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PRIME = 4294967311     # first prime above 2**32
+_MASK32 = 0xFFFFFFFF
+_SHINGLE_BASE = 1000003
+
+if np is not None:
+    _rng = np.random.default_rng(20240601)   # fixed: signatures must be comparable across processes and restarts
+    _A = _rng.integers(1, _MASK32, size=PERMUTATIONS, dtype=np.uint64)
+    _B = _rng.integers(0, _MASK32, size=PERMUTATIONS, dtype=np.uint64)
+
+# -----------------------
+# Fingerprints: MinHash over hashed word shingles
+# -----------------------
+def shingle_hashes(text, k=None):
+    # distinct 32-bit hashes of every k-word window of the lower-cased text
+    k = k or SIMILARITY_SHINGLE_WORDS
+    words = _WORD_RE.findall((text or "").lower())
+    n = len(words) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    tokens = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    hashes = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        hashes = (hashes * np.uint64(_SHINGLE_BASE) + tokens[j:j + n]) & np.uint64(_MASK32)
+    return np.unique(hashes)
+
+def minhash(hashes, block=4096):
+    # (a*x + b) mod p stays below 2**64 for 32-bit a, b and x
+    signature = np.full(PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(hashes), block):
+        values = (hashes[start:start + block, None] * _A + _B) % np.uint64(_PRIME)
+        signature = np.minimum(signature, values.min(axis=0))
+    return signature
+
+def band_keys(signature):
+    rows = PERMUTATIONS // BANDS
+    return [int.from_bytes(hashlib.blake2b(bytes([i]) + signature[i * rows:(i + 1) * rows].tobytes(), digest_size=8).digest(),
+                           "big", signed=True) for i in range(BANDS)]
+
+_recent = OrderedDict()   # text_hash -> signature: an upload is fingerprinted for the lookup and again at insert
+_recent_lock = threading.Lock()
+_RECENT_MAX = 64
+
+def fingerprint(text, key=None):
+    # MinHash signature of text, or None when it is too short to compare
+    if key is not None:
+        with _recent_lock:
+            if key in _recent:
+                _recent.move_to_end(key)
+                return _recent[key]
+    hashes = shingle_hashes(text)
+    signature = minhash(hashes) if len(hashes) >= MIN_SHINGLES else None
+    if key is not None:
+        with _recent_lock:
+            _recent[key] = signature
+            while len(_recent) > _RECENT_MAX:
+                _recent.popitem(last=False)
+    return signature
+
+def estimate_similarity(signatures, signature):
+    # share of matching MinHash values, an unbiased estimate of the Jaccard similarity
+    return (signatures == signature).mean(axis=-1)
+
+# -----------------------
+# On-disk index: signatures plus LSH band buckets in SQLite
+# -----------------------
+class SimilarityIndex:
+    def __init__(self, path=SIMILARITY_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")   # lookups do not wait on inserts from other workers
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS similarity_docs (
+                    doc_id INTEGER PRIMARY KEY,
+                    filename TEXT,
+                    document_type TEXT,
+                    analysis_ok INTEGER NOT NULL DEFAULT 0,
+                    signature BLOB NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS similarity_bands (band_key INTEGER NOT NULL, doc_id INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_similarity_bands_key ON similarity_bands (band_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_similarity_bands_doc ON similarity_bands (doc_id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, docs):
+        # docs: iterable of dicts with id, filename, document_type, analysis_ok, content and optionally
+        # text_hash; re-adding a document replaces its entry
+        rows, bands = [], []
+        for d in docs:
+            signature = fingerprint(d.get("content"), d.get("text_hash")) if d.get("id") else None
+            if signature is None:
+                continue
+            rows.append((d["id"], d.get("filename"), d.get("document_type"), 1 if d.get("analysis_ok") else 0,
+                         signature.tobytes()))
+            bands.extend((key, d["id"]) for key in band_keys(signature))
+        if not rows:
+            return 0
+        with self._lock, self._connect() as conn:
+            conn.executemany("DELETE FROM similarity_bands WHERE doc_id = ?", [(r[0],) for r in rows])
+            conn.executemany("REPLACE INTO similarity_docs (doc_id, filename, document_type, analysis_ok, signature) VALUES (?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO similarity_bands (band_key, doc_id) VALUES (?, ?)", bands)
+        return len(rows)
+
+    def signature(self, doc_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT signature FROM similarity_docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        return np.frombuffer(row[0], dtype=np.uint64) if row else None
+
+    def query(self, signature, limit=None, min_similarity=0.0, exclude=None, analyzed_only=False):
+        # top-k documents by estimated similarity; only documents sharing a band bucket are scored
+        limit = limit or SIMILARITY_PAGE_SIZE
+        keys = band_keys(signature)
+        with self._connect() as conn:
+            candidates = conn.execute(
+                f"SELECT doc_id FROM similarity_bands WHERE band_key IN ({','.join('?' * len(keys))}) "
+                "GROUP BY doc_id ORDER BY COUNT(*) DESC LIMIT ?",
+                keys + [CANDIDATES + 1]
+            ).fetchall()
+            ids = [r[0] for r in candidates if r[0] != exclude]
+            if not ids:
+                return []
+            rows = conn.execute(
+                f"SELECT doc_id, filename, document_type, analysis_ok, signature FROM similarity_docs "
+                f"WHERE doc_id IN ({','.join('?' * len(ids))})" + (" AND analysis_ok = 1" if analyzed_only else ""),
+                ids
+            ).fetchall()
+        if not rows:
+            return []
+        scores = estimate_similarity(np.frombuffer(b"".join(r[4] for r in rows), dtype=np.uint64).reshape(len(rows), PERMUTATIONS), signature)
+        ranked = sorted(zip(scores.tolist(), rows), key=lambda sr: (-sr[0], -sr[1][0]))
+        return [{"id": r[0], "filename": r[1], "document_type": r[2], "analysis_ok": bool(r[3]), "similarity": round(s, 4)}
+                for s, r in ranked[:limit] if s >= min_similarity]
+
+    def similar_to_text(self, text, key=None, **kwargs):
+        signature = fingerprint(text, key)
+        return self.query(signature, **kwargs) if signature is not None else []
+
+    def stats(self):
+        with self._connect() as conn:
+            docs = conn.execute("SELECT COUNT(*) FROM similarity_docs").fetchone()[0]
+        return {"documents": docs, "path": self.path, "reuse_threshold": SIMILARITY_REUSE_THRESHOLD}
+
+# created on first use, so importing this module never touches the filesystem
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    # the process-wide index, or None when similarity is disabled
+    global _index
+    if not SIMILARITY_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = SimilarityIndex()
+        return _index
+
+# -----------------------
+# Backfill: fingerprint documents saved before the index existed
+# -----------------------
+def rebuild(batch_size=200):
+    # python similarity.py rebuild — safe to re-run; walks documents by id
+    index = get_index()
+    if index is None:
+        raise RuntimeError("Similarity index is disabled (SIMILARITY_ENABLED=0 or numpy is not installed)")
+    last_id, indexed = 0, 0
+    while True:
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("SELECT id, filename, document_type, analysis_ok, content, content_hash FROM documents WHERE id > %s ORDER BY id LIMIT %s",
+                        (last_id, batch_size))
+            rows = cur.fetchall()
+            for r in rows:
+                if r.get("content_hash"):
+                    r["content"] = content_store.get_content(cur, r["content_hash"]) or r.get("content")
+            cur.close()
+        finally:
+            conn.close()
+        if not rows:
+            return indexed
+        last_id = rows[-1]["id"]
+        indexed += index.add(rows)
+        log.info("fingerprinted documents", extra={"indexed": indexed, "last_id": last_id})
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["rebuild"]:
+        configure_logging()
+        rebuild()
+    else:
+        print("usage: python similarity.py rebuild")
@@ -0,0 +1,55 @@
+from analysis import CHARS_PER_TOKEN, merge_analyses, split_into_chunks
+
+
+def _sections(n, words=30):
+    return "\n\n".join(f"Section {i}. " + " ".join(f"term{i}w{j}" for j in range(words)) for i in range(n))
+
+
+def test_chunks_stay_within_budget_and_cover_every_section():
+    text = _sections(20)
+    chunks = split_into_chunks(text, chunk_tokens=100, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(len(c) <= 100 * CHARS_PER_TOKEN for c in chunks)
+    assert "\n".join(chunks).count("Section ") == 20
+
+
+def test_chunks_split_on_section_boundaries_and_carry_overlap():
+    chunks = split_into_chunks(_sections(20, words=10), chunk_tokens=100, overlap_tokens=40)
+    assert len(chunks) > 1
+    assert all(c.startswith("Section ") for c in chunks)
+    # the last whole section of a chunk is repeated at the start of the next one
+    assert chunks[1].startswith(chunks[0].split("\n")[-1])
+
+
+def test_oversized_clause_is_split_by_sentence():
+    text = "Section 1. " + " ".join(f"Sentence {i} runs on for a while." for i in range(200))
+    chunks = split_into_chunks(text, chunk_tokens=50, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(len(c) <= 50 * CHARS_PER_TOKEN for c in chunks)
+
+
+def test_merge_deduplicates_and_drops_items_another_chunk_has():
+    results = [
+        ({"document_type": "NDA", "analysis_summary": "Part one.", "risks": ["Broad scope"],
+          "missing_items": [{"item": "Governing Law", "reason": "absent"}, {"item": "Termination", "reason": "absent"}],
+          "present_items": []}, True),
+        ({"document_type": "NDA", "analysis_summary": "Part two.", "risks": ["broad scope", "No cap"],
+          "missing_items": [{"item": "governing law", "reason": "absent"}], "present_items": ["Termination"]}, True),
+        ({"document_type": "Lease", "analysis_summary": "Part one.", "risks": [], "missing_items": [],
+          "present_items": []}, True),
+    ]
+    merged, ok = merge_analyses(results)
+    assert ok
+    assert merged["document_type"] == "NDA"
+    assert [m["item"] for m in merged["missing_items"]] == ["Governing Law"]
+    assert merged["risks"] == ["Broad scope", "No cap"]
+    assert merged["analysis_summary"] == "Part one. Part two."
+
+
+def test_merge_reports_partial_failure():
+    results = [({"document_type": "NDA", "analysis_summary": "Ok.", "missing_items": [], "risks": []}, True),
+               ({"document_type": "Unknown", "analysis_summary": "Analysis failed."}, False)]
+    merged, ok = merge_analyses(results)
+    assert not ok
+    assert merged["analysis_summary"].endswith("(Partial analysis: 1 of 2 sections could not be analyzed.)")
+    assert merge_analyses([])[1] is False
@@ -0,0 +1,96 @@
+import io
+import time
+import threading
+
+import pytest
+
+from jobs import JobQueue, MemoryJobStore, QueueFull
+
+
+def _queue(pipeline, **kwargs):
+    return JobQueue(pipeline, store=MemoryJobStore(), workers=1, extract_processes=1, **kwargs)
+
+
+def _wait(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ("saved", "analyzed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job still {queue.get(job_id)['status']}")
+
+
+def test_job_runs_through_stages_to_saved():
+    stages = []
+
+    def pipeline(filename, file_bytes, on_stage, extract, mode):
+        on_stage("analyzing")
+        stages.append(mode)
+        return {"id": 7, "filename": filename}
+
+    queue = _queue(pipeline)
+    try:
+        job = _wait(queue, queue.submit("a.txt", b"text", "chunked"))
+    finally:
+        queue.shutdown()
+    assert job["status"] == "saved"
+    assert job["result"] == {"id": 7, "filename": "a.txt"}
+    assert stages == ["chunked"]
+    assert queue.stats()["pending"] == 0
+
+
+def test_unsaved_result_is_reported_as_analyzed():
+    queue = _queue(lambda filename, file_bytes, on_stage, extract, mode: {"id": None})
+    try:
+        job = _wait(queue, queue.submit("a.txt", b"text"))
+    finally:
+        queue.shutdown()
+    assert job["status"] == "analyzed"
+
+
+def test_pipeline_error_fails_the_job():
+    def pipeline(filename, file_bytes, on_stage, extract, mode):
+        raise ValueError("broken upload")
+
+    queue = _queue(pipeline)
+    try:
+        job = _wait(queue, queue.submit("a.txt", b"text"))
+    finally:
+        queue.shutdown()
+    assert job["status"] == "failed"
+    assert job["error"] == "broken upload"
+
+
+def test_full_queue_refuses_until_a_job_finishes():
+    release = threading.Event()
+
+    def pipeline(filename, file_bytes, on_stage, extract, mode):
+        release.wait(5)
+        return {"id": 1}
+
+    queue = _queue(pipeline, max_pending=1)
+    try:
+        job_id = queue.submit("a.txt", b"text")
+        with pytest.raises(QueueFull):
+            queue.submit("b.txt", b"text")
+        release.set()
+        _wait(queue, job_id)
+        _wait(queue, queue.submit("c.txt", b"text"))
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_async_upload_answers_429_when_the_queue_is_full(monkeypatch):
+    import app
+
+    queue = _queue(lambda *args, **kwargs: {"id": 1}, max_pending=0)
+    monkeypatch.setattr(app, "_job_queue", queue)
+    try:
+        resp = app.app.test_client().post("/upload?async=1", data={"document": (io.BytesIO(b"Plain text."), "a.txt")},
+                                          content_type="multipart/form-data")
+    finally:
+        queue.shutdown()
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == str(app.JOB_RETRY_AFTER)
@@ -0,0 +1,127 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from llm_client import CircuitBreaker, CircuitOpenError, GeminiClient, RateLimitTimeout, TokenBucket
+
+OK_BODY = {"candidates": [{"content": {"parts": [{"text": "{}"}]}}]}
+
+
+class FakeGemini:
+    # answers each POST with the next scripted (status, headers); 200 once the script runs out
+    def __init__(self):
+        self.script = []
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                fake.requests += 1
+                status, headers = fake.script.pop(0) if fake.script else (200, {})
+                body = json.dumps(OK_BODY if status == 200 else {"error": status}).encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def gemini():
+    fake = FakeGemini()
+    yield fake
+    fake.close()
+
+
+def _client(url, **kwargs):
+    kwargs.setdefault("limiter", TokenBucket(rate=0))
+    kwargs.setdefault("breaker", CircuitBreaker(threshold=2, reset_after=0.2))
+    return GeminiClient(url=url, timeout=5, backoff_base=0.01, backoff_max=1, **kwargs)
+
+
+def test_retryable_status_is_retried(gemini):
+    gemini.script = [(503, {}), (500, {})]
+    client = _client(gemini.url)
+    assert client.post_json({}) == OK_BODY
+    assert gemini.requests == 3
+    assert client.stats()["retries"] == 2
+    assert client.breaker.state == "closed"
+
+
+def test_retry_after_is_honored(gemini):
+    gemini.script = [(429, {"Retry-After": "0.3"})]
+    client = _client(gemini.url)
+    started = time.monotonic()
+    client.post_json({})
+    assert time.monotonic() - started >= 0.3
+    assert gemini.requests == 2
+
+
+def test_client_error_is_not_retried_or_counted_as_an_outage(gemini):
+    gemini.script = [(400, {})] * 3
+    client = _client(gemini.url)
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.post_json({})
+    assert gemini.requests == 3
+    assert client.breaker.state == "closed"
+
+
+def test_breaker_opens_fails_fast_and_closes_after_a_good_trial(gemini):
+    gemini.script = [(503, {})] * 2
+    client = _client(gemini.url, max_retries=0)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.post_json({})
+    assert client.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        client.post_json({})
+    assert gemini.requests == 2
+
+    time.sleep(0.25)
+    assert client.post_json({}) == OK_BODY
+    assert client.breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_breaker(gemini):
+    gemini.script = [(503, {})] * 3
+    client = _client(gemini.url, max_retries=0)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.post_json({})
+    time.sleep(0.25)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.post_json({})
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.post_json({})
+    assert gemini.requests == 3
+
+
+def test_rate_limit_timeout_leaves_the_breaker_closed(gemini):
+    limiter = TokenBucket(rate=0.01, burst=1)
+    limiter.acquire()
+    client = _client(gemini.url, limiter=limiter, breaker=CircuitBreaker(threshold=1))
+    with pytest.raises(RateLimitTimeout):
+        client.post_json({}, timeout=0.05)
+    assert client.breaker.state == "closed"
+    assert gemini.requests == 0
@@ -0,0 +1,18 @@
+from prescreen import ClauseScreen, prescreen
+
+
+def test_type_phrase_does_not_hide_clause():
+    screen = prescreen("NON-DISCLOSURE AGREEMENT. This Confidentiality Agreement is made between the parties. "
+                       "Either party may terminate.")
+    assert screen["document_type"] == "NDA"
+    found = {f["item"] for f in screen["found"]}
+    assert {"Confidentiality", "Termination"} <= found
+    assert "Confidentiality" not in {m["item"] for m in screen["missing_items"]}
+
+
+def test_clause_and_type_counted_from_the_same_text():
+    screen = ClauseScreen(clauses={"Confidentiality": {"patterns": [r"confidential(?:ity)?\b"], "reason": "none"}},
+                          document_types={"NDA": [r"confidentiality\s+agreement"]}).scan("Confidentiality Agreement")
+    assert screen["document_type"] == "NDA"
+    assert [f["item"] for f in screen["found"]] == ["Confidentiality"]
+    assert screen["missing_items"] == []
@@ -0,0 +1,198 @@
+import io
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+
+from extractors import register
+
+# -----------------------
+# Plain text
+# -----------------------
+def decode_text(data: bytes) -> str:
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16")
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")
+
+def extract_txt(data: bytes) -> str:
+    return decode_text(data).replace("\r\n", "\n").replace("\r", "\n")
+
+# -----------------------
+# HTML: visible text, one line per block element
+# -----------------------
+_BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "table", "section", "article",
+               "header", "footer", "blockquote", "pre", "dt", "dd", "ul", "ol", "hr"}
+_SKIP_TAGS = {"script", "style", "head", "noscript", "template", "svg"}
+
+class _HTMLText(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+        elif tag in ("td", "th"):
+            self.parts.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(_WHITESPACE_RE.sub(" ", data))
+
+_SPACES_RE = re.compile(r"[ \t\r\f\v]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def extract_html(data: bytes) -> str:
+    parser = _HTMLText()
+    parser.feed(decode_text(data))
+    parser.close()
+    lines = (_SPACES_RE.sub(" ", line).strip(" |") for line in "".join(parser.parts).split("\n"))
+    return "\n".join(line.strip() for line in lines if line.strip())
+
+# -----------------------
+# RTF: control words and destinations stripped, \'hh and \uN decoded
+# -----------------------
+_RTF_TOKEN_RE = re.compile(r"\\([a-z]{1,32})(-?\d{1,10})? ?|\\'([0-9a-f]{2})|\\([^a-z])|([{}])|[\r\n]+|([^\\{}\r\n]+)", re.I)
+_RTF_SKIP_DESTINATIONS = {"fonttbl", "colortbl", "stylesheet", "info", "pict", "header", "footer", "headerl", "headerr",
+                          "footerl", "footerr", "object", "datastore", "themedata", "latentstyles", "listtable",
+                          "listoverridetable", "rsidtbl", "generator", "xmlnstbl", "mmathPr", "filetbl", "revtbl"}
+_RTF_CHARS = {"par": "\n", "line": "\n", "sect": "\n", "page": "\n", "row": "\n", "tab": "\t", "cell": " | ",
+              "emdash": "\u2014", "endash": "\u2013", "lquote": "\u2018", "rquote": "\u2019",
+              "ldblquote": "\u201c", "rdblquote": "\u201d", "bullet": "\u2022"}
+
+def extract_rtf(data: bytes) -> str:
+    text = data.decode("latin-1")
+    out = []
+    stack = []                 # (skipping, uc) saved at each "{"
+    skipping, uc, pending_skip = False, 1, 0
+    ansi = bytearray()         # consecutive \'hh bytes, decoded together (multi-byte code pages)
+    codepage = "cp1252"
+
+    def flush():
+        if ansi:
+            try:
+                out.append(ansi.decode(codepage, errors="replace"))
+            except LookupError:
+                out.append(ansi.decode("cp1252", errors="replace"))
+            ansi.clear()
+
+    for m in _RTF_TOKEN_RE.finditer(text):
+        word, arg, hexbyte, symbol, brace, literal = m.groups()
+        if hexbyte is None:
+            flush()
+        if pending_skip and (hexbyte or literal):
+            # characters after \uN stand in for it in readers without Unicode support
+            if hexbyte:
+                pending_skip -= 1
+                continue
+            cut = min(pending_skip, len(literal))
+            literal, pending_skip = literal[cut:], pending_skip - cut
+            if not literal:
+                continue
+        if brace == "{":
+            stack.append((skipping, uc))
+        elif brace == "}":
+            skipping, uc = stack.pop() if stack else (False, 1)
+        elif symbol == "*":
+            skipping = True
+        elif skipping:
+            continue
+        elif word:
+            if word in _RTF_SKIP_DESTINATIONS:
+                skipping = True
+            elif word == "ansicpg" and arg:
+                codepage = f"cp{arg}"
+            elif word == "uc":
+                uc = int(arg or 1)
+            elif word == "u":
+                out.append(chr(int(arg) % 65536))
+                pending_skip = uc
+            elif word in _RTF_CHARS:
+                out.append(_RTF_CHARS[word])
+        elif hexbyte:
+            ansi.append(int(hexbyte, 16))
+        elif symbol:
+            out.append({"~": "\u00a0", "_": "\u2011", "\n": "\n", "\r": "\n"}.get(symbol, symbol if symbol in "\\{}" else ""))
+        elif literal:
+            out.append(literal)
+    flush()
+    # \uN pairs for characters outside the BMP arrive as surrogate halves
+    joined = "".join(out).encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+    lines = (_SPACES_RE.sub(" ", line).strip().rstrip(" |") for line in joined.split("\n"))
+    return "\n".join(lines).strip()
+
+# -----------------------
+# ODT: content.xml, paragraphs/headings and table rows in document order
+# -----------------------
+TEXT = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+TABLE = "{urn:oasis:names:tc:opendocument:xmlns:table:1.0}"
+_ODT_BLOCKS = {TEXT + "p", TEXT + "h"}
+
+def _odt_inline(elem, parts):
+    # text:p content: text, spans, links, tabs, line breaks, runs of spaces (text:s c="n")
+    if elem.text:
+        parts.append(elem.text)
+    for child in elem:
+        tag = child.tag
+        if tag == TEXT + "tab":
+            parts.append("\t")
+        elif tag == TEXT + "line-break":
+            parts.append("\n")
+        elif tag == TEXT + "s":
+            parts.append(" " * int(child.get(TEXT + "c", 1)))
+        elif tag not in (TEXT + "note", TEXT + "tracked-changes"):
+            _odt_inline(child, parts)
+        if child.tail:
+            parts.append(child.tail)
+
+def extract_odt(data: bytes) -> str:
+    out, rows, cells = [], [], []
+    with zipfile.ZipFile(io.BytesIO(data)) as zf, zf.open("content.xml") as f:
+        depth = 0
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag in _ODT_BLOCKS:
+                    depth += 1
+                elif tag == TABLE + "table-row":
+                    rows.append([])
+                elif tag == TABLE + "table-cell":
+                    cells.append([])
+                continue
+            if tag in _ODT_BLOCKS:
+                depth -= 1
+                if depth:
+                    continue   # nested block (e.g. inside a frame); the outer one includes it
+                parts = []
+                _odt_inline(elem, parts)
+                para = "".join(parts)
+                if cells:
+                    if para:
+                        cells[-1].append(para)
+                else:
+                    out.append(para)
+                elem.clear()
+            elif tag == TABLE + "table-cell" and cells and rows:
+                rows[-1].append(" ".join(cells.pop()))
+            elif tag == TABLE + "table-row" and rows:
+                line = " | ".join(rows.pop()).rstrip(" |")
+                if line:
+                    (cells[-1] if cells else out).append(line)
+    return "\n".join(out)
+
+register("txt", "text", extract_txt)
+register("html", "htmlparser", extract_html)
+register("rtf", "rtf", extract_rtf)
+register("odt", "odt-stream", extract_odt)
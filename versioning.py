@@ -0,0 +1,156 @@
+import os
+import json
+import difflib
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis import (ANALYSIS_CHUNK_TOKENS, ANALYSIS_MAX_IN_FLIGHT, CHARS_PER_TOKEN, analyze_text,
+                      norm_key, split_segments)
+from llm_client import API_CONFIGURED, RESPONSE_SCHEMA, build_payload, call_model, failed_analysis
+
+# -----------------------
+# Config
+# -----------------------
+# above this share of changed clauses a revision is cheaper to analyze from scratch
+VERSION_FULL_REANALYSIS_RATIO = float(os.environ.get("VERSION_FULL_REANALYSIS_RATIO", 0.6))
+VERSION_CONTEXT_CLAUSES = int(os.environ.get("VERSION_CONTEXT_CLAUSES", 1))   # unchanged neighbours sent with each change
+
+# the model answers with what the change adds and what it resolves, relative to the previous analysis
+DELTA_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": dict(
+        RESPONSE_SCHEMA["properties"],
+        resolved_missing_items={"type": "ARRAY", "items": {"type": "STRING"}},
+        resolved_risks={"type": "ARRAY", "items": {"type": "STRING"}},
+    )
+}
+
+# -----------------------
+# Clause-level diff
+# -----------------------
+def _clause_key(clause):
+    # whitespace and case changes are not redlines
+    return hashlib.sha1(" ".join(clause.lower().split()).encode("utf-8")).hexdigest()
+
+def diff_clauses(old_text, new_text):
+    # returns {"changed": [(index, clause, context)], "removed": [clause], "total": n, "unchanged": n}
+    old = split_segments(old_text or "")
+    new = split_segments(new_text or "")
+    matcher = difflib.SequenceMatcher(None, [_clause_key(c) for c in old], [_clause_key(c) for c in new], autojunk=False)
+    changed, removed, unchanged = [], [], 0
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            unchanged += i2 - i1
+            continue
+        removed.extend(old[i1:i2])
+        for j in range(j1, j2):
+            before = new[max(0, j1 - VERSION_CONTEXT_CLAUSES):j1]
+            after = new[j2:j2 + VERSION_CONTEXT_CLAUSES]
+            changed.append((j, new[j], before + after))
+    return {"changed": changed, "removed": removed, "total": len(new), "unchanged": unchanged}
+
+# -----------------------
+# Analyze only the changed clauses
+# -----------------------
+def _delta_prompt(previous, changed, removed):
+    lines = [
+        "A contract was revised. Below are the previous analysis, the clauses that were removed, and the clauses that "
+        "were added or reworded (each with neighbouring unchanged text for context). Analyze only the changes. In "
+        "missing_items and risks list only NEW issues introduced by the changes. In resolved_missing_items and "
+        "resolved_risks copy, verbatim, any previous missing item or risk that the changes address or remove. "
+        "Summarize what the revision changes in analysis_summary. Return JSON with keys: document_type, "
+        "analysis_summary, missing_items (array of {item, reason}), risks (array of strings), "
+        "resolved_missing_items (array of strings), resolved_risks (array of strings).",
+        "",
+        "Previous analysis:",
+        json.dumps({k: previous.get(k) for k in ("document_type", "missing_items", "risks")}, ensure_ascii=False),
+    ]
+    if removed:
+        lines += ["", "Removed clauses:"] + [f"- {c}" for c in removed]
+    lines += ["", "Added or changed clauses:"]
+    for index, clause, context in changed:
+        lines.append(f"[clause {index + 1}] {clause}")
+        if context:
+            lines.append("  context: " + " | ".join(context))
+    return "\n".join(lines)
+
+def _batches(changed, removed):
+    # group changes under the chunk token budget; removed clauses go with the first batch
+    budget = ANALYSIS_CHUNK_TOKENS * CHARS_PER_TOKEN
+    batches, current, size = [], [], sum(len(c) for c in removed)
+    for item in changed:
+        cost = len(item[1]) + sum(len(c) for c in item[2])
+        if current and size + cost > budget:
+            batches.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += cost
+    if current or removed:
+        batches.append(current)
+    return batches
+
+def merge_revision(previous, deltas):
+    # previous analysis minus what the changes resolved, plus what they introduced
+    good = [d for d, ok in deltas if ok and isinstance(d, dict)]
+    resolved_missing = {norm_key(x) for d in good for x in d.get("resolved_missing_items") or []}
+    resolved_risks = {norm_key(x) for d in good for x in d.get("resolved_risks") or []}
+
+    missing_items, seen = [], set()
+    kept = [it for it in previous.get("missing_items") or []
+            if norm_key(it.get("item") if isinstance(it, dict) else it) not in resolved_missing]
+    for it in kept + [it for d in good for it in d.get("missing_items") or []]:
+        if not isinstance(it, dict):
+            it = {"item": str(it), "reason": ""}
+        key = norm_key(it.get("item"))
+        if key and key not in seen:
+            seen.add(key)
+            missing_items.append({"item": it.get("item", ""), "reason": it.get("reason", "")})
+
+    risks, seen = [], set()
+    kept = [r for r in previous.get("risks") or [] if norm_key(r) not in resolved_risks]
+    for r in kept + [r for d in good for r in d.get("risks") or []]:
+        key = norm_key(r)
+        if key and key not in seen:
+            seen.add(key)
+            risks.append(r)
+
+    changes = " ".join((d.get("analysis_summary") or "").strip() for d in good).strip()
+    # keep the base summary and only the latest revision note, so it does not grow per version
+    summary = (previous.get("analysis_summary") or "").split(" Revision: ")[0]
+    if changes:
+        summary = f"{summary} Revision: {changes}".strip()
+    if len(good) < len(deltas):
+        summary += f" (Partial analysis: {len(deltas) - len(good)} of {len(deltas)} change sets could not be analyzed.)"
+    merged = {"document_type": previous.get("document_type") or "Unknown", "analysis_summary": summary,
+              "missing_items": missing_items, "risks": risks}
+    return merged, len(good) == len(deltas)
+
+def analyze_revision(previous_analysis, old_text, new_text):
+    # returns (analysis, ok, diff_stats); falls back to a full analysis when most clauses changed
+    diff = diff_clauses(old_text, new_text)
+    changed, removed = diff["changed"], diff["removed"]
+    stats = {"clauses": diff["total"], "changed": len(changed), "removed": len(removed),
+             "analyzed_chars": sum(len(c[1]) for c in changed), "mode": "incremental"}
+
+    if not changed and not removed:
+        stats["mode"] = "unchanged"
+        return previous_analysis, True, stats
+    if not API_CONFIGURED:
+        return failed_analysis("Skipping AI analysis because GOOGLE_API_KEY is not set in environment."), False, stats
+    if diff["total"] and len(changed) / diff["total"] > VERSION_FULL_REANALYSIS_RATIO:
+        stats["mode"] = "full"
+        stats["analyzed_chars"] = len(new_text)
+        analysis, ok = analyze_text(new_text)
+        return analysis, ok, stats
+
+    batches = _batches(changed, removed)
+    workers = min(max(1, ANALYSIS_MAX_IN_FLIGHT), len(batches))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="revision") as pool:
+        deltas = list(pool.map(
+            lambda ib: call_model(build_payload(_delta_prompt(previous_analysis, ib[1], removed if ib[0] == 0 else []),
+                                                DELTA_RESPONSE_SCHEMA)),
+            enumerate(batches)
+        ))
+    stats["model_calls"] = len(batches)
+    analysis, ok = merge_revision(previous_analysis, deltas)
+    return analysis, ok, stats